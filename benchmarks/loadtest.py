@@ -0,0 +1,300 @@
+"""Load-test harness for the bot.
+
+Drives the real Application from src/main.py with synthetic update bursts
+(for example 1,000 users sending /addtarget, then /done, then /today). A
+local fake Bot API server answers the bot's outgoing calls. MongoDB is
+either a real server (``--mongo-uri``) or an in-memory stand-in
+(``--in-memory``, which needs ``mongomock-motor``; it lacks some
+aggregation operators, so stats rollup errors are expected in that mode).
+
+Reports p50/p95/p99 handler latency, updates/sec and DB calls per update,
+and writes the results as JSON so runs can be compared between commits.
+
+Usage:
+    python -m benchmarks.loadtest --users 1000 --in-memory
+    python -m benchmarks.loadtest --users 1000 --mongo-uri mongodb://localhost:27017/
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import statistics
+import subprocess
+import sys
+import time
+from collections import Counter
+from datetime import datetime
+
+from aiohttp import web
+from pymongo import monitoring
+
+TOKEN = "123456:LOADTEST"
+BOT_USER = {"id": 123456, "is_bot": True, "first_name": "LoadTest", "username": "loadtest_bot"}
+ADMIN_USER = {"id": 1, "is_bot": False, "first_name": "Admin", "username": "admin"}
+
+# Keep the bot's own throttling out of the measurement
+BENCH_ENV = {
+    "BOT_TOKEN": TOKEN,
+    "SCHEDULER_ENABLED": "false",
+    "CHANGE_STREAMS": "false",
+    # Phases measure steady state, so connect before seeding
+    "STARTUP_MODE": "eager",
+    "INDEX_SELF_CHECK": "false",
+    "CHAT_SEND_RATE_PER_MIN": "1000000",
+    "CHAT_SEND_BURST": "1000000",
+    "GLOBAL_SEND_RATE_PER_SEC": "1000000",
+    "USER_COMMAND_RATE_PER_MIN": "1000000",
+    "USER_COMMAND_BURST": "1000000",
+}
+
+COMMANDS = {
+    "addtarget": "/addtarget read 20 pages",
+    "done": "/done",
+    "today": "/today",
+    "mytargets": "/mytargets",
+}
+
+
+class FakeBotAPI:
+    """Minimal Bot API server: answers every method with a plausible result."""
+
+    def __init__(self):
+        self.calls = Counter()
+        self._message_id = 0
+        self._runner = None
+        self.port = None
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        self.calls[method] += 1
+        params = dict(await request.post()) if request.can_read_body else {}
+        return web.json_response({"ok": True, "result": self.result_for(method, params)})
+
+    def result_for(self, method: str, params: dict):
+        if method == "getMe":
+            return BOT_USER
+        if method in ("sendMessage", "editMessageText"):
+            self._message_id += 1
+            return {
+                "message_id": self._message_id,
+                "date": int(time.time()),
+                "chat": {"id": int(params.get("chat_id", 0)), "type": "supergroup"},
+                "from": BOT_USER,
+                "text": params.get("text", ""),
+            }
+        if method == "getChatAdministrators":
+            return [{"status": "creator", "user": ADMIN_USER, "is_anonymous": False}]
+        return True
+
+    async def start(self) -> str:
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self.handle)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+        return f"http://127.0.0.1:{self.port}/bot"
+
+    async def stop(self):
+        await self._runner.cleanup()
+
+
+class CommandCounter(monitoring.CommandListener):
+    """pymongo CommandListener counting commands sent to a real server."""
+
+    def __init__(self):
+        self.count = 0
+
+    def started(self, event):
+        self.count += 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+def count_in_memory_calls(counter: CommandCounter):
+    """Count operations on mongomock-motor collections (one per round trip)."""
+    from mongomock_motor import AsyncMongoMockCollection
+    
+    operations = (
+        "find", "find_one", "insert_one", "insert_many", "update_one", "update_many",
+        "delete_one", "delete_many", "bulk_write", "aggregate", "count_documents", "distinct",
+    )
+    for name in operations:
+        original = getattr(AsyncMongoMockCollection, name, None)
+        if original is None:
+            continue
+        
+        def counted(self, *args, _original=original, **kwargs):
+            counter.count += 1
+            return _original(self, *args, **kwargs)
+        
+        setattr(AsyncMongoMockCollection, name, counted)
+
+
+def make_update(update_id: int, chat_id: int, user_id: int, text: str) -> dict:
+    command = text.split()[0]
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "supergroup", "title": f"Group {chat_id}"},
+            "from": {"id": user_id, "is_bot": False, "first_name": f"User{user_id}", "username": f"user{user_id}"},
+            "text": text,
+            "entities": [{"type": "bot_command", "offset": 0, "length": len(command)}],
+        },
+    }
+
+
+def percentiles(samples):
+    if len(samples) < 2:
+        value = samples[0] if samples else 0.0
+        return {"p50": value, "p95": value, "p99": value}
+    cuts = statistics.quantiles(samples, n=100)
+    return {"p50": cuts[49], "p95": cuts[94], "p99": cuts[98]}
+
+
+async def run_phase(application, command: str, args, counter: CommandCounter, next_update_id: int) -> dict:
+    from telegram import Update
+    
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies = []
+    
+    async def one(index: int):
+        user_id = 1000 + index
+        chat_id = -1000000 - (index % args.groups)
+        update = Update.de_json(
+            make_update(next_update_id + index, chat_id, user_id, COMMANDS[command]), application.bot
+        )
+        async with semaphore:
+            started = time.perf_counter()
+            await application.update_processor.process_update(update, application.process_update(update))
+            latencies.append((time.perf_counter() - started) * 1000)
+    
+    db_calls_before = counter.count
+    started = time.perf_counter()
+    await asyncio.gather(*(one(index) for index in range(args.users)))
+    elapsed = time.perf_counter() - started
+    
+    return {
+        "command": command,
+        "updates": args.users,
+        "seconds": round(elapsed, 4),
+        "updates_per_sec": round(args.users / elapsed, 1),
+        "latency_ms": {key: round(value, 3) for key, value in percentiles(latencies).items()},
+        "db_calls_per_update": round((counter.count - db_calls_before) / args.users, 3),
+    }
+
+
+async def run(args) -> dict:
+    os.environ.update(BENCH_ENV)
+    if args.mongo_uri:
+        os.environ["MONGODB_URI"] = args.mongo_uri
+    else:
+        # mongomock cannot create collections with storage options
+        os.environ["ARCHIVE_COMPRESSOR"] = ""
+    os.environ["DB_NAME"] = args.db_name
+    
+    # Imported late so the bot's modules read the benchmark environment
+    from src.database import db
+    from src.main import build_application
+    
+    # Per-request access logs would dominate the run
+    for name in ("httpx", "aiohttp.access", "telegram.ext.Application"):
+        logging.getLogger(name).setLevel(logging.WARNING)
+    
+    counter = CommandCounter()
+    if args.in_memory:
+        from mongomock_motor import AsyncMongoMockClient
+        count_in_memory_calls(counter)
+        db.client = AsyncMongoMockClient()
+    else:
+        db.pool_options["event_listeners"].append(counter)
+    
+    api = FakeBotAPI()
+    application = build_application(TOKEN, base_url=await api.start())
+    
+    await application.initialize()
+    await application.post_init(application)
+    await application.start()
+    
+    try:
+        if not args.in_memory:
+            await db.client.drop_database(args.db_name)
+            await db.connect()
+        for index in range(args.groups):
+            await db.set_allowed_group(-1000000 - index, f"Group {index}")
+        
+        phases = []
+        update_id = 1
+        for command in args.phases:
+            phases.append(await run_phase(application, command, args, counter, update_id))
+            update_id += args.users
+            print(json.dumps(phases[-1]))
+    finally:
+        await application.stop()
+        await application.post_stop(application)
+        await application.shutdown()
+        await application.post_shutdown(application)
+        await api.stop()
+    
+    total_updates = sum(phase["updates"] for phase in phases)
+    total_seconds = sum(phase["seconds"] for phase in phases)
+    return {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "config": {
+            "users": args.users,
+            "groups": args.groups,
+            "concurrency": args.concurrency,
+            "backend": "in-memory" if args.in_memory else "mongod",
+        },
+        "phases": phases,
+        "total": {
+            "updates": total_updates,
+            "updates_per_sec": round(total_updates / total_seconds, 1) if total_seconds else 0,
+        },
+        "api_calls": dict(api.calls),
+    }
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--groups", type=int, default=1)
+    parser.add_argument("--concurrency", type=int, default=100, help="updates in flight at once")
+    parser.add_argument("--phases", nargs="+", default=["addtarget", "done", "today"], choices=COMMANDS)
+    backend = parser.add_mutually_exclusive_group(required=True)
+    backend.add_argument("--mongo-uri", help="run against a real (disposable) MongoDB server")
+    backend.add_argument("--in-memory", action="store_true", help="use mongomock-motor instead of MongoDB")
+    parser.add_argument("--db-name", default="target_bot_loadtest")
+    parser.add_argument("--output", help="results file (default: benchmarks/results/<timestamp>-<commit>.json)")
+    args = parser.parse_args()
+    
+    results = asyncio.run(run(args))
+    
+    output = args.output
+    if not output:
+        os.makedirs(os.path.join("benchmarks", "results"), exist_ok=True)
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+        output = os.path.join("benchmarks", "results", f"{stamp}-{results['commit']}.json")
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"📊 Results written to {output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+import asyncio
+import logging
+import os
+from typing import Dict, List
+
+from pymongo import UpdateOne
+
+from src.clock import DEFAULT_TIMEZONE, clock, shift_day_key
+from src.stats import ROLLUP_DAYS
+
+logger = logging.getLogger(__name__)
+
+# Targets older than this many days move to the archive. Stats rollups only
+# look back ROLLUP_DAYS, so archived days never need to feed them.
+ARCHIVE_AFTER_DAYS = max(int(os.getenv("ARCHIVE_AFTER_DAYS", "180")), ROLLUP_DAYS + 1)
+# Targets moved per batch, and batches per run, so one run stays short
+ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", "500"))
+ARCHIVE_MAX_BATCHES = int(os.getenv("ARCHIVE_MAX_BATCHES", "20"))
+
+ARCHIVE_COLLECTION = "targets_archive"
+# Cold data is rarely read, so it is stored with a stronger block
+# compressor than the default snappy; empty keeps the server default
+ARCHIVE_COMPRESSOR = os.getenv("ARCHIVE_COMPRESSOR", "zstd")
+ARCHIVE_COLLECTION_OPTIONS = {
+    "storageEngine": {"wiredTiger": {"configString": f"block_compressor={ARCHIVE_COMPRESSOR}"}},
+} if ARCHIVE_COMPRESSOR else {}
+
+# Target fields kept in an archive entry
+_ENTRY_FIELDS = ("target", "completed", "created_at", "completed_at")
+
+def archive_cutoff(today: int = None) -> int:
+    """Day key before which targets are archived; every archived day is older."""
+    if today is None:
+        today = clock.today(DEFAULT_TIMEZONE)
+    return shift_day_key(today, -ARCHIVE_AFTER_DAYS)
+
+def month_of(day_key: int) -> int:
+    """The YYYYMM month of a YYYYMMDD day key."""
+    return day_key // 100
+
+async def archive_batch(db, group_id: int, cutoff: int, batch_size: int = ARCHIVE_BATCH_SIZE) -> int:
+    """Move up to ``batch_size`` of a group's targets before ``cutoff`` to the archive.
+    
+    Each (group, user, month) gets one bucket document holding an
+    ``entries`` map keyed by day key. Entries are written with ``$set``,
+    so a batch interrupted between the upsert and the delete is simply
+    archived again on the next run. Returns the number of targets moved.
+    """
+    docs = await db.targets.find(
+        {"group_id": group_id, "day_key": {"$lt": cutoff}}
+    ).sort("day_key", 1).limit(batch_size).to_list(length=batch_size)
+    if not docs:
+        return 0
+    
+    operations = []
+    for doc in docs:
+        entry = {field: doc[field] for field in _ENTRY_FIELDS if doc.get(field) is not None}
+        operations.append(UpdateOne(
+            {"group_id": group_id, "user_id": doc["user_id"], "month": month_of(doc["day_key"])},
+            {"$set": {f"entries.{doc['day_key']}": entry, "username": doc.get("username")}},
+            upsert=True
+        ))
+    await db[ARCHIVE_COLLECTION].bulk_write(operations, ordered=False)
+    await db.targets.delete_many({"_id": {"$in": [doc["_id"] for doc in docs]}})
+    return len(docs)
+
+async def run_archival(db, today: int = None, max_batches: int = ARCHIVE_MAX_BATCHES) -> int:
+    """Archive old targets group by group, at most ``max_batches`` batches per run.
+    
+    Whatever is left over is picked up by the next run. Returns the number
+    of targets moved.
+    """
+    cutoff = archive_cutoff(today)
+    
+    moved = 0
+    batches = 0
+    group_ids = await db.group_settings.distinct("group_id")
+    for group_id in group_ids:
+        while batches < max_batches:
+            count = await archive_batch(db, group_id, cutoff)
+            if not count:
+                # Groups with nothing to archive do not use up the budget,
+                # or groups late in the list would never get a turn
+                break
+            batches += 1
+            moved += count
+            if count < ARCHIVE_BATCH_SIZE:
+                break
+            # Let handlers run between batches
+            await asyncio.sleep(0)
+    if moved:
+        logger.info("Archived %d targets older than %d", moved, cutoff)
+    return moved
+
+async def archived_targets(db, group_id: int, user_id: int, limit: int,
+                           before: int = None, after: int = None) -> List[Dict]:
+    """Archived targets of a user, newest first (oldest first with ``after``).
+    
+    Entries are returned in the same shape as documents of ``targets``.
+    """
+    query = {"group_id": group_id, "user_id": user_id}
+    newest_first = True
+    if before is not None:
+        query["month"] = {"$lte": month_of(before)}
+    elif after is not None:
+        query["month"] = {"$gte": month_of(after)}
+        newest_first = False
+    
+    # Only the boundary month can contribute no entries
+    buckets = await db[ARCHIVE_COLLECTION].find(query).sort(
+        "month", -1 if newest_first else 1
+    ).limit(limit + 1).to_list(length=limit + 1)
+    
+    results = []
+    for bucket in buckets:
+        for key in sorted(bucket.get("entries", {}), key=int, reverse=newest_first):
+            day_key = int(key)
+            if before is not None and day_key >= before:
+                continue
+            if after is not None and day_key <= after:
+                continue
+            results.append({
+                **bucket["entries"][key],
+                "group_id": group_id,
+                "user_id": user_id,
+                "username": bucket.get("username"),
+                "day_key": day_key,
+            })
+            if len(results) >= limit:
+                return results
+    return results
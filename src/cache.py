@@ -0,0 +1,284 @@
+import asyncio
+import os
+import time
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+class GroupAuthCache:
+    """In-memory set of allowed group ids mirrored from ``group_settings``.
+
+    The set is loaded once at startup, patched in place on local writes and
+    reloaded after ``ttl`` seconds so writes from other replicas show up
+    (sooner when src/changes.py pushes them from a change stream).
+    Each group's timezone is kept alongside so day bucketing needs no query.
+    Groups listed in ``ALLOWED_GROUP_ID`` (comma-separated) are always allowed.
+    """
+
+    def __init__(self, ttl: float = None, configured: Iterable[int] = None):
+        if ttl is None:
+            ttl = float(os.getenv("GROUP_CACHE_TTL", "300"))
+        if configured is None:
+            configured = [int(value) for value in os.getenv("ALLOWED_GROUP_ID", "").split(",") if value.strip()]
+        self.ttl = ttl
+        self.configured = frozenset(configured)
+        self.allowed = set()
+        self.timezones: Dict[int, str] = {}
+        self.loaded_at: Optional[float] = None
+        self.hits = 0
+        self.misses = 0
+
+    def is_fresh(self) -> bool:
+        return self.loaded_at is not None and time.monotonic() - self.loaded_at < self.ttl
+
+    def load(self, group_ids: Iterable[int], timezones: Dict[int, str] = None):
+        """Replace the cached set with a full snapshot."""
+        self.allowed = set(group_ids)
+        self.timezones = dict(timezones or {})
+        self.loaded_at = time.monotonic()
+
+    def check(self, group_id: int) -> Optional[bool]:
+        """Return the cached decision, or None if the cache must be reloaded."""
+        if not self.is_fresh():
+            self.misses += 1
+            return None
+        self.hits += 1
+        return self.contains(group_id)
+
+    def contains(self, group_id: int) -> bool:
+        if group_id in self.allowed or group_id in self.configured:
+            return True
+        # Until a group is configured or registered, allow the first one
+        # to send /start (initial setup); later groups need the owner
+        return not self.allowed and not self.configured
+
+    def add(self, group_id: int):
+        self.allowed.add(group_id)
+
+    def remove(self, group_id: int):
+        self.allowed.discard(group_id)
+        self.timezones.pop(group_id, None)
+
+    def clear(self):
+        self.allowed.clear()
+        self.timezones.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "size": len(self.allowed)}
+
+
+class AdminCache:
+    """Per-chat cache of administrator user ids with single-flight loading.
+
+    Concurrent lookups for the same chat share one ``getChatAdministrators``
+    request. Entries expire after ``ttl`` seconds or when invalidated from a
+    ``ChatMemberUpdated`` event.
+    """
+
+    def __init__(self, ttl: float = None):
+        if ttl is None:
+            ttl = float(os.getenv("ADMIN_CACHE_TTL", "600"))
+        self.ttl = ttl
+        self._entries: Dict[int, Tuple[float, FrozenSet[int]]] = {}
+        self._inflight: Dict[int, asyncio.Future] = {}
+        self._generation: Dict[int, int] = {}
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, chat_id: int, fetch: Callable[[], Awaitable[Iterable[int]]]) -> FrozenSet[int]:
+        """Return the admin ids for a chat, calling ``fetch`` on a miss."""
+        entry = self._entries.get(chat_id)
+        if entry is not None and time.monotonic() < entry[0]:
+            self.hits += 1
+            return entry[1]
+        
+        self.misses += 1
+        future = self._inflight.get(chat_id)
+        if future is None:
+            # Taken now, not when the task starts, so no invalidation slips past
+            generation = self._generation.get(chat_id, 0)
+            future = asyncio.ensure_future(self._load(chat_id, fetch, generation))
+            self._inflight[chat_id] = future
+        # Shield so one cancelled caller does not cancel the shared request
+        return await asyncio.shield(future)
+
+    async def _load(self, chat_id: int, fetch, generation: int) -> FrozenSet[int]:
+        try:
+            admin_ids = frozenset(await fetch())
+            # Skip storing if the chat was invalidated while we were fetching
+            if self._generation.get(chat_id, 0) == generation:
+                self._entries[chat_id] = (time.monotonic() + self.ttl, admin_ids)
+            return admin_ids
+        finally:
+            self._inflight.pop(chat_id, None)
+
+    def invalidate(self, chat_id: int):
+        self._entries.pop(chat_id, None)
+        self._generation[chat_id] = self._generation.get(chat_id, 0) + 1
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._entries)}
+
+
+class DailySnapshot:
+    """One group's targets for one day, with running counts and cached text."""
+
+    def __init__(self, targets: Iterable[Dict]):
+        self.targets: Dict[int, Dict] = {target["user_id"]: target for target in targets}
+        self.completed = sum(1 for target in self.targets.values() if target.get("completed"))
+        # Document _id -> user_id, to apply deletes from change streams
+        self._users_by_id = {target["_id"]: user_id for user_id, target in self.targets.items() if "_id" in target}
+        self._text: Optional[str] = None
+
+    @property
+    def total(self) -> int:
+        return len(self.targets)
+
+    @property
+    def pending(self) -> int:
+        return self.total - self.completed
+
+    def upsert(self, fields: Dict):
+        """Apply the ``$set`` of an add_target upsert."""
+        old = self.targets.get(fields["user_id"], {})
+        if old.get("completed"):
+            self.completed -= 1
+        self.targets[fields["user_id"]] = {**old, **fields}
+        if fields.get("completed"):
+            self.completed += 1
+        if "_id" in fields:
+            self._users_by_id[fields["_id"]] = fields["user_id"]
+        self._text = None
+
+    def remove(self, target_id) -> bool:
+        """Drop the target with this document ``_id``; False if not held."""
+        user_id = self._users_by_id.pop(target_id, None)
+        if user_id is None:
+            return False
+        target = self.targets.pop(user_id, None)
+        if target is not None and target.get("completed"):
+            self.completed -= 1
+        self._text = None
+        return True
+
+    def mark_completed(self, user_id: int, completed_at: datetime) -> bool:
+        target = self.targets.get(user_id)
+        if target is None:
+            return False
+        if not target.get("completed"):
+            self.completed += 1
+        target["completed"] = True
+        target["completed_at"] = completed_at
+        self._text = None
+        return True
+
+    def render(self, renderer: Callable[[List[Dict]], str]) -> str:
+        """Return the rendered message, re-rendering only after a change."""
+        if self._text is None:
+            self._text = renderer(list(self.targets.values()))
+        return self._text
+
+
+class SnapshotCache:
+    """Per-group, per-day ``DailySnapshot`` store keyed by (group_id, day_key).
+
+    Snapshots are patched by local writes, and by other replicas' writes via
+    src/changes.py, and expire after ``ttl`` seconds so writes are picked up
+    even without change streams. Concurrent misses share one load, and
+    patches made while it is in flight are replayed onto its result, since
+    the query may have read before those writes landed.
+    """
+
+    def __init__(self, ttl: float = None):
+        if ttl is None:
+            ttl = float(os.getenv("SNAPSHOT_CACHE_TTL", "300"))
+        self.ttl = ttl
+        self._snapshots: Dict[Tuple[int, int], Tuple[float, DailySnapshot]] = {}
+        self._inflight: Dict[Tuple[int, int], asyncio.Future] = {}
+        # Patches made during each in-flight load, replayed once it finishes
+        self._replay: Dict[Tuple[int, int], List[Callable[[DailySnapshot], object]]] = {}
+        self._generation: Dict[int, int] = {}
+        self._epoch = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, group_id: int, day: int) -> Optional[DailySnapshot]:
+        entry = self._snapshots.get((group_id, day))
+        if entry is None or time.monotonic() >= entry[0]:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry[1]
+
+    def _store(self, group_id: int, day: int, snapshot: DailySnapshot):
+        # Drop the group's snapshots of other days (groups roll over at
+        # their own local midnight)
+        for key in [key for key in self._snapshots if key[0] == group_id and key[1] != day]:
+            del self._snapshots[key]
+        self._snapshots[(group_id, day)] = (time.monotonic() + self.ttl, snapshot)
+
+    async def load(self, group_id: int, day: int,
+                   fetch: Callable[[], Awaitable[Iterable[Dict]]]) -> DailySnapshot:
+        """Return the snapshot for a group's day, calling ``fetch`` on a miss."""
+        snapshot = self.get(group_id, day)
+        if snapshot is not None:
+            return snapshot
+        
+        key = (group_id, day)
+        future = self._inflight.get(key)
+        if future is None:
+            # Set up now, not when the task starts, so no patch slips past
+            self._replay[key] = []
+            future = asyncio.ensure_future(self._load(key, fetch, self._generation_of(group_id)))
+            self._inflight[key] = future
+        # Shield so one cancelled caller does not cancel the shared load
+        return await asyncio.shield(future)
+
+    async def _load(self, key: Tuple[int, int], fetch, generation: Tuple[int, int]) -> DailySnapshot:
+        try:
+            snapshot = DailySnapshot(await fetch())
+            for patch in self._replay[key]:
+                patch(snapshot)
+            # Skip storing if the group was invalidated while we were fetching
+            if self._generation_of(key[0]) == generation:
+                self._store(key[0], key[1], snapshot)
+            return snapshot
+        finally:
+            self._inflight.pop(key, None)
+            self._replay.pop(key, None)
+
+    def _generation_of(self, group_id: int) -> Tuple[int, int]:
+        return self._epoch, self._generation.get(group_id, 0)
+
+    def _patch(self, group_id: int, day: int, patch: Callable[[DailySnapshot], object]):
+        entry = self._snapshots.get((group_id, day))
+        if entry is not None:
+            patch(entry[1])
+        replay = self._replay.get((group_id, day))
+        if replay is not None:
+            replay.append(patch)
+
+    def apply_upsert(self, group_id: int, day: int, fields: Dict):
+        self._patch(group_id, day, lambda snapshot: snapshot.upsert(fields))
+
+    def mark_completed(self, group_id: int, user_id: int, day: int, completed_at: datetime):
+        self._patch(group_id, day, lambda snapshot: snapshot.mark_completed(user_id, completed_at))
+
+    def remove_target(self, target_id):
+        """Drop a deleted target, by document ``_id``, from the snapshot holding it."""
+        for replay in self._replay.values():
+            replay.append(lambda snapshot: snapshot.remove(target_id))
+        for _, snapshot in self._snapshots.values():
+            if snapshot.remove(target_id):
+                return
+
+    def invalidate(self, group_id: int = None):
+        if group_id is None:
+            self._snapshots.clear()
+            self._epoch += 1
+            return
+        for key in [key for key in self._snapshots if key[0] == group_id]:
+            del self._snapshots[key]
+        self._generation[group_id] = self._generation.get(group_id, 0) + 1
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._snapshots)}
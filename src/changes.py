@@ -0,0 +1,174 @@
+import asyncio
+import logging
+import os
+import socket
+import time
+from typing import Callable, Dict, Optional
+
+from pymongo.errors import OperationFailure, PyMongoError
+
+from src.database import db
+from src.triggers import triggers
+
+logger = logging.getLogger(__name__)
+
+CHANGE_STREAMS_ENABLED = os.getenv("CHANGE_STREAMS", "true").lower() in ("1", "true", "yes")
+# While change streams keep the caches coherent, their TTLs are stretched to this
+COHERENT_CACHE_TTL = float(os.getenv("COHERENT_CACHE_TTL", "3600"))
+# Resume tokens are stored at most this often (seconds)
+TOKEN_SAVE_INTERVAL = float(os.getenv("CHANGE_TOKEN_SAVE_INTERVAL", "10"))
+# Resume tokens are stored per replica: every replica needs every event
+REPLICA_ID = os.getenv("REPLICA_ID") or socket.gethostname()
+
+TOKENS_COLLECTION = "change_stream_tokens"
+
+# "The $changeStream stage is only supported on replica sets"
+STANDALONE_ERROR = 40573
+# The stored token fell off the oplog
+HISTORY_LOST_ERRORS = (280, 286)
+
+
+class ChangeWatcher:
+    """Keeps the in-process caches coherent across replicas via change streams.
+    
+    Watches ``targets`` and ``group_settings`` and pushes every change into
+    the group cache, today's snapshots and the trigger engine. Resume
+    tokens are stored in ``change_stream_tokens`` so a restarted replica
+    picks up where it left off. On a standalone server (no change streams)
+    the caches keep their normal TTLs, which bound how stale they get.
+    """
+
+    def __init__(self, database):
+        self.database = database
+        self._tasks = []
+        # Collections whose stream is currently open
+        self._open = set()
+        self._ttls: Dict[object, float] = {}
+
+    def start(self):
+        if not CHANGE_STREAMS_ENABLED or self._tasks:
+            return
+        self._tasks = [
+            asyncio.create_task(self._watch("targets", self._on_target)),
+            asyncio.create_task(self._watch("group_settings", self._on_group_settings)),
+        ]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _watch(self, name: str, apply: Callable[[Dict], None]):
+        """Follow one collection's change stream until cancelled."""
+        token_id = f"{REPLICA_ID}:{name}"
+        tokens = self.database.db[TOKENS_COLLECTION]
+        try:
+            saved = await tokens.find_one({"_id": token_id})
+        except PyMongoError:
+            saved = None
+        token = saved["token"] if saved else None
+        delay = 1.0
+        
+        while True:
+            try:
+                async with self.database.db[name].watch(
+                    full_document="updateLookup", resume_after=token
+                ) as stream:
+                    self._set_open(name, True)
+                    delay = 1.0
+                    saved_at = time.monotonic()
+                    async for change in stream:
+                        try:
+                            apply(change)
+                        except Exception:
+                            # Keep watching: the stretched TTLs rely on it.
+                            # The caches may have missed this change
+                            logger.exception("Could not apply a change on %s; resetting caches", name)
+                            self._reset_caches()
+                        token = stream.resume_token
+                        if time.monotonic() - saved_at >= TOKEN_SAVE_INTERVAL:
+                            await tokens.replace_one({"_id": token_id}, {"_id": token_id, "token": token}, upsert=True)
+                            saved_at = time.monotonic()
+                # The stream was invalidated (collection dropped or renamed)
+                token = None
+            except asyncio.CancelledError:
+                if token is not None:
+                    await asyncio.shield(tokens.replace_one(
+                        {"_id": token_id}, {"_id": token_id, "token": token}, upsert=True
+                    ))
+                raise
+            except OperationFailure as e:
+                if e.code == STANDALONE_ERROR:
+                    logger.info("Change streams unavailable on %s; caches fall back to TTL expiry", name)
+                    return
+                if e.code not in HISTORY_LOST_ERRORS:
+                    logger.warning("Change stream on %s failed: %s", name, e)
+                else:
+                    # Missed events cannot be replayed: start over from now
+                    # with empty caches
+                    logger.warning("Change stream on %s cannot resume; resetting caches", name)
+                    token = None
+                    self._reset_caches()
+            except PyMongoError as e:
+                logger.warning("Change stream on %s failed: %s", name, e)
+            finally:
+                self._set_open(name, False)
+            
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 60)
+
+    def _set_open(self, name: str, is_open: bool):
+        """Stretch cache TTLs while every stream is open; restore them otherwise."""
+        was_coherent = len(self._open) == len(self._tasks)
+        if is_open:
+            self._open.add(name)
+        else:
+            self._open.discard(name)
+        coherent = len(self._open) == len(self._tasks)
+        
+        caches = (self.database.group_cache, self.database.snapshots, triggers)
+        if coherent and not was_coherent:
+            for cache in caches:
+                self._ttls[cache] = cache.ttl
+                cache.ttl = max(cache.ttl, COHERENT_CACHE_TTL)
+        elif was_coherent and not coherent:
+            for cache in caches:
+                cache.ttl = self._ttls.pop(cache, cache.ttl)
+
+    def _reset_caches(self):
+        self.database.group_cache.loaded_at = None
+        self.database.snapshots.invalidate()
+        triggers.invalidate()
+
+    def _on_target(self, change: Dict):
+        doc: Optional[Dict] = change.get("fullDocument")
+        if change["operationType"] in ("insert", "update", "replace"):
+            if doc is not None:
+                self.database.snapshots.apply_upsert(doc["group_id"], doc["day_key"], doc)
+        elif change["operationType"] == "delete":
+            # Deletes carry only the _id. Archival deletes old days, which
+            # no snapshot holds, so only today's targets are looked up
+            self.database.snapshots.remove_target(change["documentKey"]["_id"])
+        elif change["operationType"] in ("drop", "invalidate"):
+            self.database.snapshots.invalidate()
+
+    def _on_group_settings(self, change: Dict):
+        doc: Optional[Dict] = change.get("fullDocument")
+        cache = self.database.group_cache
+        if change["operationType"] in ("insert", "update", "replace") and doc is not None:
+            group_id = doc["group_id"]
+            cache.add(group_id)
+            timezone = doc.get("timezone")
+            if timezone and cache.timezones.get(group_id) != timezone:
+                # Today's snapshot may belong to another day in the new zone
+                cache.timezones[group_id] = timezone
+                self.database.snapshots.invalidate(group_id)
+            triggers.invalidate(group_id)
+        else:
+            # A group was removed; which one is unknown, so reload
+            self._reset_caches()
+
+
+# Started once MongoDB is connected (see start_services in main.py)
+changes = ChangeWatcher(db)
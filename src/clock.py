@@ -0,0 +1,60 @@
+import os
+import time
+from datetime import datetime, time as dt_time, timedelta
+from functools import lru_cache
+from typing import Dict, Tuple
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+DEFAULT_TIMEZONE = os.getenv("DEFAULT_TIMEZONE", "UTC")
+
+@lru_cache(maxsize=None)
+def get_zone(name: str) -> ZoneInfo:
+    return ZoneInfo(name)
+
+def is_valid_timezone(name: str) -> bool:
+    try:
+        get_zone(name)
+        return True
+    except (ZoneInfoNotFoundError, ValueError):
+        return False
+
+def day_key_from_date(date: datetime) -> int:
+    """Compact YYYYMMDD integer for a date"""
+    return date.year * 10000 + date.month * 100 + date.day
+
+def date_from_day_key(day_key: int) -> datetime:
+    """Midnight (naive) of the day a key refers to"""
+    return datetime(day_key // 10000, day_key // 100 % 100, day_key % 100)
+
+def shift_day_key(day_key: int, days: int) -> int:
+    return day_key_from_date(date_from_day_key(day_key) + timedelta(days=days))
+
+class DayClock:
+    """Current day key per timezone, cached until that timezone's midnight.
+
+    Computing "today" is then a dict lookup and a float comparison for all
+    but the first call of each local day.
+    """
+
+    def __init__(self):
+        self._today: Dict[str, Tuple[float, int]] = {}
+
+    def today(self, timezone: str = None) -> int:
+        timezone = timezone or DEFAULT_TIMEZONE
+        entry = self._today.get(timezone)
+        if entry is not None and time.time() < entry[0]:
+            return entry[1]
+        
+        zone = get_zone(timezone)
+        local_now = datetime.now(zone)
+        next_midnight = datetime.combine(local_now.date() + timedelta(days=1), dt_time(), tzinfo=zone)
+        day_key = day_key_from_date(local_now)
+        self._today[timezone] = (next_midnight.timestamp(), day_key)
+        return day_key
+
+    def now(self, timezone: str = None) -> datetime:
+        """Current local wall-clock time (naive) in ``timezone``"""
+        return datetime.now(get_zone(timezone or DEFAULT_TIMEZONE)).replace(tzinfo=None)
+
+
+clock = DayClock()
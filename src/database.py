@@ -1,121 +1,310 @@
+import asyncio
+import logging
 import os
 from typing import Dict, List, Optional
 from datetime import datetime
-from pymongo import MongoClient
-from pymongo.errors import ConnectionFailure
+from pymongo.errors import PyMongoError
 from dotenv import load_dotenv
 
+from src.metrics import MongoCommandMetrics, MongoPoolMetrics
+from src.cache import GroupAuthCache, SnapshotCache, DailySnapshot
+from src.write_queue import WriteBehindQueue
+from src.indexes import ensure_indexes, find_collection_scans
+from src.stats import StatsEngine
+from src.triggers import triggers
+from src.clock import clock, date_from_day_key, DEFAULT_TIMEZONE
+from src.migrations import run_migrations
+from src.archive import ARCHIVE_COLLECTION, ARCHIVE_COLLECTION_OPTIONS, archive_cutoff, archived_targets
+
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+# Connection attempts during startup, and the backoff between them (seconds)
+CONNECT_RETRIES = int(os.getenv("MONGO_CONNECT_RETRIES", "3"))
+CONNECT_BACKOFF = float(os.getenv("MONGO_CONNECT_BACKOFF", "1"))
+CONNECT_BACKOFF_MAX = float(os.getenv("MONGO_CONNECT_BACKOFF_MAX", "30"))
+
 class MongoDB:
     def __init__(self):
         self.mongo_uri = os.getenv("MONGODB_URI", "mongodb://localhost:27017/")
         self.db_name = os.getenv("DB_NAME", "telegram_target_bot")
+        # Connection pool tuning (see pymongo MongoClient options)
+        self.pool_options = {
+            "maxPoolSize": int(os.getenv("MONGO_MAX_POOL_SIZE", "50")),
+            "minPoolSize": int(os.getenv("MONGO_MIN_POOL_SIZE", "5")),
+            "maxIdleTimeMS": int(os.getenv("MONGO_MAX_IDLE_TIME_MS", "60000")),
+            "waitQueueTimeoutMS": int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", "5000")),
+            "serverSelectionTimeoutMS": int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "5000")),
+            # Per-command timers and pool gauges for /metrics
+            "event_listeners": [MongoCommandMetrics(), MongoPoolMetrics()],
+        }
         self.client = None
         self.db = None
-        self.connect()
+        self.group_cache = GroupAuthCache()
+        self.snapshots = SnapshotCache()
+        # Optional write-behind batching for target upserts/completions
+        self.write_behind = os.getenv("WRITE_BEHIND", "false").lower() in ("1", "true", "yes")
+        self.writes = None
+        self.stats = None
+        # Set once the first connection attempt has finished, failed or not
+        self.attempted = asyncio.Event()
+    
+    @property
+    def available(self) -> bool:
+        """True once connected; handlers reply "temporarily unavailable" otherwise"""
+        return self.db is not None
     
-    def connect(self):
+    async def connect(self) -> bool:
+        """Create the client and verify the connection.
+
+        The motor client binds to the running event loop, so this must be
+        awaited from inside the bot's loop (see ``post_init`` in main.py).
+        Returns False, leaving the database unavailable, if any step fails.
+        """
         try:
-            self.client = MongoClient(self.mongo_uri, serverSelectionTimeoutMS=5000)
+            # A pre-set client (e.g. an in-memory stand-in) is reused
+            if self.client is None:
+                # Imported on first use: motor is slow to import
+                from motor.motor_asyncio import AsyncIOMotorClient
+                self.client = AsyncIOMotorClient(self.mongo_uri, **self.pool_options)
             # Test connection
-            self.client.admin.command('ping')
-            self.db = self.client[self.db_name]
-            self._create_collections()
-            print("✅ Connected to MongoDB successfully!")
-        except ConnectionFailure as e:
-            print(f"❌ MongoDB connection failed: {e}")
-    
-    def _create_collections(self):
+            await self.client.admin.command('ping')
+            database = self.client[self.db_name]
+            # Rollup updates follow every target write, so they are batched too
+            stats_writes = WriteBehindQueue(database.user_stats) if self.write_behind else None
+            self.stats = StatsEngine(database, writes=stats_writes)
+            await self._create_collections(database)
+            await self.refresh_group_cache(database)
+            if self.write_behind:
+                self.writes = WriteBehindQueue(database.targets)
+            # Published last so handlers never see a half-initialized database
+            self.db = database
+            logger.info("Connected to MongoDB")
+            return True
+        except PyMongoError as e:
+            logger.error("MongoDB connection failed: %s", e)
+            return False
+        finally:
+            self.attempted.set()
+    
+    async def wait_ready(self, timeout: float) -> bool:
+        """Wait up to ``timeout`` seconds while the first connection attempt is
+        in flight; True if available.
+
+        Once that attempt has failed this returns at once, so updates arriving
+        during the retry backoff are turned away instead of holding a worker.
+        """
+        if not self.attempted.is_set():
+            try:
+                await asyncio.wait_for(self.attempted.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return self.available
+    
+    async def connect_with_retry(self, attempts: Optional[int] = CONNECT_RETRIES) -> bool:
+        """Call ``connect`` until it succeeds, backing off exponentially.
+
+        ``attempts=None`` retries forever.
+        """
+        delay = CONNECT_BACKOFF
+        attempt = 0
+        while True:
+            attempt += 1
+            if await self.connect():
+                return True
+            if attempts is not None and attempt >= attempts:
+                return False
+            logger.warning("Retrying MongoDB connection in %.1fs (attempt %d)", delay, attempt)
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, CONNECT_BACKOFF_MAX)
+    
+    async def ping(self, timeout: float = 2.0) -> bool:
+        """Return True if the server answers a ping within ``timeout`` seconds"""
+        if self.client is None:
+            return False
+        try:
+            await asyncio.wait_for(self.client.admin.command('ping'), timeout)
+            return True
+        except Exception:
+            return False
+    
+    async def _create_collections(self, database):
         # Create collections if they don't exist
-        collections = self.db.list_collection_names()
+        collections = await database.list_collection_names()
         
-        if "users" not in collections:
-            self.db.create_collection("users")
-            self.db.users.create_index("user_id", unique=True)
+        for name in ("users", "targets", "group_settings", "user_stats"):
+            if name not in collections:
+                await database.create_collection(name)
+        if ARCHIVE_COLLECTION not in collections:
+            await database.create_collection(ARCHIVE_COLLECTION, **ARCHIVE_COLLECTION_OPTIONS)
         
-        if "targets" not in collections:
-            self.db.create_collection("targets")
-            self.db.targets.create_index([("user_id", 1), ("date", 1)], unique=True)
+        # Data migrations run first so new unique indexes can be built
+        await run_migrations(database)
         
-        if "group_settings" not in collections:
-            self.db.create_collection("group_settings")
-            self.db.group_settings.create_index("group_id", unique=True)
-    
-    def add_target(self, group_id: int, user_id: int, username: str, target: str, date: datetime = None):
-        """Add a target for a user on a specific date"""
-        if date is None:
-            date = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        # Indexes are verified even when the collections already exist
+        await ensure_indexes(database)
+        
+        if os.getenv("INDEX_SELF_CHECK", "true").lower() in ("1", "true", "yes"):
+            for scan in await find_collection_scans(database):
+                logger.warning("Query plan uses a collection scan: %s", scan)
+    
+    async def get_group_timezone(self, group_id: int) -> str:
+        """Get a group's timezone name (served from the group cache)"""
+        if not self.group_cache.is_fresh():
+            await self.refresh_group_cache()
+        return self.group_cache.timezones.get(group_id) or DEFAULT_TIMEZONE
+    
+    async def today_key(self, group_id: int) -> int:
+        """Today's day key (YYYYMMDD) in the group's timezone"""
+        return clock.today(await self.get_group_timezone(group_id))
+    
+    async def add_target(self, group_id: int, user_id: int, username: str, target: str, day_key: int = None):
+        """Add a target for a user on a specific day"""
+        timezone = await self.get_group_timezone(group_id)
+        if day_key is None:
+            day_key = clock.today(timezone)
         
         target_data = {
             "group_id": group_id,
             "user_id": user_id,
             "username": username,
             "target": target,
-            "date": date,
-            "created_at": datetime.now(),
+            "day_key": day_key,
+            "date": date_from_day_key(day_key),
+            "created_at": clock.now(timezone),
             "completed": False
         }
         
         try:
-            self.db.targets.update_one(
-                {"user_id": user_id, "date": date},
+            written = await self._write_target(
+                {"group_id": group_id, "user_id": user_id, "day_key": day_key},
                 {"$set": target_data},
                 upsert=True
             )
-            return True
-        except Exception as e:
-            print(f"Error adding target: {e}")
+            if written:
+                self.snapshots.apply_upsert(group_id, day_key, target_data)
+                await self._update_stats(self.stats.record_target(group_id, user_id, username, day_key))
+            return written
+        except Exception:
+            logger.exception("Error adding target")
             return False
     
-    def get_today_target(self, user_id: int):
+    async def get_today_target(self, group_id: int, user_id: int, projection: Dict = None):
         """Get today's target for a user"""
-        today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
-        return self.db.targets.find_one({"user_id": user_id, "date": today})
+        today = await self.today_key(group_id)
+        return await self.db.targets.find_one(
+            {"group_id": group_id, "user_id": user_id, "day_key": today}, projection
+        )
     
-    def get_all_targets(self, group_id: int, date: datetime = None):
-        """Get all targets for a group on a specific date"""
-        if date is None:
-            date = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    async def get_all_targets(self, group_id: int, day_key: int = None, projection: Dict = None):
+        """Get all targets for a group on a specific day"""
+        if day_key is None:
+            day_key = await self.today_key(group_id)
         
-        return list(self.db.targets.find({
+        return await self.db.targets.find({
             "group_id": group_id,
-            "date": date
-        }))
+            "day_key": day_key
+        }, projection).to_list(length=None)
     
-    def get_user_targets(self, user_id: int, limit: int = 7):
-        """Get recent targets for a user"""
-        return list(self.db.targets.find(
-            {"user_id": user_id}
-        ).sort("date", -1).limit(limit))
+    async def get_today_snapshot(self, group_id: int) -> DailySnapshot:
+        """Get today's targets for a group from the snapshot cache"""
+        today = await self.today_key(group_id)
+        return await self.snapshots.load(group_id, today, lambda: self.get_all_targets(group_id, today))
+    
+    async def get_user_targets(self, group_id: int, user_id: int, limit: int = 7, projection: Dict = None,
+                               before: int = None, after: int = None):
+        """Get a page of a user's targets in a group, newest first.
+        
+        Keyset pagination on (group_id, user_id, day_key): ``before`` returns
+        the page of older targets, ``after`` the page of newer ones. Pages
+        read through to the archive, which holds the oldest days.
+        """
+        query = {"group_id": group_id, "user_id": user_id}
+        direction = -1
+        if before is not None:
+            query["day_key"] = {"$lt": before}
+        elif after is not None:
+            query["day_key"] = {"$gt": after}
+            direction = 1
+        
+        targets = await self.db.targets.find(query, projection).sort(
+            "day_key", direction
+        ).limit(limit).to_list(length=limit)
+        
+        # Archived days are older than every hot one, so a full page of
+        # older targets never needs the archive, nor does a page of newer
+        # ones starting past the archival cutoff
+        if (len(targets) < limit and direction == -1) or (direction == 1 and after < archive_cutoff()):
+            archived = await archived_targets(self.db, group_id, user_id, limit, before, after)
+            if archived:
+                targets = sorted(
+                    targets + archived, key=lambda t: t["day_key"], reverse=direction == -1
+                )[:limit]
+        
+        if direction == 1:
+            targets.reverse()
+        return targets
     
-    def mark_target_completed(self, user_id: int, date: datetime = None):
+    async def mark_target_completed(self, group_id: int, user_id: int, day_key: int = None) -> bool:
         """Mark a target as completed"""
-        if date is None:
-            date = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        timezone = await self.get_group_timezone(group_id)
+        if day_key is None:
+            day_key = clock.today(timezone)
         
-        return self.db.targets.update_one(
-            {"user_id": user_id, "date": date},
-            {"$set": {"completed": True, "completed_at": datetime.now()}}
+        completed_at = clock.now(timezone)
+        written = await self._write_target(
+            {"group_id": group_id, "user_id": user_id, "day_key": day_key},
+            {"$set": {"completed": True, "completed_at": completed_at}}
         )
+        if written:
+            self.snapshots.mark_completed(group_id, user_id, day_key, completed_at)
+            await self._update_stats(self.stats.record_completion(group_id, user_id, day_key))
+        return written
     
-    def reset_all_data(self, group_id: int = None):
+    async def _update_stats(self, rollup_update):
+        """Apply a stats rollup update; failures never fail the target write"""
+        try:
+            await rollup_update
+        except Exception as e:
+            logger.warning("Error updating stats rollup: %s", e)
+    
+    async def _write_target(self, query: Dict, update: Dict, upsert: bool = False) -> bool:
+        """Apply a single-target update, batched through the write-behind queue if enabled"""
+        if self.writes:
+            key = (query["group_id"], query["user_id"], query["day_key"])
+            return await self.writes.submit(key, query, update, upsert=upsert)
+        
+        result = await self.db.targets.update_one(query, update, upsert=upsert)
+        return result.matched_count > 0 or result.upserted_id is not None
+    
+    async def reset_all_data(self, group_id: int = None):
         """Reset all data (for testing)"""
         try:
             if group_id:
-                self.db.targets.delete_many({"group_id": group_id})
-                self.db.group_settings.delete_one({"group_id": group_id})
+                await self.db.targets.delete_many({"group_id": group_id})
+                await self.db.group_settings.delete_one({"group_id": group_id})
+                await self.db.user_stats.delete_many({"group_id": group_id})
+                await self.db[ARCHIVE_COLLECTION].delete_many({"group_id": group_id})
+                self.group_cache.remove(group_id)
+                self.snapshots.invalidate(group_id)
+                triggers.invalidate(group_id)
             else:
-                self.db.targets.delete_many({})
-                self.db.group_settings.delete_many({})
+                await self.db.targets.delete_many({})
+                await self.db.group_settings.delete_many({})
+                await self.db.user_stats.delete_many({})
+                await self.db[ARCHIVE_COLLECTION].delete_many({})
+                self.group_cache.clear()
+                self.snapshots.invalidate()
+                triggers.invalidate()
             return True
-        except Exception as e:
-            print(f"Error resetting data: {e}")
+        except Exception:
+            logger.exception("Error resetting data")
             return False
     
-    def set_allowed_group(self, group_id: int, group_name: str):
+    async def set_allowed_group(self, group_id: int, group_name: str):
         """Set the allowed group for the bot"""
-        self.db.group_settings.update_one(
+        await self.db.group_settings.update_one(
             {"group_id": group_id},
             {"$set": {
                 "group_id": group_id,
@@ -124,24 +313,150 @@ class MongoDB:
             }},
             upsert=True
         )
+        self.group_cache.add(group_id)
     
-    def is_group_allowed(self, group_id: int) -> bool:
-        """Check if a group is allowed"""
-        # If no groups are set, allow all (for initial setup)
-        count = self.db.group_settings.count_documents({})
-        if count == 0:
-            return True
+    async def refresh_group_cache(self, database=None):
+        """Reload the allowed group ids and timezones from group_settings"""
+        if database is None:
+            database = self.db
+        cursor = database.group_settings.find({}, {"group_id": 1, "timezone": 1, "_id": 0})
+        docs = await cursor.to_list(length=None)
+        self.group_cache.load(
+            [doc["group_id"] for doc in docs],
+            {doc["group_id"]: doc["timezone"] for doc in docs if doc.get("timezone")}
+        )
+    
+    async def set_group_timezone(self, group_id: int, timezone: str) -> bool:
+        """Set the timezone used for a group's day boundaries (True once stored)"""
+        try:
+            result = await self.db.group_settings.update_one(
+                {"group_id": group_id},
+                {"$set": {"timezone": timezone, "updated_at": datetime.now()}},
+                upsert=True
+            )
+        except Exception:
+            logger.exception("Error setting timezone")
+            return False
+        if not result.matched_count and result.upserted_id is None:
+            return False
+        # Patched only once stored, or the next cache reload would undo it
+        self.group_cache.timezones[group_id] = timezone
+        self.snapshots.invalidate(group_id)
+        return True
+    
+    async def is_group_allowed(self, group_id: int) -> bool:
+        """Check if a group is allowed (served from the group cache)"""
+        allowed = self.group_cache.check(group_id)
+        if allowed is None:
+            await self.refresh_group_cache()
+            allowed = self.group_cache.contains(group_id)
+        return allowed
+    
+    async def get_daily_summary(self, group_id: int, day_key: int = None) -> Dict:
+        """Counts and member names for a group's day in a single aggregation"""
+        if day_key is None:
+            day_key = await self.today_key(group_id)
         
-        return self.db.group_settings.find_one({"group_id": group_id}) is not None
+        pipeline = [
+            {"$match": {"group_id": group_id, "day_key": day_key}},
+            {"$group": {
+                "_id": None,
+                "total": {"$sum": 1},
+                "completed": {"$sum": {"$cond": ["$completed", 1, 0]}},
+                "completed_users": {"$push": {"$cond": ["$completed", "$username", "$$REMOVE"]}},
+                "pending_users": {"$push": {"$cond": ["$completed", "$$REMOVE", "$username"]}},
+            }},
+        ]
+        results = await self.db.targets.aggregate(pipeline).to_list(length=1)
+        if not results:
+            return {"total": 0, "completed": 0, "completed_users": [], "pending_users": []}
+        return results[0]
+    
+    async def iter_group_settings(self):
+        """Iterate over all group settings documents"""
+        async for settings in self.db.group_settings.find({}):
+            yield settings
+    
+    async def set_group_schedule(self, group_id: int, reminder_time: Optional[str], digest_time: Optional[str]):
+        """Store a group's reminder/digest times ("HH:MM", or None to disable)"""
+        await self.db.group_settings.update_one(
+            {"group_id": group_id},
+            {"$set": {
+                "reminder_time": reminder_time,
+                "digest_time": digest_time,
+                "updated_at": datetime.now()
+            }},
+            upsert=True
+        )
+    
+    async def get_group_settings(self, group_id: int, projection: Dict = None) -> Dict:
+        """Get a group's settings document (empty dict if missing)"""
+        return await self.db.group_settings.find_one({"group_id": group_id}, projection) or {}
+    
+    async def get_group_triggers(self, group_id: int) -> Optional[List[Dict]]:
+        """Get a group's custom trigger rules (None means use the defaults)"""
+        settings = await self.db.group_settings.find_one({"group_id": group_id}, {"_id": 0, "triggers": 1})
+        return settings.get("triggers") if settings else None
+    
+    async def set_group_triggers(self, group_id: int, rules: Optional[List[Dict]]) -> bool:
+        """Replace a group's trigger rules (None restores the defaults); True once stored"""
+        if rules is None:
+            update = {"$unset": {"triggers": ""}, "$set": {"updated_at": datetime.now()}}
+        else:
+            update = {"$set": {"triggers": rules, "updated_at": datetime.now()}}
+        try:
+            result = await self.db.group_settings.update_one({"group_id": group_id}, update, upsert=True)
+        except Exception:
+            logger.exception("Error setting triggers")
+            return False
+        triggers.invalidate(group_id)
+        return bool(result.matched_count or result.upserted_id is not None)
+    
+    async def upsert_member(self, group_id: int, user_id: int, username: str, first_name: str = None):
+        """Record a group member's current username in the users directory"""
+        username_lower = username.lower()
+        # Usernames can move between accounts; the newest owner wins
+        await self.db.users.update_many(
+            {"group_id": group_id, "username_lower": username_lower, "user_id": {"$ne": user_id}},
+            {"$unset": {"username": "", "username_lower": ""}}
+        )
+        await self.db.users.update_one(
+            {"group_id": group_id, "user_id": user_id},
+            {"$set": {
+                "group_id": group_id,
+                "user_id": user_id,
+                "username": username,
+                "username_lower": username_lower,
+                "first_name": first_name,
+                "updated_at": datetime.now()
+            }},
+            upsert=True
+        )
     
-    def get_allowed_group(self):
-        """Get the allowed group info"""
-        return self.db.group_settings.find_one()
+    async def find_member(self, group_id: int, username_lower: str, projection: Dict = None):
+        """Look up a group member by lowercase username"""
+        return await self.db.users.find_one(
+            {"group_id": group_id, "username_lower": username_lower},
+            projection or {"_id": 0, "user_id": 1, "username": 1}
+        )
+    
+    async def get_allowed_group(self, group_id: int, projection: Dict = None):
+        """Get an allowed group's info (None if the group is not authorized)"""
+        return await self.db.group_settings.find_one({"group_id": group_id}, projection)
     
-    def close(self):
-        """Close MongoDB connection"""
+    async def count_allowed_groups(self) -> int:
+        """Number of authorized groups"""
+        return await self.db.group_settings.count_documents({})
+    
+    async def close(self):
+        """Flush pending writes and close MongoDB connection"""
+        if self.writes:
+            await self.writes.close()
+        if self.stats and self.stats.writes:
+            await self.stats.writes.close()
         if self.client:
             self.client.close()
+        self.db = None
 
-# Global database instance
+# Global database instance (connected in Application.post_init)
 db = MongoDB()
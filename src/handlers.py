@@ -1,10 +1,23 @@
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.ext import ContextTypes, CommandHandler, MessageHandler, filters, CallbackQueryHandler
-from datetime import datetime
-import re
+from telegram.ext import ContextTypes, ApplicationHandlerStop
+from pymongo.errors import ConnectionFailure
+import logging
 
 from src.database import db
-from src.utils import is_admin, format_targets_message
+from src.stats import LEADERBOARD_WINDOWS
+from src.triggers import triggers, CompiledTriggers, DEFAULT_RULES
+from src.clock import is_valid_timezone
+from src.members import members
+from src import scheduler
+from src.ratelimit import reply, edit, send, keyword_cooldown, user_limiter
+from src.log import update_fields
+from src.startup import STARTUP_DB_WAIT
+from src.render import escape, render_my_target, render_my_targets, render_bot_status
+from src.utils import is_admin, is_owner, format_targets_message, admin_cache, ADMIN_STATUSES
+
+logger = logging.getLogger(__name__)
+
+UNAVAILABLE_TEXT = "⚠️ The bot is temporarily unavailable. Please try again in a few minutes."
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Send a message when the command /start is issued."""
@@ -15,16 +28,22 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     chat_type = update.message.chat.type
     
     if chat_type != "group" and chat_type != "supergroup":
-        await update.message.reply_text("⚠️ This bot only works in groups!")
+        await reply(update.message, "⚠️ This bot only works in groups!")
         return
     
-    # Check if group is allowed
-    if not db.is_group_allowed(group_id):
-        await update.message.reply_text("🚫 This bot is not authorized to work in this group!")
+    # Check if group is allowed; a bot owner's /start authorizes it
+    if not await db.is_group_allowed(group_id) and not is_owner(update.message.from_user.id):
+        await reply(
+            update.message,
+            "🚫 This bot is not authorized to work in this group!\n"
+            "Ask the bot owner to send /start here to authorize it."
+        )
         return
     
     group_name = update.message.chat.title or "Unknown Group"
-    db.set_allowed_group(group_id, group_name)
+    await db.set_allowed_group(group_id, group_name)
+    
+    await scheduler.reschedule_group(group_id)
     
     welcome_message = (
         "🎯 *Target Tracker Bot*\n\n"
@@ -33,16 +52,21 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "📌 /addtarget <target> - Add your target for today\n"
         "📌 /mytarget - Check your today's target\n"
         "📌 /today - See all targets for today\n"
-        "📌 /mytargets - See your recent targets (last 7 days)\n"
-        "📌 /done - Mark today's target as completed\n\n"
+        "📌 /mytargets - Browse your target history\n"
+        "📌 /done - Mark today's target as completed\n"
+        "📌 /leaderboard [7|30|90] - Top members by completed days\n"
+        "📌 /streak - Your current and longest streak\n\n"
         "*Admin Commands:*\n"
         "🛠 /reset - Clear all bot data (testing only)\n"
         "🛠 /addtargetfor @username <target> - Add target for a user\n"
+        "🛠 /schedule <HH:MM|off> <HH:MM|off> - Set reminder and digest times\n"
+        "🛠 /timezone <Area/City> - Set the group's timezone\n"
+        "🛠 /triggers - Manage keyword auto-replies\n"
         "🛠 /status - Check bot status\n"
         "🛠 /help - Show this help message"
     )
     
-    await update.message.reply_text(welcome_message, parse_mode="Markdown")
+    await reply(update.message, welcome_message, parse_mode="Markdown")
 
 async def add_target(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Add a target for today."""
@@ -54,20 +78,20 @@ async def add_target(update: Update, context: ContextTypes.DEFAULT_TYPE):
     username = update.message.from_user.username or update.message.from_user.first_name
     
     # Check if group is allowed
-    if not db.is_allowed_group(group_id):
-        await update.message.reply_text("🚫 This bot is not authorized to work in this group!")
+    if not await db.is_group_allowed(group_id):
+        await reply(update.message, "🚫 This bot is not authorized to work in this group!")
         return
     
     if not context.args:
-        await update.message.reply_text("❌ Please provide your target!\nUsage: /addtarget <your target>")
+        await reply(update.message, "❌ Please provide your target!\nUsage: /addtarget <your target>")
         return
     
     target = " ".join(context.args)
     
-    if db.add_target(group_id, user_id, username, target):
-        await update.message.reply_text(f"✅ Target added!\n📝 *Your Target:* {target}", parse_mode="Markdown")
+    if await db.add_target(group_id, user_id, username, target):
+        await reply(update.message, f"✅ Target added!\n📝 *Your Target:* {escape(target)}", parse_mode="Markdown")
     else:
-        await update.message.reply_text("❌ Failed to add target. Please try again.")
+        await reply(update.message, "❌ Failed to add target. Please try again.")
 
 async def add_target_for_user(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Admin command to add target for a specific user."""
@@ -75,32 +99,33 @@ async def add_target_for_user(update: Update, context: ContextTypes.DEFAULT_TYPE
         return
     
     group_id = update.message.chat.id
-    admin_id = update.message.from_user.id
     
     # Check if user is admin
     if not await is_admin(update, context):
-        await update.message.reply_text("🚫 This command is for admins only!")
+        await reply(update.message, "🚫 This command is for admins only!")
         return
     
     if len(context.args) < 2:
-        await update.message.reply_text("❌ Usage: /addtargetfor @username <target>")
+        await reply(update.message, "❌ Usage: /addtargetfor @username <target>")
         return
     
     # Extract username (remove @ if present)
     username = context.args[0].lstrip('@')
     target = " ".join(context.args[1:])
     
-    # In a real implementation, you'd need to get user_id from username
-    # For now, we'll store with username only
-    # Note: Telegram usernames are unique
-    
-    # Create a dummy user_id based on username hash
-    user_id_hash = abs(hash(username)) % 1000000
+    # Resolve the real user id from the member directory
+    user_id = await members.resolve(group_id, username)
+    if user_id is None:
+        await reply(
+            update.message,
+            f"❌ I don't know @{username} yet. They need to send a message in this group first."
+        )
+        return
     
-    if db.add_target(group_id, user_id_hash, username, target):
-        await update.message.reply_text(f"✅ Target added for @{username}!\n📝 *Target:* {target}", parse_mode="Markdown")
+    if await db.add_target(group_id, user_id, username, target):
+        await reply(update.message, f"✅ Target added for @{escape(username)}!\n📝 *Target:* {escape(target)}", parse_mode="Markdown")
     else:
-        await update.message.reply_text("❌ Failed to add target.")
+        await reply(update.message, "❌ Failed to add target.")
 
 async def my_target(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Show user's target for today."""
@@ -111,27 +136,18 @@ async def my_target(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.message.from_user.id
     
     # Check if group is allowed
-    if not db.is_allowed_group(group_id):
-        await update.message.reply_text("🚫 This bot is not authorized to work in this group!")
+    if not await db.is_group_allowed(group_id):
+        await reply(update.message, "🚫 This bot is not authorized to work in this group!")
         return
     
-    target = db.get_today_target(user_id)
+    target = await db.get_today_target(group_id, user_id)
     
     if target:
-        status = "✅ Completed" if target.get("completed") else "⏳ Pending"
-        message = (
-            f"🎯 *Your Today's Target*\n\n"
-            f"📝 *Target:* {target['target']}\n"
-            f"📅 *Date:* {target['date'].strftime('%Y-%m-%d')}\n"
-            f"📊 *Status:* {status}\n"
-            f"⏰ *Added:* {target['created_at'].strftime('%H:%M')}"
-        )
-        if target.get("completed_at"):
-            message += f"\n✅ *Completed at:* {target['completed_at'].strftime('%H:%M')}"
+        message = render_my_target(target)
     else:
         message = "📭 You haven't set a target for today!\nUse /addtarget <your target> to add one."
     
-    await update.message.reply_text(message, parse_mode="Markdown")
+    await reply(update.message, message, parse_mode="Markdown")
 
 async def today_targets(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Show all targets for today."""
@@ -141,18 +157,60 @@ async def today_targets(update: Update, context: ContextTypes.DEFAULT_TYPE):
     group_id = update.message.chat.id
     
     # Check if group is allowed
-    if not db.is_allowed_group(group_id):
-        await update.message.reply_text("🚫 This bot is not authorized to work in this group!")
+    if not await db.is_group_allowed(group_id):
+        await reply(update.message, "🚫 This bot is not authorized to work in this group!")
         return
     
-    targets = db.get_all_targets(group_id)
+    snapshot = await db.get_today_snapshot(group_id)
     
-    if not targets:
-        await update.message.reply_text("📭 No targets set for today!")
+    if not snapshot.total:
+        await reply(update.message, "📭 No targets set for today!")
         return
     
-    message = format_targets_message(targets)
-    await update.message.reply_text(message, parse_mode="Markdown")
+    message = snapshot.render(format_targets_message)
+    await reply(update.message, message, parse_mode="Markdown")
+
+MYTARGETS_PAGE_SIZE = 7
+MYTARGETS_PROJECTION = {"_id": 0, "day_key": 1, "target": 1, "completed": 1}
+
+async def _my_targets_page(group_id: int, user_id: int, before: int = None, after: int = None):
+    """Build the text and Older/Newer buttons for one page of a user's targets.
+    
+    One extra target is fetched in the paging direction to tell whether
+    another page follows; the other direction is known from the cursor,
+    which is a target the user paged away from.
+    """
+    targets = await db.get_user_targets(
+        group_id, user_id, limit=MYTARGETS_PAGE_SIZE + 1, projection=MYTARGETS_PROJECTION,
+        before=before, after=after
+    )
+    if not targets:
+        return None, None
+    
+    more = len(targets) > MYTARGETS_PAGE_SIZE
+    if after is None:
+        # Newest first: the extra target is the oldest
+        targets = targets[:MYTARGETS_PAGE_SIZE]
+        has_older, has_newer = more, before is not None
+    else:
+        # Returned newest first too, so the extra (newer) target leads
+        targets = targets[-MYTARGETS_PAGE_SIZE:]
+        has_older, has_newer = True, more
+    
+    newest = targets[0]["day_key"]
+    oldest = targets[-1]["day_key"]
+    buttons = []
+    if has_older:
+        buttons.append(InlineKeyboardButton(
+            "⬅️ Older", callback_data=f"mytargets_older_{user_id}_{oldest}"
+        ))
+    if has_newer:
+        buttons.append(InlineKeyboardButton(
+            "Newer ➡️", callback_data=f"mytargets_newer_{user_id}_{newest}"
+        ))
+    
+    reply_markup = InlineKeyboardMarkup([buttons]) if buttons else None
+    return render_my_targets(targets), reply_markup
 
 async def my_targets(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Show user's recent targets."""
@@ -163,25 +221,41 @@ async def my_targets(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.message.from_user.id
     
     # Check if group is allowed
-    if not db.is_allowed_group(group_id):
-        await update.message.reply_text("🚫 This bot is not authorized to work in this group!")
+    if not await db.is_group_allowed(group_id):
+        await reply(update.message, "🚫 This bot is not authorized to work in this group!")
         return
     
-    targets = db.get_user_targets(user_id, limit=7)
+    message, reply_markup = await _my_targets_page(group_id, user_id)
     
-    if not targets:
-        await update.message.reply_text("📭 You haven't set any targets yet!")
+    if not message:
+        await reply(update.message, "📭 You haven't set any targets yet!")
         return
     
-    message = "📊 *Your Recent Targets*\n\n"
-    for i, target in enumerate(targets, 1):
-        status = "✅" if target.get("completed") else "⏳"
-        message += (
-            f"{i}. {status} *{target['date'].strftime('%Y-%m-%d')}*\n"
-            f"   📝 {target['target']}\n\n"
-        )
+    await reply(update.message, message, parse_mode="Markdown", reply_markup=reply_markup)
+
+async def my_targets_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handle Older/Newer pagination buttons for /mytargets."""
+    query = update.callback_query
+    
+    # callback_data: mytargets_<older|newer>_<user_id>_<day_key>
+    _, direction, owner_id, cursor = query.data.split("_")
+    if query.from_user.id != int(owner_id):
+        await query.answer("These are not your targets!", show_alert=True)
+        return
+    
+    await query.answer()
+    
+    group_id = query.message.chat.id
+    if direction == "older":
+        message, reply_markup = await _my_targets_page(group_id, int(owner_id), before=int(cursor))
+    else:
+        message, reply_markup = await _my_targets_page(group_id, int(owner_id), after=int(cursor))
+    
+    if not message:
+        await edit(query, "📭 No more targets!")
+        return
     
-    await update.message.reply_text(message, parse_mode="Markdown")
+    await edit(query, message, parse_mode="Markdown", reply_markup=reply_markup)
 
 async def mark_done(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Mark today's target as completed."""
@@ -193,24 +267,245 @@ async def mark_done(update: Update, context: ContextTypes.DEFAULT_TYPE):
     username = update.message.from_user.username or update.message.from_user.first_name
     
     # Check if group is allowed
-    if not db.is_allowed_group(group_id):
-        await update.message.reply_text("🚫 This bot is not authorized to work in this group!")
+    if not await db.is_group_allowed(group_id):
+        await reply(update.message, "🚫 This bot is not authorized to work in this group!")
         return
     
-    target = db.get_today_target(user_id)
+    target = await db.get_today_target(group_id, user_id, projection={"completed": 1})
     
     if not target:
-        await update.message.reply_text("📭 You don't have a target for today!")
+        await reply(update.message, "📭 You don't have a target for today!")
         return
     
     if target.get("completed"):
-        await update.message.reply_text("✅ You've already completed today's target!")
+        await reply(update.message, "✅ You've already completed today's target!")
         return
     
-    if db.mark_target_completed(user_id):
-        await update.message.reply_text(f"🎉 Congratulations @{username}! Target marked as completed!")
+    if await db.mark_target_completed(group_id, user_id):
+        await reply(update.message, f"🎉 Congratulations @{username}! Target marked as completed!")
     else:
-        await update.message.reply_text("❌ Failed to mark target as completed.")
+        await reply(update.message, "❌ Failed to mark target as completed.")
+
+async def leaderboard(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Show the group's completion leaderboard over 7, 30 or 90 days."""
+    if not update.message:
+        return
+    
+    group_id = update.message.chat.id
+    
+    # Check if group is allowed
+    if not await db.is_group_allowed(group_id):
+        await reply(update.message, "🚫 This bot is not authorized to work in this group!")
+        return
+    
+    window = 7
+    if context.args:
+        if not context.args[0].isdigit() or int(context.args[0]) not in LEADERBOARD_WINDOWS:
+            await reply(update.message, "❌ Usage: /leaderboard [7|30|90]")
+            return
+        window = int(context.args[0])
+    
+    ranking = await db.stats.leaderboard(group_id, await db.today_key(group_id), window)
+    
+    if not ranking:
+        await reply(update.message, f"📭 No completed targets in the last {window} days!")
+        return
+    
+    lines = [f"🏆 *Leaderboard* (last {window} days)", ""]
+    for i, row in enumerate(ranking, 1):
+        lines.append(f"{i}. @{escape(row['username'])}: {row['completed']}/{window} days ({int(row['rate'] * 100)}%)")
+    
+    await reply(update.message, "\n".join(lines), parse_mode="Markdown")
+
+async def streak(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Show the user's current and longest completion streak."""
+    if not update.message:
+        return
+    
+    group_id = update.message.chat.id
+    user_id = update.message.from_user.id
+    
+    # Check if group is allowed
+    if not await db.is_group_allowed(group_id):
+        await reply(update.message, "🚫 This bot is not authorized to work in this group!")
+        return
+    
+    streaks = await db.stats.streak(group_id, user_id, await db.today_key(group_id))
+    
+    message = (
+        f"🔥 *Your Streak*\n\n"
+        f"📈 *Current:* {streaks['current']} days\n"
+        f"🏅 *Longest:* {streaks['longest']} days"
+    )
+    await reply(update.message, message, parse_mode="Markdown")
+
+async def set_schedule(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Set the group's morning reminder and digest times (admin only)."""
+    if not update.message:
+        return
+    
+    # Check if user is admin
+    if not await is_admin(update, context):
+        await reply(update.message, "🚫 This command is for admins only!")
+        return
+    
+    group_id = update.message.chat.id
+    
+    # Check if group is allowed
+    if not await db.is_group_allowed(group_id):
+        await reply(update.message, "🚫 This bot is not authorized to work in this group!")
+        return
+    usage = "❌ Usage: /schedule <reminder HH:MM|off> <digest HH:MM|off>"
+    
+    if len(context.args) != 2:
+        await reply(update.message, usage)
+        return
+    
+    times = []
+    for value in context.args:
+        if value.lower() == "off":
+            times.append(None)
+            continue
+        try:
+            scheduler.parse_time(value)
+        except ValueError:
+            await reply(update.message, usage)
+            return
+        times.append(value)
+    
+    reminder_time, digest_time = times
+    await db.set_group_schedule(group_id, reminder_time, digest_time)
+    await scheduler.reschedule_group(group_id)
+    
+    await reply(
+        update.message,
+        f"⏰ *Schedule updated!*\n"
+        f"☀️ *Reminder:* {reminder_time or 'off'}\n"
+        f"🌙 *Digest:* {digest_time or 'off'}",
+        parse_mode="Markdown"
+    )
+
+async def set_timezone(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Set the timezone used for the group's days and schedule (admin only)."""
+    if not update.message:
+        return
+    
+    # Check if user is admin
+    if not await is_admin(update, context):
+        await reply(update.message, "🚫 This command is for admins only!")
+        return
+    
+    group_id = update.message.chat.id
+    
+    # Check if group is allowed
+    if not await db.is_group_allowed(group_id):
+        await reply(update.message, "🚫 This bot is not authorized to work in this group!")
+        return
+    
+    if len(context.args) != 1 or not is_valid_timezone(context.args[0]):
+        await reply(update.message, "❌ Usage: /timezone <Area/City>\nExample: /timezone Asia/Kolkata")
+        return
+    
+    timezone = context.args[0]
+    if not await db.set_group_timezone(group_id, timezone):
+        await reply(update.message, "❌ Failed to set the timezone. Please try again.")
+        return
+    await scheduler.reschedule_group(group_id)
+    
+    await reply(update.message, f"🌍 Timezone set to *{timezone}*", parse_mode="Markdown")
+
+# Keeps the per-message match cheap whatever admins configure
+MAX_TRIGGER_RULES = 50
+MAX_TRIGGER_PATTERN = 200
+TRIGGERS_FAILED_TEXT = "❌ Failed to save the trigger rules. Please try again."
+
+def _describe_rules(rules, custom: bool) -> str:
+    lines = ["🔔 Trigger rules" + ("" if custom else " (defaults)") + ":"]
+    for number, rule in enumerate(rules, 1):
+        kind = "regex" if rule.get("type") == "regex" else "keyword"
+        line = f"{number}. {kind} {rule['pattern']}"
+        if rule.get("reply"):
+            line += f" → {rule['reply']}"
+        lines.append(line)
+    return "\n".join(lines)
+
+async def manage_triggers(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """List or edit the group's keyword and regex auto-replies (admin only)."""
+    if not update.message:
+        return
+    
+    # Check if user is admin
+    if not await is_admin(update, context):
+        await reply(update.message, "🚫 This command is for admins only!")
+        return
+    
+    group_id = update.message.chat.id
+    
+    # Check if group is allowed
+    if not await db.is_group_allowed(group_id):
+        await reply(update.message, "🚫 This bot is not authorized to work in this group!")
+        return
+    usage = (
+        "❌ Usage:\n"
+        "/triggers - List the rules\n"
+        "/triggers add <keyword> [| reply]\n"
+        "/triggers regex <pattern> [| reply]\n"
+        "/triggers remove <number>\n"
+        "/triggers reset - Back to the defaults"
+    )
+    
+    custom = await db.get_group_triggers(group_id)
+    rules = list(custom if custom is not None else DEFAULT_RULES)
+    # Patterns and replies may contain spaces: parse the raw text
+    parts = update.message.text.split(maxsplit=2)
+    action = parts[1].lower() if len(parts) > 1 else None
+    
+    if action is None:
+        await reply(update.message, _describe_rules(rules, custom is not None))
+        return
+    
+    if action == "reset" and len(parts) == 2:
+        if not await db.set_group_triggers(group_id, None):
+            await reply(update.message, TRIGGERS_FAILED_TEXT)
+            return
+        await reply(update.message, "✅ Trigger rules reset to the defaults.")
+        return
+    
+    if action == "remove" and len(parts) == 3 and parts[2].isdigit() and 1 <= int(parts[2]) <= len(rules):
+        removed = rules.pop(int(parts[2]) - 1)
+        if not await db.set_group_triggers(group_id, rules):
+            await reply(update.message, TRIGGERS_FAILED_TEXT)
+            return
+        await reply(update.message, f"🗑 Removed trigger: {removed['pattern']}")
+        return
+    
+    if action in ("add", "regex") and len(parts) == 3:
+        pattern, _, rule_reply = (part.strip() for part in parts[2].partition("|"))
+        if not pattern or len(pattern) > MAX_TRIGGER_PATTERN:
+            await reply(update.message, usage)
+            return
+        if len(rules) >= MAX_TRIGGER_RULES:
+            await reply(update.message, f"❌ A group can have at most {MAX_TRIGGER_RULES} trigger rules.")
+            return
+        rule = {"type": "keyword" if action == "add" else "regex", "pattern": pattern}
+        if rule_reply:
+            rule["reply"] = rule_reply
+        # Rejected here rather than silently skipped on every message
+        if CompiledTriggers([rule]).skipped:
+            await reply(
+                update.message,
+                "❌ Invalid regex. Capturing groups and inline flags such as (?i) are not allowed; "
+                "use (?:...) and note that matching is already case-insensitive."
+            )
+            return
+        rules.append(rule)
+        if not await db.set_group_triggers(group_id, rules):
+            await reply(update.message, TRIGGERS_FAILED_TEXT)
+            return
+        await reply(update.message, f"✅ Trigger added: {pattern}")
+        return
+    
+    await reply(update.message, usage)
 
 async def reset_data(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Reset all bot data (admin only)."""
@@ -219,7 +514,7 @@ async def reset_data(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     # Check if user is admin
     if not await is_admin(update, context):
-        await update.message.reply_text("🚫 This command is for admins only!")
+        await reply(update.message, "🚫 This command is for admins only!")
         return
     
     # Create confirmation keyboard
@@ -231,7 +526,7 @@ async def reset_data(update: Update, context: ContextTypes.DEFAULT_TYPE):
     ]
     reply_markup = InlineKeyboardMarkup(keyboard)
     
-    await update.message.reply_text(
+    await reply(update.message, 
         "⚠️ *WARNING: This will delete ALL bot data!*\n\n"
         "Are you sure you want to continue?",
         parse_mode="Markdown",
@@ -245,12 +540,13 @@ async def reset_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     if query.data == "reset_confirm":
         group_id = query.message.chat.id
-        if db.reset_all_data(group_id):
-            await query.edit_message_text("✅ All bot data has been reset!")
+        if await db.reset_all_data(group_id):
+            await scheduler.unschedule_group(group_id)
+            await edit(query, "✅ All bot data has been reset!")
         else:
-            await query.edit_message_text("❌ Failed to reset data.")
+            await edit(query, "❌ Failed to reset data.")
     else:
-        await query.edit_message_text("Reset cancelled.")
+        await edit(query, "Reset cancelled.")
 
 async def bot_status(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Show bot status (admin only)."""
@@ -259,33 +555,17 @@ async def bot_status(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     # Check if user is admin
     if not await is_admin(update, context):
-        await update.message.reply_text("🚫 This command is for admins only!")
+        await reply(update.message, "🚫 This command is for admins only!")
         return
     
     group_id = update.message.chat.id
-    allowed_group = db.get_allowed_group()
-    
-    if allowed_group:
-        group_info = f"✅ *Authorized Group:* {allowed_group['group_name']} (ID: {allowed_group['group_id']})"
-    else:
-        group_info = "⚠️ *No group authorized yet*"
+    allowed_group = await db.get_allowed_group(group_id, projection={"_id": 0, "group_id": 1, "group_name": 1})
     
     # Count today's targets
-    today_targets = db.get_all_targets(group_id)
-    completed = sum(1 for t in today_targets if t.get("completed"))
-    
-    status_message = (
-        "🤖 *Bot Status*\n\n"
-        f"{group_info}\n\n"
-        f"📊 *Today's Statistics:*\n"
-        f"   • Total Targets: {len(today_targets)}\n"
-        f"   • Completed: {completed}\n"
-        f"   • Pending: {len(today_targets) - completed}\n\n"
-        f"💾 *Database:* Connected\n"
-        f"⚙️ *Bot Mode:* Testing"
-    )
+    snapshot = await db.get_today_snapshot(group_id)
+    status_message = render_bot_status(allowed_group, snapshot, db.group_cache.stats())
     
-    await update.message.reply_text(status_message, parse_mode="Markdown")
+    await reply(update.message, status_message, parse_mode="Markdown")
 
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Send a help message."""
@@ -296,16 +576,21 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "📌 /mytarget - View your today's target\n"
         "📌 /today - View all targets for today\n"
         "📌 /mytargets - View your recent targets\n"
-        "📌 /done - Mark your target as completed\n\n"
+        "📌 /done - Mark your target as completed\n"
+        "📌 /leaderboard [7|30|90] - View the completion leaderboard\n"
+        "📌 /streak - View your completion streak\n\n"
         "*Admin Commands:*\n"
         "🛠 /addtargetfor @username <target> - Add target for a user\n"
+        "🛠 /schedule <HH:MM|off> <HH:MM|off> - Set reminder and digest times\n"
+        "🛠 /timezone <Area/City> - Set the group's timezone\n"
+        "🛠 /triggers - Manage keyword auto-replies\n"
         "🛠 /reset - Reset all bot data\n"
         "🛠 /status - Check bot status\n"
         "🛠 /help - Show this help message\n\n"
         "*Note:* This bot only works in the authorized group!"
     )
     
-    await update.message.reply_text(help_text, parse_mode="Markdown")
+    await reply(update.message, help_text, parse_mode="Markdown")
 
 async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle regular messages."""
@@ -317,28 +602,87 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
         group_id = update.message.chat.id
         
         # Check if group is allowed
-        if not db.is_allowed_group(group_id):
+        if not await db.is_group_allowed(group_id):
             # Silently ignore messages from unauthorized groups
             return
         
-        # You can add additional message handling here
-        # For example, reacting to certain keywords
-        text = update.message.text.lower()
+        # React to the group's trigger keywords/patterns
+        trigger_reply = await triggers.match(group_id, update.message.text, db.get_group_triggers)
         
-        if any(word in text for word in ["target", "goal", "task", "todo"]):
-            await update.message.reply_text(
-                "🎯 Don't forget to set your daily target with /addtarget !"
-            )
+        if trigger_reply:
+            # At most one reminder per chat per cooldown window
+            if not keyword_cooldown.ready(group_id):
+                return
+            await reply(update.message, trigger_reply)
+
+async def track_member(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Record the sender of every update in an authorized group's member directory."""
+    user = update.effective_user
+    chat = update.effective_chat
+    if not user or user.is_bot or not chat or chat.type not in ("group", "supergroup"):
+        return
+    if await db.is_group_allowed(chat.id):
+        await members.record(chat.id, user.id, user.username, user.first_name)
+
+async def track_admin_changes(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Drop the cached admin list when a member is promoted or demoted."""
+    member_update = update.chat_member or update.my_chat_member
+    if not member_update:
+        return
+    
+    was_admin = member_update.old_chat_member.status in ADMIN_STATUSES
+    is_now_admin = member_update.new_chat_member.status in ADMIN_STATUSES
+    
+    if was_admin != is_now_admin:
+        admin_cache.invalidate(member_update.chat.id)
+
+async def database_guard(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Answer commands with "temporarily unavailable" while MongoDB is down.
+    
+    Runs before every other handler; stops processing of the update when the
+    database is unavailable so handlers never touch an unconnected client.
+    Updates arriving while the first connection attempt is still in flight
+    wait for it; once that attempt has failed they are turned away at once.
+    """
+    if db.available or await db.wait_ready(STARTUP_DB_WAIT):
+        return
+    
+    if update.callback_query:
+        await update.callback_query.answer(UNAVAILABLE_TEXT, show_alert=True)
+    elif update.message and update.message.text and update.message.text.startswith("/"):
+        await reply(update.message, UNAVAILABLE_TEXT)
+    raise ApplicationHandlerStop
+
+async def rate_limit_guard(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Drop commands and button presses from users over their rate limit.
+    
+    Runs before the command handlers, so a limited command does no work
+    at all rather than changing data and then going unconfirmed.
+    """
+    user = update.effective_user
+    message = update.message
+    is_command = bool(message and message.text and message.text.startswith("/"))
+    if not user or not (is_command or update.callback_query):
+        return
+    if user_limiter.allow(user.id):
+        return
+    
+    if update.callback_query:
+        await update.callback_query.answer("⏳ Too many requests, please slow down.")
+    raise ApplicationHandlerStop
 
 async def error_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Log errors."""
-    print(f"Update {update} caused error {context.error}")
+    # Only the update's ids: its repr can hold whole messages
+    logger.error("Update caused error", exc_info=context.error, extra=update_fields(update))
     
-    # Try to notify admin if possible
-    if update and update.effective_chat:
-        try:
-            await update.effective_chat.send_message(
-                "❌ An error occurred. Please try again later."
-            )
-        except:
-            pass
+    # Lost connections are reported as an outage rather than a failure
+    if isinstance(context.error, ConnectionFailure):
+        text = UNAVAILABLE_TEXT
+    else:
+        text = "❌ An error occurred. Please try again later."
+    
+    # Try to notify the chat if possible
+    if isinstance(update, Update) and update.effective_chat:
+        # Queued, not awaited: a failed notice is logged by the queue
+        await send(context.bot, update.effective_chat.id, text)
@@ -0,0 +1,89 @@
+from typing import Dict, List
+
+from pymongo import ASCENDING, DESCENDING, IndexModel
+
+# Every index the query paths in src/database.py rely on. Names are left to
+# MongoDB's defaults so indexes created by earlier versions are recognised.
+INDEXES: Dict[str, List[IndexModel]] = {
+    "users": [
+        # The member directory is per group
+        IndexModel([("group_id", ASCENDING), ("user_id", ASCENDING)], unique=True),
+        IndexModel([("group_id", ASCENDING), ("username_lower", ASCENDING)]),
+    ],
+    "targets": [
+        # Tenancy key: every per-user query is scoped to one group
+        IndexModel([("group_id", ASCENDING), ("user_id", ASCENDING), ("day_key", ASCENDING)], unique=True),
+        IndexModel([("group_id", ASCENDING), ("day_key", ASCENDING), ("completed", ASCENDING)]),
+    ],
+    "group_settings": [
+        IndexModel([("group_id", ASCENDING)], unique=True),
+    ],
+    "user_stats": [
+        IndexModel([("group_id", ASCENDING), ("user_id", ASCENDING)], unique=True),
+    ],
+    "targets_archive": [
+        # One bucket per user per month
+        IndexModel([("group_id", ASCENDING), ("user_id", ASCENDING), ("month", ASCENDING)], unique=True),
+    ],
+}
+
+# Indexes from earlier schema versions, dropped by ensure_indexes
+OBSOLETE_INDEXES: Dict[str, List[str]] = {
+    "targets": ["user_id_1_date_1", "group_id_1_date_1_completed_1", "user_id_1_day_key_1"],
+    "users": ["user_id_1", "username_lower_1"],
+}
+
+# Representative query shapes checked by find_collection_scans:
+# (collection, filter, sort)
+QUERY_SHAPES = [
+    ("targets", {"group_id": 0, "user_id": 0, "day_key": 0}, None),
+    ("targets", {"group_id": 0, "day_key": 0}, None),
+    ("targets", {"group_id": 0, "day_key": 0, "completed": True}, None),
+    ("targets", {"group_id": 0, "user_id": 0}, [("day_key", DESCENDING)]),
+    ("group_settings", {"group_id": 0}, None),
+    ("users", {"group_id": 0, "user_id": 0}, None),
+    ("users", {"group_id": 0, "username_lower": ""}, None),
+    ("user_stats", {"group_id": 0}, None),
+    ("user_stats", {"group_id": 0, "user_id": 0}, None),
+    ("targets_archive", {"group_id": 0, "user_id": 0, "month": {"$lte": 0}}, [("month", DESCENDING)]),
+]
+
+async def ensure_indexes(db) -> Dict[str, List[str]]:
+    """Create any missing indexes and return the index names per collection.
+
+    ``create_indexes`` is a no-op for indexes that already exist, so this is
+    safe to run on every startup.
+    """
+    names = {}
+    for collection, models in INDEXES.items():
+        names[collection] = await db[collection].create_indexes(models)
+    
+    for collection, obsolete in OBSOLETE_INDEXES.items():
+        existing = await db[collection].index_information()
+        for name in obsolete:
+            if name in existing:
+                await db[collection].drop_index(name)
+    return names
+
+def _has_stage(plan: Dict, stage: str) -> bool:
+    if plan.get("stage") == stage:
+        return True
+    children = plan.get("inputStages", [])
+    if "inputStage" in plan:
+        children = children + [plan["inputStage"]]
+    return any(_has_stage(child, stage) for child in children)
+
+async def find_collection_scans(db) -> List[str]:
+    """Explain each query shape and return the ones planned as a COLLSCAN."""
+    scans = []
+    for collection, query, sort in QUERY_SHAPES:
+        cursor = db[collection].find(query)
+        if sort:
+            cursor = cursor.sort(sort)
+        explanation = await cursor.explain()
+        winning_plan = explanation.get("queryPlanner", {}).get("winningPlan", {})
+        # Plans run through the slot-based engine nest the tree under queryPlan
+        winning_plan = winning_plan.get("queryPlan", winning_plan)
+        if _has_stage(winning_plan, "COLLSCAN"):
+            scans.append(f"{collection}: filter={query} sort={sort}")
+    return scans
@@ -0,0 +1,163 @@
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Optional
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# "json" for structured lines, "text" for a readable console
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()
+# Fraction of routine per-update log lines kept; warnings and errors always pass
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "0.01"))
+
+# Logger for per-update lines, the noisiest path under load
+update_logger = logging.getLogger("bot.updates")
+
+_update_id = contextvars.ContextVar("update_id", default=None)
+_chat_id = contextvars.ContextVar("chat_id", default=None)
+_command = contextvars.ContextVar("command", default=None)
+
+_listener = None
+
+def update_fields(update) -> dict:
+    """Identifying fields of an update, for the ``extra`` of a log call."""
+    chat = getattr(update, "effective_chat", None)
+    return {
+        "update_id": getattr(update, "update_id", None),
+        "chat_id": chat.id if chat else None,
+    }
+
+def update_command(update) -> Optional[str]:
+    """The bot command an update carries ("/done"), or None."""
+    message = getattr(update, "effective_message", None)
+    text = getattr(message, "text", None)
+    if text and text.startswith("/"):
+        # "/done@SomeBot args" -> "/done"
+        return text.split(maxsplit=1)[0].split("@", 1)[0]
+    return None
+
+@contextmanager
+def update_context(update, command: str):
+    """Attach the update's ids and the handler name to every log line inside."""
+    fields = update_fields(update)
+    tokens = [
+        (_update_id, _update_id.set(fields["update_id"])),
+        (_chat_id, _chat_id.set(fields["chat_id"])),
+        (_command, _command.set(command)),
+    ]
+    try:
+        yield
+    finally:
+        for var, token in reversed(tokens):
+            var.reset(token)
+
+
+class ContextFilter(logging.Filter):
+    """Copy the current update context onto the record.
+    
+    Runs on the logging thread of the caller, before the record is queued,
+    so the context variables are still those of the handler.
+    """
+
+    def filter(self, record):
+        for name, var in (("update_id", _update_id), ("chat_id", _chat_id), ("command", _command)):
+            if getattr(record, name, None) is None:
+                setattr(record, name, var.get())
+        return True
+
+
+class SampleFilter(logging.Filter):
+    """Keep a fraction of records below WARNING."""
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        return record.levelno >= logging.WARNING or random.random() < self.rate
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line."""
+
+    FIELDS = ("update_id", "chat_id", "command", "duration_ms")
+
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for name in self.FIELDS:
+            value = getattr(record, name, None)
+            if value is not None:
+                entry[name] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that leaves formatting to the listener thread.
+    
+    The stock ``prepare`` formats the whole record on the caller's thread;
+    only the message arguments and the traceback need resolving before the
+    record crosses threads.
+    """
+
+    def prepare(self, record):
+        record = logging.makeLogRecord(record.__dict__)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def setup_logging():
+    """Route all logging through a queue drained by a background thread."""
+    global _listener
+    if _listener is not None:
+        return
+    
+    output = logging.StreamHandler(sys.stderr)
+    if LOG_FORMAT == "text":
+        output.setFormatter(logging.Formatter(
+            "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+        ))
+    else:
+        output.setFormatter(JsonFormatter())
+    
+    log_queue = queue.SimpleQueue()
+    handler = _QueueHandler(log_queue)
+    handler.addFilter(ContextFilter())
+    
+    root = logging.getLogger()
+    root.handlers[:] = [handler]
+    root.setLevel(LOG_LEVEL)
+    
+    # httpx logs every Bot API request at INFO
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    update_logger.addFilter(SampleFilter(LOG_SAMPLE_RATE))
+    
+    _listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+
+def stop_logging():
+    """Flush queued records and stop the listener thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
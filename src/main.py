@@ -1,35 +1,131 @@
+# First, so the startup clock covers every other import
+from src.startup import STARTUP_MODE, startup
+
 import os
+import asyncio
 import logging
+import time
 from dotenv import load_dotenv
-from telegram.ext import Application, CommandHandler, MessageHandler, filters, CallbackQueryHandler
+from telegram import Update
+from telegram.ext import Application, CommandHandler, MessageHandler, filters, CallbackQueryHandler, ChatMemberHandler, TypeHandler
 
+from src.changes import changes
 from src.database import db
+from src.log import setup_logging
+from src.metrics import InstrumentedRequest, instrument_handlers
+from src.processor import KeyedUpdateProcessor
+from src.ratelimit import outgoing
+from src.scheduler import start_scheduler, stop_scheduler
 from src.handlers import (
     start, add_target, add_target_for_user, my_target,
-    today_targets, my_targets, mark_done, reset_data,
+    today_targets, my_targets, my_targets_callback, mark_done, leaderboard, streak,
+    set_schedule, set_timezone, manage_triggers, reset_data,
     reset_callback, bot_status, help_command,
-    handle_message, error_handler
+    handle_message, track_member, track_admin_changes, database_guard, rate_limit_guard,
+    error_handler
 )
 
 # Load environment variables
 load_dotenv()
 
-# Enable logging
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO
-)
+# Enable logging; records are formatted and written off the event loop
+setup_logging()
 logger = logging.getLogger(__name__)
 
-def main():
-    """Start the bot."""
-    # Get bot token from environment
-    BOT_TOKEN = os.getenv("BOT_TOKEN")
-    if not BOT_TOKEN:
-        raise ValueError("BOT_TOKEN environment variable is required!")
+# Reconnect loop started when MongoDB is unreachable at startup
+_connect_task = None
+
+async def start_services(application: Application):
+    """Start everything that needs the database, once it is connected."""
+    group_count = await db.count_allowed_groups()
+    if group_count or db.group_cache.configured:
+        logger.info("Authorized groups: %d registered, %d configured", group_count, len(db.group_cache.configured))
+    else:
+        logger.warning("No group authorized yet. Bot will work in the first group it's added to; "
+                       "set BOT_OWNER_IDS to authorize more.")
     
-    # Create Application
-    application = Application.builder().token(BOT_TOKEN).build()
+    if os.getenv("SCHEDULER_ENABLED", "true").lower() in ("1", "true", "yes"):
+        await start_scheduler(application)
+    
+    # Keep caches coherent with writes from other replicas
+    changes.start()
+
+async def connect_in_background(application: Application):
+    """Keep retrying the connection; handlers reply "temporarily unavailable" meanwhile."""
+    started = time.perf_counter()
+    await db.connect_with_retry(attempts=None)
+    startup.record("db_connect", time.perf_counter() - started)
+    await start_services(application)
+
+async def post_init(application: Application):
+    """Connect to MongoDB inside the bot's event loop.
+    
+    In the default "fast" startup mode the connection is made in the
+    background, so fetching updates starts right away; updates arriving
+    before it is up wait for it (see database_guard). In "eager" mode a
+    bounded number of attempts is made first; if they all fail the bot
+    starts anyway and keeps reconnecting in the background.
+    """
+    global _connect_task
+    startup.mark("initialize")
+    if STARTUP_MODE == "eager":
+        started = time.perf_counter()
+        if await db.connect_with_retry():
+            startup.record("db_connect", time.perf_counter() - started)
+            await start_services(application)
+            return
+        logger.error("MongoDB unavailable at startup; retrying in the background")
+    _connect_task = asyncio.create_task(connect_in_background(application))
+
+async def note_first_update(update: Update, context):
+    """Log the startup timing breakdown when the first update arrives."""
+    startup.first_update()
+
+async def post_stop(application: Application):
+    """Stop scheduled jobs and drain queued messages while the bot can still send them."""
+    if _connect_task:
+        _connect_task.cancel()
+    await stop_scheduler()
+    await changes.stop()
+    await outgoing.close()
+
+async def post_shutdown(application: Application):
+    """Flush pending writes and close the MongoDB connection pool."""
+    await db.close()
+
+def build_application(token: str, base_url: str = None) -> Application:
+    """Create the Application and register all handlers.
+    
+    ``base_url`` points the bot at another Bot API server (used by the
+    load-test harness in benchmarks/).
+    """
+    builder = (
+        Application.builder()
+        .token(token)
+        .post_init(post_init)
+        .post_stop(post_stop)
+        .post_shutdown(post_shutdown)
+        # Time every Bot API call for /metrics
+        .request(InstrumentedRequest(connection_pool_size=256))
+        .get_updates_request(InstrumentedRequest())
+        # Concurrent updates, serialized per (chat, user)
+        .concurrent_updates(KeyedUpdateProcessor())
+    )
+    if base_url:
+        builder = builder.base_url(base_url)
+    application = builder.build()
+    
+    # Time-to-first-update for the startup breakdown
+    application.add_handler(TypeHandler(Update, note_first_update), group=-4)
+    
+    # Short-circuit every update while MongoDB is unreachable
+    application.add_handler(TypeHandler(Update, database_guard), group=-3)
+    
+    # Record every sender in the member directory before other handlers run
+    application.add_handler(TypeHandler(Update, track_member), group=-2)
+    
+    # Drop commands from users over their rate limit before any work is done
+    application.add_handler(TypeHandler(Update, rate_limit_guard), group=-1)
     
     # Register command handlers
     application.add_handler(CommandHandler("start", start))
@@ -40,31 +136,69 @@ def main():
     application.add_handler(CommandHandler("today", today_targets))
     application.add_handler(CommandHandler("mytargets", my_targets))
     application.add_handler(CommandHandler("done", mark_done))
+    application.add_handler(CommandHandler("leaderboard", leaderboard))
+    application.add_handler(CommandHandler("streak", streak))
+    application.add_handler(CommandHandler("schedule", set_schedule))
+    application.add_handler(CommandHandler("timezone", set_timezone))
+    application.add_handler(CommandHandler("triggers", manage_triggers))
     application.add_handler(CommandHandler("reset", reset_data))
     application.add_handler(CommandHandler("status", bot_status))
     
     # Register callback handler for reset confirmation
     application.add_handler(CallbackQueryHandler(reset_callback, pattern="^reset_"))
     
+    # Register callback handler for /mytargets pagination
+    application.add_handler(CallbackQueryHandler(my_targets_callback, pattern="^mytargets_"))
+    
+    # Invalidate cached admin lists on promotions/demotions
+    application.add_handler(ChatMemberHandler(track_admin_changes, ChatMemberHandler.ANY_CHAT_MEMBER))
+    
     # Register message handler
     application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
     
     # Register error handler
     application.add_error_handler(error_handler)
     
+    # Record latency and errors of every handler registered above
+    instrument_handlers(application)
+    
+    return application
+
+def main():
+    """Start the bot."""
+    # Get bot token from environment
+    BOT_TOKEN = os.getenv("BOT_TOKEN")
+    if not BOT_TOKEN:
+        raise ValueError("BOT_TOKEN environment variable is required!")
+    
+    startup.mark("imports")
+    
+    # Create Application
+    application = build_application(BOT_TOKEN)
+    startup.mark("build")
+    
     # Start the Bot
-    print("🤖 Starting Target Tracker Bot...")
-    print(f"✅ MongoDB Connected: {db.client is not None}")
+    logger.info("Starting Target Tracker Bot")
     
-    # Get allowed group info
-    allowed_group = db.get_allowed_group()
-    if allowed_group:
-        print(f"✅ Authorized Group: {allowed_group['group_name']} (ID: {allowed_group['group_id']})")
-    else:
-        print("⚠️ No group authorized yet. Bot will work in the first group it's added to.")
+    # Run the bot: webhook mode, or polling with health endpoints when a
+    # PORT is assigned (Render web service), or plain polling
+    mode = os.getenv("BOT_MODE", "polling").lower()
+    if mode not in ("polling", "webhook"):
+        raise ValueError("BOT_MODE must be 'polling' or 'webhook'!")
+    if STARTUP_MODE not in ("fast", "eager"):
+        raise ValueError("STARTUP_MODE must be 'fast' or 'eager'!")
     
-    # Run the bot
-    application.run_polling(allowed_updates=Update.ALL_TYPES)
+    # /metrics on its own (private) port, in any mode
+    if os.getenv("METRICS_PORT"):
+        from prometheus_client import start_http_server
+        start_http_server(int(os.getenv("METRICS_PORT")))
+    
+    # Mode-specific modules are imported only when used
+    if mode == "webhook" or os.getenv("PORT"):
+        from src.webserver import run_server
+        asyncio.run(run_server(application, mode))
+    else:
+        application.run_polling(allowed_updates=Update.ALL_TYPES)
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,78 @@
+import os
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from src.database import db
+
+class MemberDirectory:
+    """Per-group username -> user_id lookups backed by the ``users`` collection.
+
+    Members are recorded passively from updates in authorized groups, keyed
+    by (group_id, user_id), so a group only resolves people seen in it. An
+    in-memory LRU holds recent mappings, so recording an already-known
+    member and resolving a recently seen username need no database call.
+    Misses fall back to the indexed (group_id, username_lower) fields.
+    """
+
+    def __init__(self, max_size: int = None):
+        if max_size is None:
+            max_size = int(os.getenv("MEMBER_CACHE_SIZE", "50000"))
+        self.max_size = max_size
+        self._by_username: "OrderedDict[Tuple[int, str], int]" = OrderedDict()
+        self._username_of: Dict[Tuple[int, int], str] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def _remember(self, group_id: int, username_lower: str, user_id: int):
+        # Forget the member's previous username, if it changed
+        previous = self._username_of.get((group_id, user_id))
+        if previous is not None and previous != username_lower and self._by_username.get((group_id, previous)) == user_id:
+            del self._by_username[(group_id, previous)]
+        
+        # The username may have belonged to another account before
+        key = (group_id, username_lower)
+        previous_owner = self._by_username.get(key)
+        if previous_owner is not None and previous_owner != user_id:
+            self._username_of.pop((group_id, previous_owner), None)
+        
+        self._by_username[key] = user_id
+        self._by_username.move_to_end(key)
+        self._username_of[(group_id, user_id)] = username_lower
+        
+        if len(self._by_username) > self.max_size:
+            (evicted_group, evicted), evicted_id = self._by_username.popitem(last=False)
+            if self._username_of.get((evicted_group, evicted_id)) == evicted:
+                del self._username_of[(evicted_group, evicted_id)]
+
+    async def record(self, group_id: int, user_id: int, username: Optional[str], first_name: str = None):
+        """Store a member seen in a group; a no-op if already known."""
+        if not username:
+            return
+        username_lower = username.lower()
+        key = (group_id, username_lower)
+        if self._by_username.get(key) == user_id:
+            self._by_username.move_to_end(key)
+            return
+        
+        await db.upsert_member(group_id, user_id, username, first_name)
+        self._remember(group_id, username_lower, user_id)
+
+    async def resolve(self, group_id: int, username: str) -> Optional[int]:
+        """Return the user id for ``username`` (without @) in a group, if known."""
+        username_lower = username.lstrip("@").lower()
+        key = (group_id, username_lower)
+        user_id = self._by_username.get(key)
+        if user_id is not None:
+            self.hits += 1
+            self._by_username.move_to_end(key)
+            return user_id
+        
+        self.misses += 1
+        member = await db.find_member(group_id, username_lower)
+        if member is None:
+            return None
+        self._remember(group_id, username_lower, member["user_id"])
+        return member["user_id"]
+
+
+members = MemberDirectory()
@@ -0,0 +1,143 @@
+import functools
+import time
+
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+from pymongo import monitoring
+from telegram.ext import ApplicationHandlerStop, CommandHandler
+from telegram.request import HTTPXRequest
+
+from src.log import update_context
+
+HANDLER_LATENCY = Histogram(
+    "bot_handler_duration_seconds", "Time spent in each update handler", ["handler"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+HANDLER_ERRORS = Counter(
+    "bot_handler_errors_total", "Exceptions raised by update handlers", ["handler", "error"]
+)
+MONGO_LATENCY = Histogram(
+    "mongo_command_duration_seconds", "MongoDB command round-trip time", ["command"],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1),
+)
+MONGO_FAILURES = Counter("mongo_command_failures_total", "Failed MongoDB commands", ["command"])
+MONGO_POOL_OPEN = Gauge("mongo_pool_connections", "Open connections in the MongoDB pool")
+MONGO_POOL_IN_USE = Gauge("mongo_pool_connections_in_use", "MongoDB connections checked out")
+MONGO_POOL_CHECKOUT_FAILURES = Counter(
+    "mongo_pool_checkout_failures_total", "Failed MongoDB connection checkouts", ["reason"]
+)
+TELEGRAM_LATENCY = Histogram(
+    "telegram_api_duration_seconds", "Bot API request time", ["method"],
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+TELEGRAM_ERRORS = Counter("telegram_api_errors_total", "Failed Bot API requests", ["method"])
+STARTUP_PHASE = Gauge("bot_startup_phase_seconds", "Duration of each startup phase", ["phase"])
+TIME_TO_FIRST_UPDATE = Gauge(
+    "bot_time_to_first_update_seconds", "Time from process start to the first handled update"
+)
+
+def instrument(name: str, callback):
+    """Wrap a handler callback to record its latency and errors.
+    
+    Log lines emitted inside the handler carry the update's context. The
+    per-update "handled" line is written once by the update processor.
+    """
+    @functools.wraps(callback)
+    async def wrapper(update, context):
+        with update_context(update, name):
+            started = time.perf_counter()
+            try:
+                return await callback(update, context)
+            except ApplicationHandlerStop:
+                # Normal control flow (e.g. database_guard), not a failure
+                raise
+            except Exception as e:
+                HANDLER_ERRORS.labels(name, type(e).__name__).inc()
+                raise
+            finally:
+                HANDLER_LATENCY.labels(name).observe(time.perf_counter() - started)
+    return wrapper
+
+def instrument_handlers(application):
+    """Instrument every handler registered on the application.
+    
+    Command handlers are labelled with their command, others with the
+    callback's name.
+    """
+    for handlers in application.handlers.values():
+        for handler in handlers:
+            if isinstance(handler, CommandHandler):
+                name = "/" + sorted(handler.commands)[0]
+            else:
+                name = handler.callback.__name__
+            handler.callback = instrument(name, handler.callback)
+
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """Per-command MongoDB timings from pymongo's command monitoring."""
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        MONGO_LATENCY.labels(event.command_name).observe(event.duration_micros / 1e6)
+
+    def failed(self, event):
+        MONGO_LATENCY.labels(event.command_name).observe(event.duration_micros / 1e6)
+        MONGO_FAILURES.labels(event.command_name).inc()
+
+
+class MongoPoolMetrics(monitoring.ConnectionPoolListener):
+    """Connection pool gauges from pymongo's CMAP events."""
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        MONGO_POOL_OPEN.inc()
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        MONGO_POOL_OPEN.dec()
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_check_out_failed(self, event):
+        MONGO_POOL_CHECKOUT_FAILURES.labels(str(event.reason)).inc()
+
+    def connection_checked_out(self, event):
+        MONGO_POOL_IN_USE.inc()
+
+    def connection_checked_in(self, event):
+        MONGO_POOL_IN_USE.dec()
+
+
+class InstrumentedRequest(HTTPXRequest):
+    """HTTPXRequest that times every Bot API call by method name."""
+
+    async def do_request(self, url, method, request_data=None, *args, **kwargs):
+        api_method = url.rsplit("/", 1)[-1]
+        started = time.perf_counter()
+        try:
+            return await super().do_request(url, method, request_data, *args, **kwargs)
+        except Exception:
+            TELEGRAM_ERRORS.labels(api_method).inc()
+            raise
+        finally:
+            TELEGRAM_LATENCY.labels(api_method).observe(time.perf_counter() - started)
+
+
+def render_metrics():
+    """Return (body, content type) for a /metrics response."""
+    return generate_latest(), CONTENT_TYPE_LATEST
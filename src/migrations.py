@@ -0,0 +1,80 @@
+import logging
+from datetime import datetime
+
+from src.stats import rebuild_stats
+
+logger = logging.getLogger(__name__)
+
+# One document per applied migration, keyed by its function name
+MIGRATIONS_COLLECTION = "migrations"
+
+async def backfill_day_keys(db):
+    """Add the integer ``day_key`` to targets stored before it existed.
+
+    Older targets only have ``date`` (server-local midnight), which maps
+    directly onto the calendar day it was bucketed into.
+    """
+    result = await db.targets.update_many(
+        {"day_key": {"$exists": False}},
+        [{"$set": {"day_key": {"$toInt": {"$dateToString": {"format": "%Y%m%d", "date": "$date"}}}}}]
+    )
+    return result.modified_count
+
+async def assign_legacy_group_ids(db):
+    """Scope group-less targets to the deployment's only group.
+    
+    Targets written by single-group versions may lack ``group_id``. When
+    exactly one group is configured they must belong to it; otherwise they
+    are left alone and reported.
+    """
+    orphans = await db.targets.count_documents({"group_id": {"$exists": False}})
+    if not orphans:
+        return 0
+    
+    group_ids = await db.group_settings.distinct("group_id")
+    if len(group_ids) != 1:
+        logger.warning("%d targets have no group_id and cannot be assigned automatically", orphans)
+        return 0
+    
+    result = await db.targets.update_many(
+        {"group_id": {"$exists": False}},
+        {"$set": {"group_id": group_ids[0]}}
+    )
+    return result.modified_count
+
+async def drop_global_members(db):
+    """Remove member directory entries from before it was kept per group.
+    
+    They carry no group, so they cannot be scoped; members are recorded
+    again as they post in their groups.
+    """
+    result = await db.users.delete_many({"group_id": {"$exists": False}})
+    return result.deleted_count
+
+async def backfill_user_stats(db):
+    """Build the ``user_stats`` rollups for targets written before they existed."""
+    return await rebuild_stats(db)
+
+# Applied in order, each once per database; new migrations go at the end
+# under a new name. Steps must stay idempotent: replicas starting together
+# may both run one before it is recorded. Data migrations run before
+# indexes are (re)built.
+MIGRATIONS = [
+    backfill_day_keys,
+    assign_legacy_group_ids,
+    drop_global_members,
+    backfill_user_stats,
+]
+
+async def run_migrations(db):
+    """Apply the migrations not yet recorded in the ``migrations`` collection."""
+    applied = set(await db[MIGRATIONS_COLLECTION].distinct("_id"))
+    for migration in MIGRATIONS:
+        name = migration.__name__
+        if name in applied:
+            continue
+        changed = await migration(db)
+        logger.info("Migration %s applied: %d documents updated", name, changed)
+        await db[MIGRATIONS_COLLECTION].replace_one(
+            {"_id": name}, {"_id": name, "changed": changed, "applied_at": datetime.now()}, upsert=True
+        )
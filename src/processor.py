@@ -0,0 +1,78 @@
+import asyncio
+import os
+import time
+from typing import Any, Awaitable, Dict, Optional, Tuple
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+from src.log import update_command, update_context, update_logger
+
+# Updates handled at the same time
+MAX_CONCURRENT_UPDATES = int(os.getenv("MAX_CONCURRENT_UPDATES", "32"))
+# Updates admitted at once, including those queued behind the same user
+MAX_PENDING_UPDATES = int(os.getenv("MAX_PENDING_UPDATES", "1024"))
+
+def update_key(update: object) -> Optional[Tuple[int, int]]:
+    """The (chat_id, user_id) an update is ordered by, or None if it has neither."""
+    if not isinstance(update, Update):
+        return None
+    chat = update.effective_chat
+    user = update.effective_user
+    if chat is None and user is None:
+        return None
+    return (chat.id if chat else None, user.id if user else None)
+
+
+class KeyedUpdateProcessor(BaseUpdateProcessor):
+    """Process updates concurrently, but one at a time per (chat, user).
+    
+    Updates with the same key run in arrival order, so ``/addtarget``
+    followed by ``/done`` from one user cannot race. An update waiting
+    behind its own key does not hold one of the worker slots, so a single
+    busy user cannot stall everyone else.
+    """
+
+    def __init__(self, max_workers: int = MAX_CONCURRENT_UPDATES, max_pending: int = MAX_PENDING_UPDATES):
+        super().__init__(max(max_pending, max_workers))
+        self.max_workers = max_workers
+        self._workers = asyncio.BoundedSemaphore(max_workers)
+        # key -> (lock, number of updates holding or waiting for it)
+        self._locks: Dict[Tuple[int, int], list] = {}
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        key = update_key(update)
+        if key is None:
+            async with self._workers:
+                await self._run(update, coroutine)
+            return
+        
+        entry = self._locks.get(key)
+        if entry is None:
+            entry = self._locks[key] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                async with self._workers:
+                    await self._run(update, coroutine)
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._locks[key]
+
+    @staticmethod
+    async def _run(update: object, coroutine: Awaitable[Any]) -> None:
+        """Run all handlers of one update and write its (sampled) log line."""
+        with update_context(update, update_command(update)):
+            started = time.perf_counter()
+            try:
+                await coroutine
+            finally:
+                duration = time.perf_counter() - started
+                update_logger.info("handled", extra={"duration_ms": round(duration * 1000, 2)})
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
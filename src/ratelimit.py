@@ -0,0 +1,276 @@
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict, deque
+from datetime import timedelta
+from functools import partial
+from typing import Awaitable, Callable, Deque, Dict, Hashable, Tuple
+
+from telegram.error import RetryAfter
+
+from src.render import split_message
+
+logger = logging.getLogger(__name__)
+
+class TokenBucket:
+    """Classic token bucket: ``rate`` tokens per second, up to ``capacity``."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self) -> bool:
+        self._refill()
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+    def wait_time(self) -> float:
+        """Seconds until a token is available (0 if one is now)."""
+        self._refill()
+        return max(0.0, (1 - self.tokens) / self.rate)
+
+    async def acquire(self):
+        """Wait until a token is available and take it."""
+        while not self.try_acquire():
+            await asyncio.sleep(self.wait_time())
+
+
+class KeyedLimiter:
+    """One token bucket per key (chat or user), least recently used evicted."""
+
+    def __init__(self, rate: float, capacity: float, max_keys: int = 10000):
+        self.rate = rate
+        self.capacity = capacity
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[Hashable, TokenBucket]" = OrderedDict()
+
+    def bucket(self, key: Hashable) -> TokenBucket:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = TokenBucket(self.rate, self.capacity)
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+        return bucket
+
+    def allow(self, key: Hashable) -> bool:
+        return self.bucket(key).try_acquire()
+
+
+class Cooldown:
+    """Allows an action at most once per ``seconds`` for each key."""
+
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+        self._last = {}
+
+    def ready(self, key: Hashable) -> bool:
+        now = time.monotonic()
+        if now - self._last.get(key, float("-inf")) < self.seconds:
+            return False
+        self._last[key] = now
+        return True
+
+
+class OutgoingQueue:
+    """Bounded queue pacing outgoing messages per chat and globally.
+
+    Requests wait in per-chat FIFO queues. Workers take the next chat that
+    is due, send its oldest request once the global token bucket allows,
+    and retry after a 429 using the server's ``retry_after``. A chat out of
+    tokens is set aside until its bucket refills instead of holding a
+    worker, so a busy chat never delays the others. ``submit`` returns as
+    soon as a request is queued; only once ``maxsize`` requests are pending
+    do senders wait, which pushes back on handlers.
+    """
+
+    def __init__(self, maxsize: int = None, workers: int = None, max_retries: int = 3):
+        if maxsize is None:
+            maxsize = int(os.getenv("SEND_QUEUE_SIZE", "1000"))
+        if workers is None:
+            workers = int(os.getenv("SEND_WORKERS", "8"))
+        self.maxsize = maxsize
+        self.workers = workers
+        self.max_retries = max_retries
+        # Telegram allows about 20 messages/minute per group and 30/second overall
+        self.chat_limiter = KeyedLimiter(
+            rate=float(os.getenv("CHAT_SEND_RATE_PER_MIN", "20")) / 60,
+            capacity=float(os.getenv("CHAT_SEND_BURST", "5")),
+        )
+        self.global_bucket = TokenBucket(rate=float(os.getenv("GLOBAL_SEND_RATE_PER_SEC", "30")), capacity=30)
+        # Requests per chat, oldest first; a chat is listed while it has any
+        self._chats: Dict[int, Deque[Tuple[Callable[[], Awaitable], asyncio.Future]]] = {}
+        # Chats due for a send. A chat is in at most one place at a time:
+        # here, set aside waiting for tokens, or with a worker
+        self._ready = None
+        self._slots = None
+        self._pending = 0
+        self._idle = None
+        self._tasks = []
+
+    def _start(self):
+        self._ready = asyncio.Queue()
+        self._slots = asyncio.Semaphore(self.maxsize)
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._tasks = [asyncio.ensure_future(self._worker()) for _ in range(self.workers)]
+
+    async def submit(self, chat_id: int, make_request: Callable[[], Awaitable]) -> asyncio.Future:
+        """Queue an API call for ``chat_id``; returns a future of its result.
+        
+        Waits only while the queue is full, never for the chat's pacing.
+        """
+        if self._ready is None:
+            self._start()
+        await self._slots.acquire()
+        self._pending += 1
+        self._idle.clear()
+        future = asyncio.get_running_loop().create_future()
+        requests = self._chats.get(chat_id)
+        if requests is None:
+            requests = self._chats[chat_id] = deque()
+            self._ready.put_nowait(chat_id)
+        requests.append((make_request, future))
+        return future
+
+    async def send(self, chat_id: int, make_request: Callable[[], Awaitable]):
+        """Queue an API call for ``chat_id`` and return its result once sent."""
+        return await (await self.submit(chat_id, make_request))
+
+    def _finished(self):
+        self._slots.release()
+        self._pending -= 1
+        if not self._pending:
+            self._idle.set()
+
+    async def _worker(self):
+        while True:
+            chat_id = await self._ready.get()
+            requests = self._chats[chat_id]
+            # Requests whose sender was cancelled are dropped unsent
+            while requests and requests[0][1].done():
+                requests.popleft()
+                self._finished()
+            if not requests:
+                del self._chats[chat_id]
+                continue
+            
+            bucket = self.chat_limiter.bucket(chat_id)
+            if not bucket.try_acquire():
+                asyncio.get_running_loop().call_later(bucket.wait_time(), self._ready.put_nowait, chat_id)
+                continue
+            
+            make_request, future = requests.popleft()
+            try:
+                await self.global_bucket.acquire()
+                result = await self._send_with_retry(make_request)
+                if not future.done():
+                    future.set_result(result)
+            except Exception as e:
+                if not future.done():
+                    future.set_exception(e)
+            finally:
+                self._finished()
+                # Back of the line, so chats take turns
+                if requests:
+                    self._ready.put_nowait(chat_id)
+                else:
+                    del self._chats[chat_id]
+
+    async def _send_with_retry(self, make_request):
+        for attempt in range(self.max_retries + 1):
+            try:
+                return await make_request()
+            except RetryAfter as e:
+                if attempt == self.max_retries:
+                    raise
+                retry_after = e.retry_after
+                if isinstance(retry_after, timedelta):
+                    retry_after = retry_after.total_seconds()
+                await asyncio.sleep(retry_after)
+
+    async def close(self, timeout: float = 10.0):
+        """Drain queued messages (up to ``timeout`` seconds) and stop workers."""
+        if self._ready is None:
+            return
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        for requests in self._chats.values():
+            for _, future in requests:
+                future.cancel()
+        self._chats.clear()
+        self._ready = None
+
+
+outgoing = OutgoingQueue()
+user_limiter = KeyedLimiter(
+    rate=float(os.getenv("USER_COMMAND_RATE_PER_MIN", "10")) / 60,
+    capacity=float(os.getenv("USER_COMMAND_BURST", "5")),
+)
+keyword_cooldown = Cooldown(float(os.getenv("KEYWORD_REMINDER_COOLDOWN", "600")))
+
+def _log_failure(future: asyncio.Future):
+    if not future.cancelled() and future.exception() is not None:
+        logger.warning("Could not send a message: %s", future.exception())
+
+async def _post(chat_id: int, make_request: Callable[[], Awaitable]) -> asyncio.Future:
+    """Queue a request whose result nobody waits for, logging if it fails."""
+    future = await outgoing.submit(chat_id, make_request)
+    future.add_done_callback(_log_failure)
+    return future
+
+async def _send_chunks(chat_id: int, text: str, call: Callable[..., Awaitable], kwargs: dict):
+    """Queue ``text`` for ``call(chunk, **kwargs)`` in chunks Telegram accepts.
+    
+    Any ``reply_markup`` goes on the last chunk. Chunks go out in order,
+    since one chat's requests are sent first in, first out.
+    """
+    chunks = split_message(text)
+    markup = kwargs.pop("reply_markup", None)
+    for i, chunk in enumerate(chunks, 1):
+        extra = {"reply_markup": markup} if markup and i == len(chunks) else {}
+        await _post(chat_id, lambda chunk=chunk, extra=extra: call(chunk, **kwargs, **extra))
+
+async def reply(message, text: str, **kwargs):
+    """Queue a reply to ``message`` on the outgoing queue.
+    
+    Returns once the reply is queued, not sent: a handler waiting out its
+    chat's pacing would hold an update worker and stall every other chat.
+    Text over Telegram's length limit is sent as several messages. Senders
+    over their rate limit are turned away before this (see rate_limit_guard
+    in handlers.py), so a reply always follows the work it confirms.
+    """
+    await _send_chunks(message.chat.id, text, message.reply_text, kwargs)
+
+async def edit(query, text: str, **kwargs):
+    """Queue an edit of a callback query's message on the outgoing queue.
+    
+    Text over the length limit continues in new messages after the edit,
+    which keeps any ``reply_markup``.
+    """
+    chat_id = query.message.chat.id
+    first, *rest = split_message(text)
+    await _post(chat_id, lambda: query.edit_message_text(first, **kwargs))
+    if rest:
+        kwargs.pop("reply_markup", None)
+        await _send_chunks(chat_id, "\n".join(rest), partial(query.get_bot().send_message, chat_id), kwargs)
+
+async def send(bot, chat_id: int, text: str, **kwargs):
+    """Queue ``text`` for a chat on the outgoing queue, split if too long."""
+    await _send_chunks(chat_id, text, partial(bot.send_message, chat_id), kwargs)
@@ -0,0 +1,173 @@
+import re
+from datetime import datetime
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional
+
+# Telegram's limit on the text of one message
+MAX_MESSAGE_LENGTH = 4096
+
+# Characters with a meaning in (legacy) Markdown
+_MARKDOWN_SPECIAL = re.compile(r"([_*`\[])")
+
+# Precompiled message fragments; ``.format`` is bound once at import
+TODAY_HEADER = "🎯 *Today's Targets*\n"
+TODAY_EMPTY = "📭 No targets set for today!"
+PENDING_HEADER = "⏳ *Pending:*"
+COMPLETED_HEADER = "✅ *Completed:*"
+PENDING_ROW = "{}. @{}: {}".format
+COMPLETED_ROW = "{}. @{}: {} ({})".format
+PROGRESS = "📊 *Progress:* {}/{} completed ({}%)".format
+
+MY_TARGET = (
+    "🎯 *Your Today's Target*\n\n"
+    "📝 *Target:* {target}\n"
+    "📅 *Date:* {date}\n"
+    "📊 *Status:* {status}\n"
+    "⏰ *Added:* {added}"
+).format
+MY_TARGET_COMPLETED = "\n✅ *Completed at:* {}".format
+
+MY_TARGETS_HEADER = "📊 *Your Targets*\n"
+MY_TARGETS_ROW = "{} *{}*\n   📝 {}\n".format
+
+BOT_STATUS = (
+    "🤖 *Bot Status*\n\n"
+    "{group_info}\n\n"
+    "📊 *Today's Statistics:*\n"
+    "   • Total Targets: {total}\n"
+    "   • Completed: {completed}\n"
+    "   • Pending: {pending}\n\n"
+    "💾 *Database:* Connected\n"
+    "🗂 *Group Cache:* {hits} hits / {misses} misses\n"
+    "⚙️ *Bot Mode:* Testing"
+).format
+GROUP_AUTHORIZED = "✅ *Authorized Group:* {} (ID: {})".format
+GROUP_NOT_AUTHORIZED = "⚠️ *No group authorized yet*"
+
+@lru_cache(maxsize=4096)
+def escape(text) -> str:
+    """Escape user-supplied text for Telegram's Markdown parse mode."""
+    return _MARKDOWN_SPECIAL.sub(r"\\\1", str(text))
+
+@lru_cache(maxsize=1024)
+def format_day_key(day_key: int) -> str:
+    """Render a YYYYMMDD day key as YYYY-MM-DD."""
+    return f"{day_key // 10000:04d}-{day_key // 100 % 100:02d}-{day_key % 100:02d}"
+
+def format_time(value) -> str:
+    """HH:MM of a datetime, or "N/A"."""
+    if isinstance(value, datetime):
+        return f"{value.hour:02d}:{value.minute:02d}"
+    return "N/A"
+
+def render_today(targets: List[Dict]) -> str:
+    """The /today list: pending and completed targets plus progress."""
+    if not targets:
+        return TODAY_EMPTY
+    
+    pending = [t for t in targets if not t.get("completed")]
+    completed = [t for t in targets if t.get("completed")]
+    
+    lines = [TODAY_HEADER]
+    if pending:
+        lines.append(PENDING_HEADER)
+        lines.extend(
+            PENDING_ROW(i, escape(t["username"]), escape(t["target"]))
+            for i, t in enumerate(pending, 1)
+        )
+        lines.append("")
+    if completed:
+        lines.append(COMPLETED_HEADER)
+        lines.extend(
+            COMPLETED_ROW(i, escape(t["username"]), escape(t["target"]), format_time(t.get("completed_at")))
+            for i, t in enumerate(completed, 1)
+        )
+    
+    total = len(targets)
+    lines.append("")
+    lines.append(PROGRESS(len(completed), total, len(completed) * 100 // total))
+    return "\n".join(lines)
+
+def render_my_target(target: Dict) -> str:
+    """A user's target for today."""
+    message = MY_TARGET(
+        target=escape(target["target"]),
+        date=format_day_key(target["day_key"]),
+        status="✅ Completed" if target.get("completed") else "⏳ Pending",
+        added=format_time(target.get("created_at")),
+    )
+    if target.get("completed_at"):
+        message += MY_TARGET_COMPLETED(format_time(target["completed_at"]))
+    return message
+
+def render_my_targets(targets: Iterable[Dict]) -> str:
+    """One page of a user's target history."""
+    lines = [MY_TARGETS_HEADER]
+    lines.extend(
+        MY_TARGETS_ROW(
+            "✅" if t.get("completed") else "⏳", format_day_key(t["day_key"]), escape(t["target"])
+        )
+        for t in targets
+    )
+    return "\n".join(lines)
+
+def render_bot_status(group: Optional[Dict], snapshot, cache_stats: Dict) -> str:
+    """The admin /status message."""
+    if group:
+        group_info = GROUP_AUTHORIZED(escape(group.get("group_name") or ""), group["group_id"])
+    else:
+        group_info = GROUP_NOT_AUTHORIZED
+    return BOT_STATUS(
+        group_info=group_info,
+        total=snapshot.total,
+        completed=snapshot.completed,
+        pending=snapshot.pending,
+        hits=cache_stats["hits"],
+        misses=cache_stats["misses"],
+    )
+
+def _length(text: str) -> int:
+    """Length as Telegram counts it, in UTF-16 code units."""
+    return len(text.encode("utf-16-le")) // 2
+
+def split_message(text: str, limit: int = MAX_MESSAGE_LENGTH) -> List[str]:
+    """Split ``text`` into chunks of at most ``limit`` characters.
+    
+    Chunks break between lines; a single line longer than ``limit`` is cut
+    (never right after an escaping backslash).
+    """
+    if _length(text) <= limit:
+        return [text]
+    
+    chunks = []
+    current = []
+    size = 0
+    for line in text.split("\n"):
+        line_size = _length(line)
+        while line_size > limit:
+            # Flush what we have, then cut the long line
+            if current:
+                chunks.append("\n".join(current))
+                current, size = [], 0
+            # Each character is one or two UTF-16 units, so dropping half
+            # the excess (rounded up) never overshoots by more than one
+            # unit, and a cut always keeps at least one character
+            cut = limit
+            excess = _length(line[:cut]) - limit
+            while excess > 0:
+                cut -= (excess + 1) // 2
+                excess = _length(line[:cut]) - limit
+            if cut > 1 and line[cut - 1] == "\\":
+                cut -= 1
+            chunks.append(line[:cut])
+            line = line[cut:]
+            line_size = _length(line)
+        # +1 for the newline joining it to the previous line
+        if current and size + 1 + line_size > limit:
+            chunks.append("\n".join(current))
+            current, size = [], 0
+        size += line_size + (1 if current else 0)
+        current.append(line)
+    if current:
+        chunks.append("\n".join(current))
+    return [chunk for chunk in chunks if chunk.strip()]
@@ -0,0 +1,227 @@
+import asyncio
+import logging
+import os
+from datetime import datetime, timedelta, timezone as dt_timezone
+from functools import partial
+from typing import Dict, Optional, Tuple
+
+from apscheduler.jobstores.mongodb import MongoDBJobStore
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from apscheduler.schedulers.base import STATE_PAUSED, STATE_RUNNING
+from apscheduler.triggers.cron import CronTrigger
+from pymongo import MongoClient
+from pymongo.errors import DuplicateKeyError, PyMongoError
+
+from src.archive import run_archival
+from src.changes import REPLICA_ID
+from src.clock import DEFAULT_TIMEZONE, get_zone
+from src.database import db
+from src.ratelimit import outgoing, send
+from src.render import escape
+
+DEFAULT_REMINDER_TIME = os.getenv("REMINDER_TIME", "08:00")
+DEFAULT_DIGEST_TIME = os.getenv("DIGEST_TIME", "21:00")
+# Each run is shifted by up to this many seconds so groups sharing a time
+# do not all send in the same instant
+SCHEDULE_JITTER = int(os.getenv("SCHEDULE_JITTER", "120"))
+# Daily archival of old targets, in DEFAULT_TIMEZONE; "off" disables it
+ARCHIVE_TIME = os.getenv("ARCHIVE_TIME", "03:30")
+# Jobs run only on the replica holding this lease; it is renewed every
+# third of its lifetime and taken over by another replica once it expires
+LEASE_TTL = float(os.getenv("SCHEDULER_LEASE_TTL", "30"))
+LEASE_COLLECTION = "leases"
+LEASE_ID = "scheduler"
+
+logger = logging.getLogger(__name__)
+
+scheduler: Optional[AsyncIOScheduler] = None
+_bot = None
+_lease_task: Optional[asyncio.Task] = None
+
+def parse_time(value: str) -> Tuple[int, int]:
+    """Parse "HH:MM" into (hour, minute); raises ValueError if invalid."""
+    parsed = datetime.strptime(value.strip(), "%H:%M")
+    return parsed.hour, parsed.minute
+
+async def send_morning_reminder(group_id: int):
+    """Job: remind a group to set today's targets."""
+    await outgoing.send(group_id, lambda: _bot.send_message(
+        group_id,
+        "☀️ *Good morning!*\n\nSet your target for today with /addtarget <your target>",
+        parse_mode="Markdown"
+    ))
+
+async def send_daily_digest(group_id: int):
+    """Job: post the end-of-day summary built from one aggregation."""
+    summary = await db.get_daily_summary(group_id)
+    
+    if not summary["total"]:
+        text = "🌙 *Daily Digest*\n\n📭 Nobody set a target today."
+    else:
+        percent = int(summary["completed"] / summary["total"] * 100)
+        lines = [
+            "🌙 *Daily Digest*",
+            "",
+            f"📊 *Progress:* {summary['completed']}/{summary['total']} completed ({percent}%)",
+        ]
+        if summary["completed_users"]:
+            lines.append("✅ " + ", ".join(f"@{escape(name)}" for name in summary["completed_users"]))
+        if summary["pending_users"]:
+            lines.append("⏳ " + ", ".join(f"@{escape(name)}" for name in summary["pending_users"]))
+        text = "\n".join(lines)
+    
+    await send(_bot, group_id, text, parse_mode="Markdown")
+
+async def archive_old_targets():
+    """Job: move old targets to the archive in bounded batches."""
+    await run_archival(db.db)
+
+def schedule_group(group_id: int, reminder_time: Optional[str], digest_time: Optional[str],
+                   timezone: str = None):
+    """Create, update or remove a group's reminder and digest jobs.
+    
+    Times are wall-clock times in the group's timezone. Job ids are derived
+    from the group id, so re-scheduling never creates duplicates. A job
+    whose trigger is unchanged is left alone so the next run time stored
+    in the job store (and any misfire) is kept.
+    
+    The job store is synchronous pymongo: call this from a worker thread
+    (see ``reschedule_group``), never from the event loop.
+    """
+    zone = get_zone(timezone or DEFAULT_TIMEZONE)
+    jobs = (
+        (f"reminder_{group_id}", "src.scheduler:send_morning_reminder", reminder_time),
+        (f"digest_{group_id}", "src.scheduler:send_daily_digest", digest_time),
+    )
+    for job_id, func, when in jobs:
+        existing = scheduler.get_job(job_id)
+        if when is None:
+            if existing:
+                scheduler.remove_job(job_id)
+            continue
+        
+        hour, minute = parse_time(when)
+        trigger = CronTrigger(hour=hour, minute=minute, jitter=SCHEDULE_JITTER, timezone=zone)
+        if existing and str(existing.trigger) == str(trigger) and str(existing.trigger.timezone) == str(zone):
+            continue
+        scheduler.add_job(func, trigger, args=[group_id], id=job_id, replace_existing=True)
+
+def schedule_group_from_settings(settings: Dict):
+    """Schedule a group's jobs from its group_settings document."""
+    schedule_group(
+        settings["group_id"],
+        settings.get("reminder_time", DEFAULT_REMINDER_TIME),
+        settings.get("digest_time", DEFAULT_DIGEST_TIME),
+        settings.get("timezone"),
+    )
+
+async def reschedule_group(group_id: int):
+    """Sync a group's jobs with its stored settings, off the event loop."""
+    if scheduler is None:
+        return
+    settings = {**await db.get_group_settings(group_id), "group_id": group_id}
+    await asyncio.get_running_loop().run_in_executor(None, schedule_group_from_settings, settings)
+
+async def unschedule_group(group_id: int):
+    """Remove a group's jobs, off the event loop."""
+    if scheduler is None:
+        return
+    await asyncio.get_running_loop().run_in_executor(None, schedule_group, group_id, None, None)
+
+async def _acquire_lease() -> bool:
+    """Take or renew the scheduler lease; False while another replica holds it."""
+    now = datetime.now(dt_timezone.utc)
+    try:
+        # Matches only a lease this replica holds or one that has expired;
+        # otherwise the upsert collides with the live lease's _id
+        await db.db[LEASE_COLLECTION].update_one(
+            {"_id": LEASE_ID, "$or": [{"holder": REPLICA_ID}, {"expires_at": {"$lt": now}}]},
+            {"$set": {"holder": REPLICA_ID, "expires_at": now + timedelta(seconds=LEASE_TTL)}},
+            upsert=True,
+        )
+        return True
+    except DuplicateKeyError:
+        return False
+
+async def _hold_lease():
+    """Run jobs while this replica holds the lease, pause them otherwise."""
+    while True:
+        try:
+            leader = await _acquire_lease()
+        except PyMongoError as e:
+            # The lease may lapse: pausing avoids two replicas running jobs
+            logger.warning("Scheduler lease renewal failed: %s", e)
+            leader = False
+        if leader and scheduler.state == STATE_PAUSED:
+            logger.info("Scheduler lease acquired by %s; running jobs", REPLICA_ID)
+            scheduler.resume()
+        elif not leader and scheduler.state == STATE_RUNNING:
+            logger.info("Scheduler lease held elsewhere; jobs paused on %s", REPLICA_ID)
+            scheduler.pause()
+        await asyncio.sleep(LEASE_TTL / 3)
+
+def _sync_jobs(group_settings):
+    """Bring every group's jobs and the archival job in line with the settings."""
+    for settings in group_settings:
+        schedule_group_from_settings(settings)
+    
+    if ARCHIVE_TIME.lower() == "off":
+        if scheduler.get_job("archive_targets"):
+            scheduler.remove_job("archive_targets")
+    else:
+        hour, minute = parse_time(ARCHIVE_TIME)
+        scheduler.add_job(
+            "src.scheduler:archive_old_targets",
+            CronTrigger(hour=hour, minute=minute, timezone=get_zone(DEFAULT_TIMEZONE)),
+            id="archive_targets",
+            replace_existing=True,
+        )
+
+async def start_scheduler(application):
+    """Start the scheduler in the bot's event loop and sync all group jobs.
+    
+    Every replica keeps the shared job store in sync with its own commands,
+    but the scheduler starts paused and only the replica holding the lease
+    runs jobs. Job-store calls run in a worker thread.
+    """
+    global scheduler, _bot, _lease_task
+    _bot = application.bot
+    loop = asyncio.get_running_loop()
+    
+    # Jobs are persisted so restarts neither duplicate nor drop them
+    jobstore = MongoDBJobStore(
+        database=db.db_name,
+        collection="scheduled_jobs",
+        client=MongoClient(db.mongo_uri, serverSelectionTimeoutMS=5000),
+    )
+    scheduler = AsyncIOScheduler(
+        event_loop=loop,
+        jobstores={"default": jobstore},
+        job_defaults={
+            # Runs missed while the bot was down fire once on restart
+            "coalesce": True,
+            "misfire_grace_time": int(os.getenv("SCHEDULE_MISFIRE_GRACE", "3600")),
+            "max_instances": 1,
+        },
+    )
+    # Starting opens the job store, which creates its index
+    await loop.run_in_executor(None, partial(scheduler.start, paused=True))
+    
+    group_settings = [settings async for settings in db.iter_group_settings()]
+    await loop.run_in_executor(None, _sync_jobs, group_settings)
+    
+    _lease_task = asyncio.create_task(_hold_lease())
+
+async def stop_scheduler():
+    """Stop running jobs and hand the lease over to the next replica."""
+    global _lease_task
+    if _lease_task:
+        _lease_task.cancel()
+        await asyncio.gather(_lease_task, return_exceptions=True)
+        _lease_task = None
+        try:
+            await db.db[LEASE_COLLECTION].delete_one({"_id": LEASE_ID, "holder": REPLICA_ID})
+        except PyMongoError as e:
+            logger.warning("Could not release the scheduler lease: %s", e)
+    if scheduler and scheduler.running:
+        scheduler.shutdown(wait=False)
@@ -0,0 +1,58 @@
+import logging
+import os
+import time
+from typing import Dict
+
+logger = logging.getLogger(__name__)
+
+# main.py imports this module first so the clock starts before the heavy
+# imports; anything else is imported where it is used
+
+# "fast": connect to MongoDB in the background while the bot starts
+# receiving updates; "eager": connect before the first update is fetched
+STARTUP_MODE = os.getenv("STARTUP_MODE", "fast").lower()
+# Longest an update waits for the first background connection attempt
+# before the bot answers "temporarily unavailable"
+STARTUP_DB_WAIT = float(os.getenv("STARTUP_DB_WAIT", "15"))
+
+
+class StartupTimer:
+    """Per-phase startup timings, measured from when main.py started importing.
+    
+    Phases are consecutive; ``record`` adds ones that overlap them (such
+    as the background MongoDB warm-up). The breakdown is logged and exported
+    to /metrics once the first update has been handled.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self._last = self.started
+        self.phases: Dict[str, float] = {}
+        self.first_update_at = None
+
+    def mark(self, phase: str):
+        """End ``phase`` now; it started where the previous one ended."""
+        now = time.perf_counter()
+        self.record(phase, now - self._last)
+        self._last = now
+
+    def record(self, phase: str, seconds: float):
+        from src.metrics import STARTUP_PHASE
+        self.phases[phase] = seconds
+        STARTUP_PHASE.labels(phase).set(seconds)
+
+    def first_update(self):
+        """Note the first update; later calls are no-ops."""
+        if self.first_update_at is not None:
+            return
+        self.first_update_at = time.perf_counter() - self.started
+        from src.metrics import TIME_TO_FIRST_UPDATE
+        TIME_TO_FIRST_UPDATE.set(self.first_update_at)
+        logger.info(
+            "Startup: %s; first update after %.0f ms",
+            ", ".join(f"{phase} {seconds * 1000:.0f} ms" for phase, seconds in self.phases.items()),
+            self.first_update_at * 1000,
+        )
+
+
+startup = StartupTimer()
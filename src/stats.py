@@ -0,0 +1,222 @@
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from pymongo import UpdateOne
+
+from src.clock import DEFAULT_TIMEZONE, clock, shift_day_key
+
+# Per-member rollups keep one flag per day for this many days
+ROLLUP_DAYS = 90
+LEADERBOARD_WINDOWS = (7, 30, 90)
+
+def _recent_days(cutoff: int) -> Dict:
+    """Expression keeping only the ``days`` entries on or after ``cutoff``.
+    
+    Map keys are day keys as strings; YYYYMMDD strings sort like the
+    integers they encode.
+    """
+    return {"$arrayToObject": {"$filter": {
+        "input": {"$objectToArray": {"$ifNull": ["$days", {}]}},
+        "as": "day",
+        "cond": {"$gte": ["$$day.k", str(cutoff)]},
+    }}}
+
+class StatsEngine:
+    """Leaderboards and streaks served from per-member rollup documents.
+
+    Each ``user_stats`` document holds a ``days`` map (day key -> 1 if the
+    target was completed, else 0; see src/clock.py for day keys) for the last ``ROLLUP_DAYS`` days plus
+    streak counters. Rollups are updated with pipeline updates on every
+    target write, so commands never scan the raw ``targets`` collection.
+    Given a ``WriteBehindQueue`` on ``user_stats``, those updates are
+    batched like the target writes they follow.
+    """
+
+    def __init__(self, db, writes=None):
+        self.collection = db.user_stats
+        self.writes = writes
+
+    async def _update(self, group_id: int, user_id: int, update: List[Dict]):
+        query = {"group_id": group_id, "user_id": user_id}
+        if self.writes:
+            await self.writes.submit((group_id, user_id), query, update, upsert=True)
+        else:
+            await self.collection.update_one(query, update, upsert=True)
+
+    async def record_target(self, group_id: int, user_id: int, username: str, day_key: int):
+        """A target was (re)set for ``day_key``: mark the day as not completed."""
+        cutoff = shift_day_key(day_key, -(ROLLUP_DAYS - 1))
+        await self._update(group_id, user_id, [{"$set": {
+            "username": {"$literal": username},
+            "days": {"$mergeObjects": [_recent_days(cutoff), {str(day_key): 0}]},
+        }}])
+
+    async def record_completion(self, group_id: int, user_id: int, day_key: int):
+        """A target was completed on ``day_key``: flag the day and extend the streak."""
+        today = day_key
+        yesterday = shift_day_key(day_key, -1)
+        cutoff = shift_day_key(day_key, -(ROLLUP_DAYS - 1))
+        current = {"$ifNull": ["$current_streak", 0]}
+        
+        await self._update(group_id, user_id, [
+            {"$set": {
+                "days": {"$mergeObjects": [_recent_days(cutoff), {str(today): 1}]},
+                # Expressions see the document as it was before this stage
+                "current_streak": {"$switch": {
+                    "branches": [
+                        {"case": {"$eq": ["$last_completed", today]}, "then": current},
+                        {"case": {"$eq": ["$last_completed", yesterday]}, "then": {"$add": [current, 1]}},
+                    ],
+                    "default": 1,
+                }},
+                "last_completed": today,
+            }},
+            {"$set": {
+                "longest_streak": {"$max": [{"$ifNull": ["$longest_streak", 0]}, "$current_streak"]},
+            }},
+        ])
+
+    async def leaderboard(self, group_id: int, today: int, window: int = 7, limit: int = 10) -> List[Dict]:
+        """Members ranked by completed days over the last ``window`` days."""
+        cutoff = shift_day_key(today, -(window - 1))
+        
+        pipeline = [
+            {"$match": {"group_id": group_id}},
+            {"$project": {
+                "_id": 0,
+                "user_id": 1,
+                "username": 1,
+                "completed": {"$sum": {"$map": {
+                    "input": {"$objectToArray": _recent_days(cutoff)},
+                    "as": "day",
+                    "in": "$$day.v",
+                }}},
+            }},
+            {"$match": {"completed": {"$gt": 0}}},
+            {"$addFields": {"rate": {"$divide": ["$completed", window]}}},
+            {"$sort": {"completed": -1, "username": 1}},
+            {"$limit": limit},
+        ]
+        return await self.collection.aggregate(pipeline).to_list(length=limit)
+
+    async def streak(self, group_id: int, user_id: int, today: int) -> Dict[str, int]:
+        """Current and longest streak; a streak ends once a day is missed."""
+        doc = await self.collection.find_one(
+            {"group_id": group_id, "user_id": user_id},
+            {"_id": 0, "current_streak": 1, "longest_streak": 1, "last_completed": 1}
+        ) or {}
+        
+        alive = doc.get("last_completed", 0) >= shift_day_key(today, -1)
+        return {
+            "current": doc.get("current_streak", 0) if alive else 0,
+            "longest": doc.get("longest_streak", 0),
+        }
+
+
+def summarize_days(days: Dict[int, bool], today: int) -> Dict:
+    """A member's rollup fields from their full day -> completed history.
+    
+    Matches what ``record_target``/``record_completion`` would have built
+    had the member's targets been written one by one.
+    """
+    cutoff = shift_day_key(today, -(ROLLUP_DAYS - 1))
+    current = longest = 0
+    last_completed = None
+    for day_key in sorted(day for day, completed in days.items() if completed):
+        if last_completed is not None and shift_day_key(last_completed, 1) == day_key:
+            current += 1
+        else:
+            current = 1
+        longest = max(longest, current)
+        last_completed = day_key
+    
+    fields = {
+        "days": {str(day_key): int(completed) for day_key, completed in days.items() if day_key >= cutoff},
+        "current_streak": current,
+        "longest_streak": longest,
+    }
+    if last_completed is not None:
+        fields["last_completed"] = last_completed
+    return fields
+
+async def _member_days(docs: AsyncIterator[Dict], entries_of) -> AsyncIterator[Tuple[Tuple[int, int], Optional[str], Dict[int, bool]]]:
+    """Group a cursor sorted by (group_id, user_id) into one history per member."""
+    key, username, days = None, None, {}
+    async for doc in docs:
+        doc_key = (doc["group_id"], doc["user_id"])
+        if doc_key != key:
+            if key is not None:
+                yield key, username, days
+            key, username, days = doc_key, None, {}
+        username = doc.get("username") or username
+        for day_key, completed in entries_of(doc):
+            days[day_key] = bool(completed)
+    if key is not None:
+        yield key, username, days
+
+async def _merged(first, second):
+    """Merge two member-history streams sorted by key; ``second`` wins on username."""
+    async def pull(stream):
+        try:
+            return await stream.__anext__()
+        except StopAsyncIteration:
+            return None
+    
+    a, b = await pull(first), await pull(second)
+    while a is not None or b is not None:
+        if b is None or (a is not None and a[0] < b[0]):
+            yield a
+            a = await pull(first)
+        elif a is None or b[0] < a[0]:
+            yield b
+            b = await pull(second)
+        else:
+            yield a[0], b[1] or a[1], {**a[2], **b[2]}
+            a, b = await pull(first), await pull(second)
+
+async def rebuild_stats(db, group_id: int = None, today: int = None, batch_size: int = 500) -> int:
+    """Rebuild ``user_stats`` from ``targets`` and the archive; returns members written.
+    
+    Both tiers are streamed in (group_id, user_id) order, which their
+    unique indexes serve, and rollups are upserted in unordered batches,
+    so memory stays bounded by one member's history and one batch.
+    """
+    # Imported here: src.archive imports this module
+    from src.archive import ARCHIVE_COLLECTION
+    
+    if today is None:
+        today = clock.today(DEFAULT_TIMEZONE)
+    query = {"group_id": group_id} if group_id is not None else {}
+    
+    # As a migration this may run before the indexes are built: let the
+    # server sort on disk if it has to
+    targets = db.targets.find(
+        query, {"_id": 0, "group_id": 1, "user_id": 1, "username": 1, "day_key": 1, "completed": 1},
+        allow_disk_use=True
+    ).sort([("group_id", 1), ("user_id", 1), ("day_key", 1)])
+    archive = db[ARCHIVE_COLLECTION].find(query, {"_id": 0}, allow_disk_use=True).sort(
+        [("group_id", 1), ("user_id", 1), ("month", 1)]
+    )
+    
+    members = _merged(
+        _member_days(archive, lambda bucket: (
+            (int(day_key), entry.get("completed")) for day_key, entry in bucket.get("entries", {}).items()
+        )),
+        _member_days(targets, lambda doc: [(doc["day_key"], doc.get("completed"))]),
+    )
+    
+    written = 0
+    operations = []
+    async for (member_group, user_id), username, days in members:
+        fields = summarize_days(days, today)
+        update = {"$set": {"username": username, **fields}}
+        if "last_completed" not in fields:
+            update["$unset"] = {"last_completed": ""}
+        operations.append(UpdateOne({"group_id": member_group, "user_id": user_id}, update, upsert=True))
+        if len(operations) >= batch_size:
+            await db.user_stats.bulk_write(operations, ordered=False)
+            written += len(operations)
+            operations = []
+    if operations:
+        await db.user_stats.bulk_write(operations, ordered=False)
+        written += len(operations)
+    return written
@@ -0,0 +1,241 @@
+"""Bulk export and import of targets.
+
+Streams targets out of MongoDB as NDJSON or CSV through a batched cursor,
+and back in with batched, unordered ``bulk_write`` upserts keyed on
+(group_id, user_id, day_key). Memory use is bounded by the batch size
+whatever the collection size, and progress is reported on stderr.
+
+Imported targets are written as-is; pass ``--rebuild-stats`` to rebuild
+the stats rollups in ``user_stats`` from them afterwards.
+
+Usage:
+    python -m src.targets_io export --format ndjson --output targets.ndjson
+    python -m src.targets_io export --format csv --group -1001234567890 --archive > targets.csv
+    python -m src.targets_io import --input targets.ndjson --rebuild-stats
+"""
+import argparse
+import asyncio
+import csv
+import json
+import sys
+import time
+from datetime import datetime
+from typing import Dict, Iterable, Iterator
+
+from dotenv import load_dotenv
+from pymongo import UpdateOne
+from pymongo.errors import PyMongoError
+
+from src.archive import ARCHIVE_COLLECTION
+from src.clock import date_from_day_key
+from src.stats import rebuild_stats
+
+# Columns of an exported target, in CSV order
+FIELDS = ("group_id", "user_id", "username", "day_key", "target", "completed", "created_at", "completed_at")
+_INT_FIELDS = ("group_id", "user_id", "day_key")
+_DATETIME_FIELDS = ("created_at", "completed_at")
+
+PROGRESS_INTERVAL = 5.0
+
+
+class Progress:
+    """Counts records and reports throughput on stderr every few seconds."""
+
+    def __init__(self, verb: str):
+        self.verb = verb
+        self.count = 0
+        self.started = time.monotonic()
+        self._reported = self.started
+
+    def add(self, count: int):
+        self.count += count
+        now = time.monotonic()
+        if now - self._reported >= PROGRESS_INTERVAL:
+            self._reported = now
+            self.report()
+
+    def report(self):
+        elapsed = max(time.monotonic() - self.started, 1e-9)
+        print(f"{self.verb} {self.count} targets ({self.count / elapsed:.0f}/s)", file=sys.stderr)
+
+
+def to_record(doc: Dict) -> Dict:
+    """A target document as a flat, JSON-safe record."""
+    record = {field: doc.get(field) for field in FIELDS}
+    record["completed"] = bool(record["completed"])
+    for field in _DATETIME_FIELDS:
+        if isinstance(record[field], datetime):
+            record[field] = record[field].isoformat()
+    return record
+
+def from_record(record: Dict) -> Dict:
+    """Parse an exported record (NDJSON or CSV strings) back into target fields."""
+    doc = {field: record.get(field) for field in FIELDS}
+    for field in _INT_FIELDS:
+        doc[field] = int(doc[field])
+    completed = doc["completed"]
+    if isinstance(completed, str):
+        completed = completed.strip().lower() in ("1", "true", "yes")
+    doc["completed"] = bool(completed)
+    # CSV has no null: empty cells are missing values
+    doc["username"] = doc["username"] or None
+    for field in _DATETIME_FIELDS:
+        doc[field] = datetime.fromisoformat(doc[field]) if doc[field] else None
+    doc["date"] = date_from_day_key(doc["day_key"])
+    return doc
+
+def read_records(stream, fmt: str) -> Iterator[Dict]:
+    """Lazily yield records from an NDJSON or CSV stream."""
+    if fmt == "csv":
+        yield from csv.DictReader(stream)
+        return
+    for line in stream:
+        if line.strip():
+            yield json.loads(line)
+
+def batched(items: Iterable, size: int) -> Iterator[list]:
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+async def export_targets(database, output, fmt: str, group_id: int = None,
+                         include_archive: bool = False, batch_size: int = 1000) -> int:
+    """Write targets to ``output``, one record per line; returns the count."""
+    query = {"group_id": group_id} if group_id is not None else {}
+    progress = Progress("Exported")
+
+    if fmt == "csv":
+        writer = csv.DictWriter(output, fieldnames=FIELDS)
+        writer.writeheader()
+        write = writer.writerow
+    else:
+        def write(record):
+            output.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    projection = {"_id": 0, **{field: 1 for field in FIELDS}}
+    async for doc in database.targets.find(query, projection, batch_size=batch_size):
+        write(to_record(doc))
+        progress.add(1)
+
+    if include_archive:
+        async for bucket in database[ARCHIVE_COLLECTION].find(query, {"_id": 0}, batch_size=batch_size):
+            for key, entry in bucket.get("entries", {}).items():
+                write(to_record({
+                    **entry,
+                    "group_id": bucket["group_id"],
+                    "user_id": bucket["user_id"],
+                    "username": bucket.get("username"),
+                    "day_key": int(key),
+                }))
+                progress.add(1)
+
+    progress.report()
+    return progress.count
+
+async def import_targets(database, stream, fmt: str, batch_size: int = 1000, concurrency: int = 4) -> int:
+    """Upsert targets read from ``stream``; returns the count.
+
+    Up to ``concurrency`` batches are written at once while the next ones
+    are parsed, so neither parsing nor the round trips sit idle. If a
+    batch fails, reading stops and its error is raised once the batches
+    in flight finish.
+    """
+    progress = Progress("Imported")
+    slots = asyncio.Semaphore(concurrency)
+    pending = set()
+    failures = []
+
+    async def write(operations):
+        try:
+            await database.targets.bulk_write(operations, ordered=False)
+            progress.add(len(operations))
+        except Exception as e:
+            failures.append(e)
+        finally:
+            slots.release()
+
+    for records in batched(read_records(stream, fmt), batch_size):
+        operations = []
+        for record in records:
+            doc = from_record(record)
+            key = {"group_id": doc["group_id"], "user_id": doc["user_id"], "day_key": doc["day_key"]}
+            operations.append(UpdateOne(key, {"$set": doc}, upsert=True))
+        await slots.acquire()
+        # Stop once a batch has failed; the import is incomplete anyway
+        if failures:
+            slots.release()
+            break
+        task = asyncio.create_task(write(operations))
+        pending.add(task)
+        task.add_done_callback(pending.discard)
+
+    await asyncio.gather(*pending)
+    progress.report()
+    # Finished batches drop out of ``pending``, so failures are kept apart
+    if failures:
+        raise failures[0]
+    return progress.count
+
+
+async def run(args) -> int:
+    from src.database import db
+    from src.log import setup_logging
+
+    setup_logging()
+    if not await db.connect():
+        return 1
+    try:
+        if args.command == "export":
+            output = open(args.output, "w", newline="", encoding="utf-8") if args.output else sys.stdout
+            try:
+                await export_targets(db.db, output, args.format, args.group, args.archive, args.batch_size)
+            finally:
+                if args.output:
+                    output.close()
+        else:
+            stream = open(args.input, newline="", encoding="utf-8") if args.input else sys.stdin
+            try:
+                await import_targets(db.db, stream, args.format, args.batch_size, args.concurrency)
+            except PyMongoError as e:
+                print(f"Import failed: {e}", file=sys.stderr)
+                return 1
+            finally:
+                if args.input:
+                    stream.close()
+            if args.rebuild_stats:
+                rebuilt = await rebuild_stats(db.db, batch_size=args.batch_size)
+                print(f"Rebuilt stats for {rebuilt} members", file=sys.stderr)
+    finally:
+        await db.close()
+    return 0
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    export = commands.add_parser("export", help="stream targets out of MongoDB")
+    export.add_argument("--output", help="file to write (default: stdout)")
+    export.add_argument("--group", type=int, help="only this group's targets")
+    export.add_argument("--archive", action="store_true", help="include archived targets")
+
+    load = commands.add_parser("import", help="upsert targets into MongoDB")
+    load.add_argument("--input", help="file to read (default: stdin)")
+    load.add_argument("--concurrency", type=int, default=4, help="batches written at once")
+    load.add_argument("--rebuild-stats", action="store_true", help="rebuild user_stats from all targets afterwards")
+
+    for command in (export, load):
+        command.add_argument("--format", choices=("ndjson", "csv"), default="ndjson")
+        command.add_argument("--batch-size", type=int, default=1000)
+
+    sys.exit(asyncio.run(run(parser.parse_args())))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+import logging
+import os
+import re
+import time
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_REPLY = "🎯 Don't forget to set your daily target with /addtarget !"
+
+# Used for groups without a ``triggers`` list in group_settings
+DEFAULT_RULES = [
+    {"type": "keyword", "pattern": word, "reply": DEFAULT_REPLY}
+    for word in ("target", "targets", "goal", "goals", "task", "tasks", "todo", "todos")
+]
+
+class CompiledTriggers:
+    """A group's trigger rules compiled into one case-insensitive regex.
+
+    Keywords sharing a reply become one alternation wrapped in word
+    boundaries; each regex rule gets its own named group. A single
+    ``search`` tells which rule fired via ``lastgroup``.
+
+    Rules are dicts: ``{"type": "keyword"|"regex", "pattern": str, "reply": str}``.
+    Regex rules must not use capturing groups (use ``(?:...)``) or global
+    inline flags such as ``(?i)``. Rules that cannot be compiled are left
+    out and listed in ``skipped``; the others keep working.
+    """
+
+    def __init__(self, rules: Iterable[Dict]):
+        keywords: Dict[str, List[str]] = {}
+        regexes: List[Tuple[str, str]] = []
+        self.skipped: List[str] = []
+        
+        for rule in rules:
+            pattern = rule.get("pattern")
+            reply = rule.get("reply") or DEFAULT_REPLY
+            if not pattern:
+                continue
+            if rule.get("type", "keyword") == "regex":
+                if self._valid_regex(pattern):
+                    regexes.append((pattern, reply))
+                else:
+                    logger.warning("Skipping invalid trigger regex: %r", pattern)
+                    self.skipped.append(pattern)
+            else:
+                keywords.setdefault(reply, []).append(pattern)
+        
+        # (group name, alternative, source regex or None for keywords)
+        alternatives: List[Tuple[str, str, Optional[str]]] = []
+        self.replies: Dict[str, str] = {}
+        for reply, words in keywords.items():
+            # Longest first so "todos" wins over "todo"
+            words = sorted(set(words), key=len, reverse=True)
+            name = f"r{len(self.replies)}"
+            alternatives.append((name, r"(?<!\w)(?:" + "|".join(re.escape(word) for word in words) + r")(?!\w)", None))
+            self.replies[name] = reply
+        for pattern, reply in regexes:
+            name = f"r{len(self.replies)}"
+            alternatives.append((name, f"(?:{pattern})", pattern))
+            self.replies[name] = reply
+        
+        self.pattern = self._compile_all(alternatives)
+
+    @staticmethod
+    def _valid_regex(pattern: str) -> bool:
+        try:
+            # Wrapped as in the combined pattern, which also rejects global
+            # flags: they are only allowed at the very start of a pattern
+            return re.compile(f"(?:{pattern})").groups == 0
+        except re.error:
+            return False
+
+    @staticmethod
+    def _combine(alternatives) -> re.Pattern:
+        return re.compile("|".join(f"(?P<{name}>{alt})" for name, alt, _ in alternatives), re.IGNORECASE)
+
+    def _compile_all(self, alternatives) -> Optional[re.Pattern]:
+        """Compile the combined pattern, dropping regex rules that break it."""
+        if not alternatives:
+            return None
+        try:
+            return self._combine(alternatives)
+        except re.error as e:
+            logger.warning("Trigger rules do not compile together (%s); skipping the ones at fault", e)
+        
+        # Keywords are escaped and always compile, so they come through
+        kept = []
+        for alternative in alternatives:
+            try:
+                self._combine(kept + [alternative])
+            except re.error:
+                self.skipped.append(alternative[2])
+                continue
+            kept.append(alternative)
+        return self._combine(kept) if kept else None
+
+    def match(self, text: str) -> Optional[str]:
+        """Return the reply of the first rule matching ``text``, if any."""
+        if self.pattern is None or not text:
+            return None
+        found = self.pattern.search(text)
+        return self.replies[found.lastgroup] if found else None
+
+
+class TriggerEngine:
+    """Per-group compiled triggers, reloaded from group_settings.
+
+    Compiled rules are kept for ``ttl`` seconds, or until ``invalidate`` is
+    called, so edits to a group's ``triggers`` are picked up without a
+    restart. Groups without custom rules share one compiled default.
+    """
+
+    def __init__(self, ttl: float = None):
+        if ttl is None:
+            ttl = float(os.getenv("TRIGGER_RELOAD_TTL", "60"))
+        self.ttl = ttl
+        self.default = CompiledTriggers(DEFAULT_RULES)
+        self._compiled: Dict[int, Tuple[float, CompiledTriggers]] = {}
+
+    async def match(self, group_id: int, text: str,
+                    load_rules: Callable[[int], Awaitable[Optional[List[Dict]]]]) -> Optional[str]:
+        entry = self._compiled.get(group_id)
+        if entry is None or time.monotonic() >= entry[0]:
+            rules = await load_rules(group_id)
+            compiled = CompiledTriggers(rules) if rules is not None else self.default
+            entry = self._compiled[group_id] = (time.monotonic() + self.ttl, compiled)
+        return entry[1].match(text)
+
+    def invalidate(self, group_id: int = None):
+        if group_id is None:
+            self._compiled.clear()
+        else:
+            self._compiled.pop(group_id, None)
+
+
+triggers = TriggerEngine()
@@ -1,6 +1,22 @@
+import logging
+import os
+
 from telegram import Update
+from telegram.constants import ChatMemberStatus
 from telegram.ext import ContextTypes
-from datetime import datetime
+
+from src.cache import AdminCache
+from src.render import render_today
+
+logger = logging.getLogger(__name__)
+
+ADMIN_STATUSES = (ChatMemberStatus.ADMINISTRATOR, ChatMemberStatus.OWNER)
+
+# Users allowed to authorize new groups by sending /start in them
+BOT_OWNER_IDS = frozenset(int(value) for value in os.getenv("BOT_OWNER_IDS", "").split(",") if value.strip())
+
+# Shared across handlers; invalidated by track_admin_changes
+admin_cache = AdminCache()
 
 async def is_admin(update: Update, context: ContextTypes.DEFAULT_TYPE) -> bool:
     """Check if the user is an admin in the chat."""
@@ -11,53 +27,26 @@ async def is_admin(update: Update, context: ContextTypes.DEFAULT_TYPE) -> bool:
         user_id = update.message.from_user.id
         chat_id = update.message.chat.id
         
-        # Get chat administrators
-        admins = await context.bot.get_chat_administrators(chat_id)
+        async def fetch_admin_ids():
+            admins = await context.bot.get_chat_administrators(chat_id)
+            return [admin.user.id for admin in admins]
+        
+        # Get chat administrators (cached per chat)
+        admin_ids = await admin_cache.get(chat_id, fetch_admin_ids)
         
         # Check if user is in admin list
-        return any(admin.user.id == user_id for admin in admins)
+        return user_id in admin_ids
     except Exception as e:
-        print(f"Error checking admin status: {e}")
+        logger.warning("Error checking admin status: %s", e)
         return False
 
+def is_owner(user_id: int) -> bool:
+    """Check if the user may authorize new groups (BOT_OWNER_IDS)."""
+    return user_id in BOT_OWNER_IDS
+
 def format_targets_message(targets) -> str:
     """Format targets list into a readable message."""
-    if not targets:
-        return "📭 No targets set for today!"
-    
-    message = "🎯 *Today's Targets*\n\n"
-    
-    completed = []
-    pending = []
-    
-    for target in targets:
-        if target.get("completed"):
-            completed.append(target)
-        else:
-            pending.append(target)
-    
-    if pending:
-        message += "⏳ *Pending:*\n"
-        for i, target in enumerate(pending, 1):
-            message += f"{i}. @{target['username']}: {target['target']}\n"
-        message += "\n"
-    
-    if completed:
-        message += "✅ *Completed:*\n"
-        for i, target in enumerate(completed, 1):
-            completion_time = target.get('completed_at', datetime.now())
-            if isinstance(completion_time, datetime):
-                time_str = completion_time.strftime("%H:%M")
-            else:
-                time_str = "N/A"
-            message += f"{i}. @{target['username']}: {target['target']} ({time_str})\n"
-    
-    total = len(targets)
-    completed_count = len(completed)
-    
-    message += f"\n📊 *Progress:* {completed_count}/{total} completed ({int(completed_count/total*100 if total > 0 else 0)}%)"
-    
-    return message
+    return render_today(targets)
 
 def validate_target_text(text: str, max_length: int = 500) -> tuple[bool, str]:
     """Validate target text."""
@@ -0,0 +1,154 @@
+import asyncio
+import hmac
+import logging
+import os
+import signal
+
+from aiohttp import web
+from telegram import Update
+from telegram.ext import Application
+
+from src.database import db
+from src.metrics import render_metrics
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+async def webhook(request: web.Request) -> web.Response:
+    """Receive an update from Telegram and hand it to the Application."""
+    application: Application = request.app["bot_app"]
+    secret_token = request.app["secret_token"]
+    
+    received = request.headers.get(SECRET_HEADER, "")
+    if not hmac.compare_digest(received, secret_token):
+        return web.Response(status=403)
+    
+    try:
+        data = await request.json()
+    except ValueError:
+        return web.Response(status=400)
+    
+    # Acknowledge immediately; handlers run from the update queue
+    await application.update_queue.put(Update.de_json(data, application.bot))
+    return web.Response()
+
+async def health(request: web.Request) -> web.Response:
+    """Liveness: the bot is running. Mongo state is reported but not required."""
+    application: Application = request.app["bot_app"]
+    mongo_ok = await db.ping()
+    
+    body = {
+        "status": "ok" if application.running else "down",
+        "bot": application.running,
+        "mongo": mongo_ok,
+    }
+    return web.json_response(body, status=200 if application.running else 503)
+
+async def ready(request: web.Request) -> web.Response:
+    """Readiness: the bot is running and MongoDB answers a ping."""
+    application: Application = request.app["bot_app"]
+    mongo_ok = await db.ping()
+    bot_ok = application.running
+    
+    body = {
+        "status": "ready" if bot_ok and mongo_ok else "not_ready",
+        "bot": bot_ok,
+        "mongo": mongo_ok,
+        "mode": request.app["mode"],
+    }
+    return web.json_response(body, status=200 if bot_ok and mongo_ok else 503)
+
+async def metrics(request: web.Request) -> web.Response:
+    """Prometheus scrape endpoint; requires ``Authorization: Bearer <METRICS_TOKEN>``."""
+    expected = "Bearer " + request.app["metrics_token"]
+    if not hmac.compare_digest(request.headers.get("Authorization", ""), expected):
+        return web.Response(status=401)
+    body, content_type = render_metrics()
+    # aiohttp wants the charset separately from the media type
+    return web.Response(body=body, headers={"Content-Type": content_type})
+
+def create_web_app(application: Application, mode: str, webhook_path: str = None, secret_token: str = None,
+                   metrics_token: str = None) -> web.Application:
+    """Build the aiohttp app serving the webhook, health and metrics endpoints.
+    
+    This server is public, so /metrics is only served when a
+    ``metrics_token`` is set; otherwise use METRICS_PORT.
+    """
+    app = web.Application()
+    app["bot_app"] = application
+    app["mode"] = mode
+    app["secret_token"] = secret_token
+    app["metrics_token"] = metrics_token
+    
+    app.router.add_get("/health", health)
+    app.router.add_get("/ready", ready)
+    if metrics_token:
+        app.router.add_get("/metrics", metrics)
+    if mode == "webhook":
+        app.router.add_post(webhook_path, webhook)
+    
+    return app
+
+async def run_server(application: Application, mode: str):
+    """Run the bot in webhook or polling mode alongside the HTTP server.
+    
+    Mirrors the start/stop sequence of ``Application.run_polling`` so the
+    ``post_init``/``post_stop``/``post_shutdown`` hooks still run.
+    """
+    host = os.getenv("HOST", "0.0.0.0")
+    port = int(os.getenv("PORT", "8080"))
+    webhook_path = os.getenv("WEBHOOK_PATH", "/telegram")
+    secret_token = None
+    
+    if mode == "webhook":
+        webhook_url = os.getenv("WEBHOOK_URL") or os.getenv("RENDER_EXTERNAL_URL")
+        secret_token = os.getenv("WEBHOOK_SECRET")
+        if not webhook_url:
+            raise ValueError("WEBHOOK_URL environment variable is required in webhook mode!")
+        if not secret_token:
+            raise ValueError("WEBHOOK_SECRET environment variable is required in webhook mode!")
+    
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop_event.set)
+    
+    runner = web.AppRunner(create_web_app(
+        application, mode, webhook_path, secret_token, os.getenv("METRICS_TOKEN")
+    ))
+    
+    await application.initialize()
+    if application.post_init:
+        await application.post_init(application)
+    
+    try:
+        await application.start()
+        
+        # Listen before registering the webhook, so Telegram's first
+        # deliveries find the server up
+        await runner.setup()
+        await web.TCPSite(runner, host, port).start()
+        logger.info("Serving %s mode on %s:%s", mode, host, port)
+        
+        if mode == "webhook":
+            await application.bot.set_webhook(
+                url=webhook_url.rstrip("/") + webhook_path,
+                secret_token=secret_token,
+                allowed_updates=Update.ALL_TYPES,
+            )
+        else:
+            await application.updater.start_polling(allowed_updates=Update.ALL_TYPES)
+        
+        await stop_event.wait()
+    finally:
+        await runner.cleanup()
+        if application.updater and application.updater.running:
+            await application.updater.stop()
+        if application.running:
+            await application.stop()
+            if application.post_stop:
+                await application.post_stop(application)
+        await application.shutdown()
+        if application.post_shutdown:
+            await application.post_shutdown(application)
@@ -0,0 +1,130 @@
+import asyncio
+import os
+from typing import Dict, Hashable, List, NamedTuple
+
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+
+class _Write(NamedTuple):
+    key: Hashable
+    query: Dict
+    update: Dict
+    upsert: bool
+    future: asyncio.Future
+
+
+class WriteBehindQueue:
+    """Coalesces single-document updates into unordered ``bulk_write`` batches.
+
+    A batch is flushed once ``max_batch`` writes are pending or ``max_delay_ms``
+    after the first pending write, whichever comes first. Every caller awaits
+    the outcome of its own write, with the same meaning as a direct
+    ``update_one``: True if a document was matched or upserted. Writes
+    sharing a key never land in the same unordered batch, so their relative
+    order is preserved.
+    """
+
+    def __init__(self, collection, max_batch: int = None, max_delay_ms: float = None):
+        if max_batch is None:
+            max_batch = int(os.getenv("WRITE_BATCH_SIZE", "100"))
+        if max_delay_ms is None:
+            max_delay_ms = float(os.getenv("WRITE_BATCH_DELAY_MS", "5"))
+        self.collection = collection
+        self.max_batch = max_batch
+        self.max_delay = max_delay_ms / 1000
+        self._pending: List[_Write] = []
+        self._timer = None
+        self._flush_lock = asyncio.Lock()
+        self._tasks = set()
+        self.batches = 0
+        self.operations = 0
+
+    async def submit(self, key: Hashable, query: Dict, update: Dict, upsert: bool = False) -> bool:
+        """Queue an ``update_one`` and wait until it has been written.
+        
+        ``query`` must select the single document identified by ``key``.
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append(_Write(key, query, update, upsert, future))
+        
+        if len(self._pending) >= self.max_batch:
+            self._start_flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_delay, self._start_flush)
+        
+        return await future
+
+    def _start_flush(self):
+        task = asyncio.ensure_future(self.flush())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def flush(self):
+        """Write everything pending, one batch at a time."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        
+        async with self._flush_lock:
+            while self._pending:
+                await self._write(self._take_batch())
+
+    def _take_batch(self):
+        batch = []
+        keys = set()
+        for write in self._pending:
+            if len(batch) >= self.max_batch or write.key in keys:
+                break
+            keys.add(write.key)
+            batch.append(write)
+        del self._pending[:len(batch)]
+        return batch
+
+    async def _write(self, batch: List[_Write]):
+        failed = set()
+        try:
+            result = await self.collection.bulk_write(
+                [UpdateOne(write.query, write.update, upsert=write.upsert) for write in batch],
+                ordered=False
+            )
+            applied = result.matched_count + result.upserted_count
+        except BulkWriteError as e:
+            failed = {error["index"] for error in e.details.get("writeErrors", [])}
+            applied = e.details.get("nMatched", 0) + e.details.get("nUpserted", 0)
+        except Exception as e:
+            for write in batch:
+                if not write.future.done():
+                    write.future.set_exception(e)
+            return
+        finally:
+            self.batches += 1
+            self.operations += len(batch)
+        
+        succeeded = [index not in failed for index in range(len(batch))]
+        if applied < sum(succeeded):
+            # Some plain updates matched nothing (an upsert always matches or
+            # inserts). The counts are per batch, so look those up
+            unsure = [i for i, write in enumerate(batch) if succeeded[i] and not write.upsert]
+            try:
+                found = await asyncio.gather(*(
+                    self.collection.count_documents(batch[i].query, limit=1) for i in unsure
+                ))
+            except Exception as e:
+                for i in unsure:
+                    if not batch[i].future.done():
+                        batch[i].future.set_exception(e)
+                found = []
+            for i, count in zip(unsure, found):
+                succeeded[i] = count > 0
+        
+        for write, ok in zip(batch, succeeded):
+            if not write.future.done():
+                write.future.set_result(ok)
+
+    async def close(self):
+        """Flush pending writes; used on shutdown."""
+        await self.flush()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
@@ -0,0 +1,101 @@
+import asyncio
+
+from mongomock_motor import AsyncMongoMockClient
+
+from src.archive import ARCHIVE_COLLECTION, archive_batch, archive_cutoff, archived_targets, month_of, run_archival
+
+
+def make_db():
+    return AsyncMongoMockClient()["test"]
+
+
+async def seed(db, group_id, user_id, day_keys, completed=False):
+    await db.targets.insert_many([
+        {"group_id": group_id, "user_id": user_id, "username": "member", "day_key": day_key,
+         "target": f"target {day_key}", "completed": completed}
+        for day_key in day_keys
+    ])
+
+
+def test_month_of():
+    assert month_of(20240229) == 202402
+
+
+def test_archive_cutoff():
+    assert archive_cutoff(20240701) < 20240701
+
+
+def test_archive_batch_buckets_by_user_and_month():
+    async def scenario():
+        db = make_db()
+        await seed(db, 1, 10, [20240130, 20240131, 20240201, 20240301], completed=True)
+        await seed(db, 1, 11, [20240131])
+        
+        moved = await archive_batch(db, 1, cutoff=20240301)
+        assert moved == 4
+        # Only the day on or after the cutoff stays hot
+        assert [doc["day_key"] async for doc in db.targets.find()] == [20240301]
+        
+        buckets = {
+            (bucket["user_id"], bucket["month"]): bucket
+            async for bucket in db[ARCHIVE_COLLECTION].find()
+        }
+        assert set(buckets) == {(10, 202401), (10, 202402), (11, 202401)}
+        january = buckets[(10, 202401)]
+        assert sorted(january["entries"]) == ["20240130", "20240131"]
+        assert january["entries"]["20240130"] == {"target": "target 20240130", "completed": True}
+        assert january["username"] == "member"
+
+    asyncio.run(scenario())
+
+
+def test_archive_batch_is_idempotent():
+    async def scenario():
+        db = make_db()
+        await seed(db, 1, 10, [20240110])
+        await archive_batch(db, 1, cutoff=20240301)
+        # A batch interrupted before its delete is archived again
+        await seed(db, 1, 10, [20240110])
+        await archive_batch(db, 1, cutoff=20240301)
+        
+        assert await db[ARCHIVE_COLLECTION].count_documents({}) == 1
+        assert await db.targets.count_documents({}) == 0
+
+    asyncio.run(scenario())
+
+
+def test_run_archival_stops_after_max_batches():
+    async def scenario():
+        db = make_db()
+        for group_id in (1, 2, 3):
+            await db.group_settings.insert_one({"group_id": group_id})
+            await seed(db, group_id, 10, [20230101, 20231231])
+        
+        today = 20240701
+        # One batch per group: the third group waits for the next run
+        assert await run_archival(db, today=today, max_batches=2) == 4
+        assert await db.targets.count_documents({}) == 2
+        assert await run_archival(db, today=today, max_batches=2) == 2
+        assert await db.targets.count_documents({}) == 0
+
+    asyncio.run(scenario())
+
+
+def test_archived_targets_pages_like_targets():
+    async def scenario():
+        db = make_db()
+        await seed(db, 1, 10, [20240128, 20240129, 20240130, 20240131, 20240201, 20240202])
+        await archive_batch(db, 1, cutoff=20240301)
+        
+        newest = await archived_targets(db, 1, 10, limit=3)
+        assert [t["day_key"] for t in newest] == [20240202, 20240201, 20240131]
+        assert newest[0]["target"] == "target 20240202"
+        assert newest[0]["group_id"] == 1 and newest[0]["user_id"] == 10
+        
+        older = await archived_targets(db, 1, 10, limit=3, before=20240131)
+        assert [t["day_key"] for t in older] == [20240130, 20240129, 20240128]
+        
+        newer = await archived_targets(db, 1, 10, limit=2, after=20240130)
+        assert [t["day_key"] for t in newer] == [20240131, 20240201]
+
+    asyncio.run(scenario())
@@ -0,0 +1,152 @@
+import asyncio
+from datetime import datetime
+
+from src.cache import AdminCache, SnapshotCache
+
+GROUP_ID = -100
+DAY = 20240301
+
+
+def target(user_id: int, completed: bool = False):
+    return {"_id": f"t{user_id}", "group_id": GROUP_ID, "user_id": user_id, "day_key": DAY,
+            "target": f"target {user_id}", "completed": completed}
+
+
+class SlowFetch:
+    """A fetch that returns ``targets`` once released, counting its calls."""
+
+    def __init__(self, targets):
+        self.targets = targets
+        self.calls = 0
+        self.release = asyncio.Event()
+
+    async def __call__(self):
+        self.calls += 1
+        await self.release.wait()
+        return [dict(target) for target in self.targets]
+
+
+def test_concurrent_snapshot_loads_share_one_fetch():
+    async def scenario():
+        cache = SnapshotCache(ttl=60)
+        fetch = SlowFetch([target(1)])
+        loads = [asyncio.ensure_future(cache.load(GROUP_ID, DAY, fetch)) for _ in range(5)]
+        await asyncio.sleep(0)
+        fetch.release.set()
+        snapshots = await asyncio.gather(*loads)
+        assert fetch.calls == 1
+        assert all(snapshot is snapshots[0] for snapshot in snapshots)
+        assert await cache.load(GROUP_ID, DAY, fetch) is snapshots[0]
+
+    asyncio.run(scenario())
+
+
+def test_writes_during_a_snapshot_load_are_kept():
+    async def scenario():
+        cache = SnapshotCache(ttl=60)
+        # The query read before any of the writes below landed
+        fetch = SlowFetch([target(1), target(2)])
+        load = asyncio.ensure_future(cache.load(GROUP_ID, DAY, fetch))
+        await asyncio.sleep(0)
+        
+        cache.apply_upsert(GROUP_ID, DAY, target(3))
+        cache.mark_completed(GROUP_ID, 1, DAY, datetime(2024, 3, 1, 18))
+        cache.remove_target("t2")
+        # Another group's and another day's writes are not replayed here
+        cache.apply_upsert(GROUP_ID, DAY + 1, {**target(4), "day_key": DAY + 1})
+        fetch.release.set()
+        await load
+        
+        snapshot = await cache.load(GROUP_ID, DAY, fetch)
+        assert sorted(snapshot.targets) == [1, 3]
+        assert (snapshot.total, snapshot.completed) == (2, 1)
+        assert snapshot.targets[1]["completed_at"] == datetime(2024, 3, 1, 18)
+        assert fetch.calls == 1
+
+    asyncio.run(scenario())
+
+
+def test_invalidation_during_a_snapshot_load_is_not_cached():
+    async def scenario():
+        cache = SnapshotCache(ttl=60)
+        fetch = SlowFetch([target(1)])
+        load = asyncio.ensure_future(cache.load(GROUP_ID, DAY, fetch))
+        await asyncio.sleep(0)
+        cache.invalidate(GROUP_ID)
+        fetch.release.set()
+        # Callers waiting on the load still get its result
+        assert sorted((await load).targets) == [1]
+        assert cache.get(GROUP_ID, DAY) is None
+
+    asyncio.run(scenario())
+
+
+class SlowAdmins:
+    """An admin lookup that answers once released, counting its calls."""
+
+    def __init__(self, admin_ids=(1, 2), error: Exception = None):
+        self.admin_ids = admin_ids
+        self.error = error
+        self.calls = 0
+        self.release = asyncio.Event()
+
+    async def __call__(self):
+        self.calls += 1
+        await self.release.wait()
+        if self.error:
+            raise self.error
+        return list(self.admin_ids)
+
+
+def test_concurrent_admin_lookups_share_one_fetch():
+    async def scenario():
+        cache = AdminCache(ttl=60)
+        fetch = SlowAdmins()
+        lookups = [asyncio.ensure_future(cache.get(GROUP_ID, fetch)) for _ in range(5)]
+        await asyncio.sleep(0)
+        fetch.release.set()
+        assert await asyncio.gather(*lookups) == [frozenset({1, 2})] * 5
+        assert fetch.calls == 1
+        # Later lookups are served from the cache
+        assert await cache.get(GROUP_ID, fetch) == frozenset({1, 2})
+        assert fetch.calls == 1
+
+    asyncio.run(scenario())
+
+
+def test_admin_invalidation_during_fetch_is_not_cached():
+    async def scenario():
+        cache = AdminCache(ttl=60)
+        stale = SlowAdmins(admin_ids=(1,))
+        lookup = asyncio.ensure_future(cache.get(GROUP_ID, stale))
+        await asyncio.sleep(0)
+        cache.invalidate(GROUP_ID)
+        stale.release.set()
+        assert await lookup == frozenset({1})
+        
+        fresh = SlowAdmins(admin_ids=(1, 3))
+        fresh.release.set()
+        assert await cache.get(GROUP_ID, fresh) == frozenset({1, 3})
+        assert fresh.calls == 1
+
+    asyncio.run(scenario())
+
+
+def test_failed_admin_fetch_reaches_every_waiter():
+    async def scenario():
+        cache = AdminCache(ttl=60)
+        fetch = SlowAdmins(error=RuntimeError("Bot API down"))
+        lookups = [asyncio.ensure_future(cache.get(GROUP_ID, fetch)) for _ in range(3)]
+        await asyncio.sleep(0)
+        fetch.release.set()
+        results = await asyncio.gather(*lookups, return_exceptions=True)
+        assert all(isinstance(result, RuntimeError) for result in results)
+        assert fetch.calls == 1
+        assert cache._inflight == {}
+        
+        # The next lookup tries again
+        retry = SlowAdmins()
+        retry.release.set()
+        assert await cache.get(GROUP_ID, retry) == frozenset({1, 2})
+
+    asyncio.run(scenario())
@@ -0,0 +1,71 @@
+from datetime import datetime, timezone
+
+import pytest
+
+from src import clock as clock_module
+from src.clock import DayClock, date_from_day_key, day_key_from_date, shift_day_key
+
+
+class FrozenTime:
+    """Stands in for both ``datetime.now`` and ``time.time``."""
+
+    def __init__(self, instant: datetime):
+        self.instant = instant
+
+    def install(self, monkeypatch):
+        frozen = self
+
+        class FrozenDatetime(datetime):
+            @classmethod
+            def now(cls, tz=None):
+                return frozen.instant.astimezone(tz)
+
+        monkeypatch.setattr(clock_module, "datetime", FrozenDatetime)
+        monkeypatch.setattr(clock_module.time, "time", lambda: frozen.instant.timestamp())
+
+
+@pytest.fixture
+def frozen(monkeypatch):
+    frozen = FrozenTime(datetime(2024, 3, 9, 23, 59, 30, tzinfo=timezone.utc))
+    frozen.install(monkeypatch)
+    return frozen
+
+
+def test_day_key_helpers():
+    assert day_key_from_date(datetime(2024, 2, 29)) == 20240229
+    assert date_from_day_key(20240229) == datetime(2024, 2, 29)
+    assert shift_day_key(20240228, 1) == 20240229
+    assert shift_day_key(20240301, -1) == 20240229
+    assert shift_day_key(20231231, 1) == 20240101
+
+
+def test_today_rolls_over_at_local_midnight(frozen):
+    clock = DayClock()
+    assert clock.today("UTC") == 20240309
+    
+    frozen.instant = datetime(2024, 3, 9, 23, 59, 59, tzinfo=timezone.utc)
+    assert clock.today("UTC") == 20240309
+    
+    frozen.instant = datetime(2024, 3, 10, 0, 0, 0, tzinfo=timezone.utc)
+    assert clock.today("UTC") == 20240310
+
+
+def test_today_depends_on_timezone(frozen):
+    clock = DayClock()
+    # 23:59 UTC is already the next morning in Kolkata, still evening in New York
+    assert clock.today("Asia/Kolkata") == 20240310
+    assert clock.today("America/New_York") == 20240309
+
+
+def test_rollover_across_a_dst_change(frozen):
+    clock = DayClock()
+    # New York springs forward on 2024-03-10; that day has 23 hours
+    frozen.instant = datetime(2024, 3, 10, 12, 0, tzinfo=timezone.utc)
+    assert clock.today("America/New_York") == 20240310
+    
+    # 23:59 local (EDT, UTC-4) is still the 10th
+    frozen.instant = datetime(2024, 3, 11, 3, 59, tzinfo=timezone.utc)
+    assert clock.today("America/New_York") == 20240310
+    
+    frozen.instant = datetime(2024, 3, 11, 4, 0, tzinfo=timezone.utc)
+    assert clock.today("America/New_York") == 20240311
@@ -0,0 +1,192 @@
+import asyncio
+import re
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+import pytest
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from mongomock_motor import AsyncMongoMockClient
+from telegram import Chat, Message, Update, User
+
+from src import database as database_module, handlers, scheduler
+from src.archive import archive_batch, archive_cutoff
+from src.cache import GroupAuthCache
+from src.clock import DEFAULT_TIMEZONE, clock, date_from_day_key, shift_day_key
+from src.database import MongoDB
+from src.triggers import DEFAULT_RULES
+
+GROUP_ID = -100
+OTHER_GROUP_ID = -200
+
+
+@pytest.fixture
+def bot(monkeypatch):
+    """Handlers wired to an in-memory database, with replies captured."""
+    database = MongoDB()
+    database.client = AsyncMongoMockClient()
+    database.group_cache = GroupAuthCache(configured=[GROUP_ID])
+    replies = []
+
+    async def reply(message, text, **kwargs):
+        replies.append(text)
+
+    async def is_admin(update, context):
+        return True
+
+    # mongomock cannot create collections with storage options
+    monkeypatch.setattr(database_module, "ARCHIVE_COLLECTION_OPTIONS", {})
+    # mongomock cursors cannot explain()
+    monkeypatch.setenv("INDEX_SELF_CHECK", "false")
+    monkeypatch.setattr(handlers, "db", database)
+    monkeypatch.setattr(scheduler, "db", database)
+    monkeypatch.setattr(handlers, "reply", reply)
+    monkeypatch.setattr(handlers, "is_admin", is_admin)
+    return SimpleNamespace(db=database, replies=replies)
+
+
+def command(text: str, chat_id: int = GROUP_ID, user_id: int = 1):
+    """An update and context for ``text`` sent to a group."""
+    message = Message(
+        message_id=1,
+        date=datetime.now(timezone.utc),
+        chat=Chat(chat_id, Chat.SUPERGROUP),
+        from_user=User(user_id, "admin", False, username="admin"),
+        text=text,
+    )
+    return Update(1, message=message), SimpleNamespace(args=text.split()[1:])
+
+
+async def connect(bot):
+    assert await bot.db.connect()
+    # Groups configured in ALLOWED_GROUP_ID may never have sent /start
+    assert await bot.db.get_group_settings(GROUP_ID) == {}
+
+
+def test_schedule_without_settings_document(bot, monkeypatch):
+    async def scenario():
+        await connect(bot)
+        jobs = AsyncIOScheduler()
+        monkeypatch.setattr(scheduler, "scheduler", jobs)
+        
+        await handlers.set_schedule(*command("/schedule 08:30 off"))
+        assert bot.replies[-1].startswith("⏰ *Schedule updated!*")
+        settings = await bot.db.get_group_settings(GROUP_ID)
+        assert (settings["reminder_time"], settings["digest_time"]) == ("08:30", None)
+        assert jobs.get_job(f"reminder_{GROUP_ID}") is not None
+        assert jobs.get_job(f"digest_{GROUP_ID}") is None
+
+    asyncio.run(scenario())
+
+
+def test_admin_commands_refuse_unauthorized_groups(bot):
+    async def scenario():
+        await connect(bot)
+        # A registered group, so the first-group bootstrap no longer applies
+        await bot.db.set_allowed_group(GROUP_ID, "Group")
+        
+        for handler, text in (
+            (handlers.set_schedule, "/schedule 08:30 21:00"),
+            (handlers.set_timezone, "/timezone Asia/Kolkata"),
+            (handlers.manage_triggers, "/triggers add hello"),
+        ):
+            await handler(*command(text, chat_id=OTHER_GROUP_ID))
+            assert bot.replies[-1] == "🚫 This bot is not authorized to work in this group!"
+        assert await bot.db.get_group_settings(OTHER_GROUP_ID) == {}
+
+    asyncio.run(scenario())
+
+
+def test_timezone_without_settings_document(bot, monkeypatch):
+    async def scenario():
+        await connect(bot)
+        jobs = AsyncIOScheduler()
+        monkeypatch.setattr(scheduler, "scheduler", jobs)
+        
+        await handlers.set_timezone(*command("/timezone Asia/Kolkata"))
+        assert bot.replies[-1] == "🌍 Timezone set to *Asia/Kolkata*"
+        assert (await bot.db.get_group_settings(GROUP_ID))["timezone"] == "Asia/Kolkata"
+        # Survives the next reload from group_settings
+        await bot.db.refresh_group_cache()
+        assert await bot.db.get_group_timezone(GROUP_ID) == "Asia/Kolkata"
+        assert str(jobs.get_job(f"reminder_{GROUP_ID}").trigger.timezone) == "Asia/Kolkata"
+
+    asyncio.run(scenario())
+
+
+def test_triggers_without_settings_document(bot):
+    async def scenario():
+        await connect(bot)
+        
+        await handlers.manage_triggers(*command("/triggers add standup | See you there!"))
+        assert bot.replies[-1] == "✅ Trigger added: standup"
+        rules = await bot.db.get_group_triggers(GROUP_ID)
+        assert rules[-1] == {"type": "keyword", "pattern": "standup", "reply": "See you there!"}
+        assert len(rules) == len(DEFAULT_RULES) + 1
+        
+        await handlers.manage_triggers(*command(f"/triggers remove {len(rules)}"))
+        assert bot.replies[-1] == "🗑 Removed trigger: standup"
+        assert await bot.db.get_group_triggers(GROUP_ID) == DEFAULT_RULES
+        
+        await handlers.manage_triggers(*command("/triggers reset"))
+        assert await bot.db.get_group_triggers(GROUP_ID) is None
+
+    asyncio.run(scenario())
+
+
+def test_my_targets_pages_through_hot_and_archived_days(bot, monkeypatch):
+    async def scenario():
+        await connect(bot)
+        today = clock.today(DEFAULT_TIMEZONE)
+        cutoff = archive_cutoff()
+        # Ten recent days, then twelve days every third day before the
+        # cutoff, spread over several archive months
+        hot = [shift_day_key(today, -offset) for offset in range(10)]
+        cold = [shift_day_key(cutoff, -1 - 3 * offset) for offset in range(12)]
+        await bot.db.db.targets.insert_many([
+            {"group_id": GROUP_ID, "user_id": 1, "username": "admin", "day_key": day_key,
+             "target": f"day{day_key}", "completed": False, "date": date_from_day_key(day_key)}
+            for day_key in hot + cold
+        ])
+        assert await archive_batch(bot.db.db, GROUP_ID, cutoff) == len(cold)
+        
+        pages = []
+
+        async def show(_, text, reply_markup=None, **kwargs):
+            buttons = {button.text: button.callback_data for button in reply_markup.inline_keyboard[0]} \
+                if reply_markup else {}
+            pages.append(([int(day) for day in re.findall(r"day(\d{8})", text)], buttons))
+
+        async def answer(*args, **kwargs):
+            pass
+
+        def press(callback_data):
+            query = SimpleNamespace(
+                data=callback_data, from_user=SimpleNamespace(id=1),
+                message=SimpleNamespace(chat=SimpleNamespace(id=GROUP_ID)), answer=answer,
+            )
+            return handlers.my_targets_callback(SimpleNamespace(callback_query=query), None)
+
+        monkeypatch.setattr(handlers, "reply", show)
+        monkeypatch.setattr(handlers, "edit", show)
+        await handlers.my_targets(*command("/mytargets"))
+        while "⬅️ Older" in pages[-1][1]:
+            await press(pages[-1][1]["⬅️ Older"])
+        oldest_page = len(pages)
+        while "Newer ➡️" in pages[-1][1]:
+            await press(pages[-1][1]["Newer ➡️"])
+        
+        size = handlers.MYTARGETS_PAGE_SIZE
+        expected = sorted(hot + cold, reverse=True)
+        older = [days for days, _ in pages[:oldest_page]]
+        assert older == [expected[i:i + size] for i in range(0, len(expected), size)]
+        # Back up from the oldest page, a full page at a time
+        newer = [days for days, _ in pages[oldest_page:]]
+        rest = expected[:len(expected) - len(older[-1])]
+        assert newer == [rest[max(0, end - size):end] for end in range(len(rest), 0, -size)]
+        # Every day appears exactly once walking either way
+        for walk in (older, older[-1:] + newer):
+            days = [day for page in walk for day in page]
+            assert sorted(days, reverse=True) == expected
+        assert "Newer ➡️" not in pages[0][1] and "Newer ➡️" not in pages[-1][1]
+
+    asyncio.run(scenario())
@@ -0,0 +1,93 @@
+import asyncio
+from datetime import datetime, timezone
+
+from telegram import Chat, Message, Update, User
+
+from src.processor import KeyedUpdateProcessor, update_key
+
+_update_ids = iter(range(1, 10000))
+
+
+def make_update(chat_id: int, user_id: int) -> Update:
+    message = Message(
+        message_id=1,
+        date=datetime.now(timezone.utc),
+        chat=Chat(chat_id, Chat.SUPERGROUP),
+        from_user=User(user_id, "member", False),
+        text="/done",
+    )
+    return Update(next(_update_ids), message=message)
+
+
+def test_update_key():
+    assert update_key(make_update(-100, 7)) == (-100, 7)
+    assert update_key(object()) is None
+
+
+def test_same_user_updates_run_in_arrival_order():
+    async def scenario():
+        processor = KeyedUpdateProcessor(max_workers=4, max_pending=16)
+        events = []
+
+        async def handle(name, delay):
+            events.append(f"start {name}")
+            await asyncio.sleep(delay)
+            events.append(f"end {name}")
+
+        await asyncio.gather(
+            processor.process_update(make_update(-100, 1), handle("first", 0.02)),
+            processor.process_update(make_update(-100, 1), handle("second", 0)),
+        )
+        assert events == ["start first", "end first", "start second", "end second"]
+        # Locks are dropped once a key has nothing queued
+        assert processor._locks == {}
+
+    asyncio.run(scenario())
+
+
+def test_different_users_run_concurrently():
+    async def scenario():
+        processor = KeyedUpdateProcessor(max_workers=4, max_pending=16)
+        running = []
+        peak = []
+
+        async def handle():
+            running.append(1)
+            peak.append(len(running))
+            await asyncio.sleep(0.01)
+            running.pop()
+
+        await asyncio.gather(*(
+            processor.process_update(make_update(-100, user_id), handle()) for user_id in range(4)
+        ))
+        assert max(peak) == 4
+
+    asyncio.run(scenario())
+
+
+def test_queued_updates_do_not_hold_worker_slots():
+    async def scenario():
+        processor = KeyedUpdateProcessor(max_workers=2, max_pending=16)
+        release = asyncio.Event()
+        handled = []
+
+        async def blocked():
+            await release.wait()
+            handled.append("first")
+
+        async def record(name):
+            handled.append(name)
+
+        first = asyncio.ensure_future(processor.process_update(make_update(-100, 1), blocked()))
+        second = asyncio.ensure_future(processor.process_update(make_update(-100, 1), record("second")))
+        await asyncio.sleep(0)
+        # The second update of user 1 waits for its key, not for a worker,
+        # so the other slot is free for user 2 while user 1 is blocked
+        await asyncio.wait_for(processor.process_update(make_update(-100, 2), record("other")), 0.5)
+        assert handled == ["other"]
+        
+        release.set()
+        await asyncio.gather(first, second)
+        assert handled == ["other", "first", "second"]
+
+    asyncio.run(scenario())
@@ -0,0 +1,174 @@
+import asyncio
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+import pytest
+from telegram import Chat, Message, Update, User
+from telegram.error import RetryAfter
+
+from src import ratelimit
+from src.processor import KeyedUpdateProcessor
+from src.ratelimit import Cooldown, KeyedLimiter, OutgoingQueue, TokenBucket
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(ratelimit.time, "monotonic", fake)
+    return fake
+
+
+def make_update(chat_id: int, user_id: int) -> Update:
+    message = Message(
+        message_id=1,
+        date=datetime.now(timezone.utc),
+        chat=Chat(chat_id, Chat.SUPERGROUP),
+        from_user=User(user_id, "member", False),
+        text="/addtarget",
+    )
+    return Update(user_id, message=message)
+
+
+def test_token_bucket_allows_burst_then_refills(clock):
+    bucket = TokenBucket(rate=2, capacity=3)
+    assert [bucket.try_acquire() for _ in range(4)] == [True, True, True, False]
+    assert bucket.wait_time() == pytest.approx(0.5)
+    
+    clock.now += 0.5
+    assert bucket.try_acquire()
+    assert not bucket.try_acquire()
+
+
+def test_token_bucket_never_exceeds_capacity(clock):
+    bucket = TokenBucket(rate=10, capacity=2)
+    clock.now += 60
+    assert [bucket.try_acquire() for _ in range(3)] == [True, True, False]
+
+
+def test_keyed_limiter_isolates_keys(clock):
+    limiter = KeyedLimiter(rate=1, capacity=1)
+    assert limiter.allow("a")
+    assert not limiter.allow("a")
+    assert limiter.allow("b")
+
+
+def test_keyed_limiter_evicts_least_recently_used(clock):
+    limiter = KeyedLimiter(rate=1, capacity=1, max_keys=2)
+    limiter.allow("a")
+    limiter.allow("b")
+    limiter.bucket("a")
+    limiter.allow("c")
+    # "b" was evicted, so it starts with a full bucket again
+    assert limiter.allow("b")
+    assert not limiter.allow("c")
+
+
+def test_cooldown(clock):
+    cooldown = Cooldown(10)
+    assert cooldown.ready(1)
+    assert not cooldown.ready(1)
+    assert cooldown.ready(2)
+    clock.now += 10
+    assert cooldown.ready(1)
+
+
+def test_busy_chat_does_not_block_others():
+    async def scenario():
+        queue = OutgoingQueue(maxsize=100, workers=1)
+        queue.chat_limiter = KeyedLimiter(rate=1, capacity=1)
+        sent = []
+
+        def request(chat_id):
+            async def call():
+                sent.append(chat_id)
+                return chat_id
+            return call
+
+        busy = [asyncio.ensure_future(queue.send(1, request(1))) for _ in range(3)]
+        await asyncio.sleep(0)
+        others = [asyncio.ensure_future(queue.send(chat_id, request(chat_id))) for chat_id in (2, 3)]
+        
+        assert await asyncio.wait_for(asyncio.gather(*others), 0.5) == [2, 3]
+        # Only chat 1's first message fit in its bucket
+        assert sent == [1, 2, 3]
+        for task in busy:
+            task.cancel()
+        await queue.close(timeout=0)
+
+    asyncio.run(scenario())
+
+
+def test_messages_to_one_chat_keep_their_order():
+    async def scenario():
+        queue = OutgoingQueue(maxsize=100, workers=4)
+        sent = []
+
+        def request(index):
+            async def call():
+                await asyncio.sleep(0.001 * (5 - index))
+                sent.append(index)
+            return call
+
+        await asyncio.gather(*(queue.send(1, request(index)) for index in range(5)))
+        assert sent == [0, 1, 2, 3, 4]
+        await queue.close()
+
+    asyncio.run(scenario())
+
+
+def test_retries_after_flood_wait():
+    async def scenario():
+        queue = OutgoingQueue(maxsize=10, workers=1)
+        attempts = []
+
+        async def call():
+            attempts.append(1)
+            if len(attempts) == 1:
+                raise RetryAfter(0)
+            return "ok"
+
+        assert await queue.send(1, call) == "ok"
+        assert len(attempts) == 2
+        await queue.close()
+
+    asyncio.run(scenario())
+
+
+def test_busy_chat_does_not_delay_other_chats_handlers(monkeypatch):
+    async def scenario():
+        queue = OutgoingQueue(maxsize=100, workers=1)
+        queue.chat_limiter = KeyedLimiter(rate=1, capacity=1)
+        monkeypatch.setattr(ratelimit, "outgoing", queue)
+        processor = KeyedUpdateProcessor(max_workers=1, max_pending=16)
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        handled = {}
+
+        def make_message(chat_id):
+            async def reply_text(text, **kwargs):
+                return text
+            return SimpleNamespace(chat=SimpleNamespace(id=chat_id), reply_text=reply_text)
+
+        async def handle(chat_id, replies):
+            for index in range(replies):
+                await ratelimit.reply(make_message(chat_id), f"reply {index}")
+            handled[chat_id] = loop.time() - started
+
+        # Chat 1's three replies need two seconds of pacing to go out
+        await asyncio.gather(
+            processor.process_update(make_update(-100, 1), handle(-100, 3)),
+            processor.process_update(make_update(-200, 2), handle(-200, 1)),
+        )
+        assert handled[-100] < 0.5
+        assert handled[-200] < 0.5
+        await queue.close(timeout=0)
+
+    asyncio.run(scenario())
@@ -0,0 +1,56 @@
+from src.render import _length, escape, render_today, split_message
+
+
+def test_escape_markdown():
+    assert escape("snake_case *bold* `code` [link]") == r"snake\_case \*bold\* \`code\` \[link]"
+    assert escape(42) == "42"
+
+
+def test_length_counts_utf16_code_units():
+    assert _length("abc") == 3
+    assert _length("é") == 1
+    # Emoji outside the BMP take a surrogate pair
+    assert _length("🎯") == 2
+
+
+def test_short_text_is_one_chunk():
+    assert split_message("hello\nworld", limit=20) == ["hello\nworld"]
+
+
+def test_splits_between_lines():
+    text = "\n".join(["x" * 8] * 5)
+    chunks = split_message(text, limit=20)
+    assert chunks == ["x" * 8 + "\n" + "x" * 8] * 2 + ["x" * 8]
+    assert "\n".join(chunks) == text
+
+
+def test_chunks_respect_the_limit_in_utf16_units():
+    text = "\n".join("🎯" * 7 for _ in range(6))
+    chunks = split_message(text, limit=20)
+    assert all(_length(chunk) <= 20 for chunk in chunks)
+    assert "\n".join(chunks) == text
+
+
+def test_long_line_is_cut_without_splitting_surrogate_pairs():
+    line = "a" + "🎯" * 30
+    chunks = split_message(line, limit=11)
+    assert all(_length(chunk) <= 11 for chunk in chunks)
+    assert "".join(chunks) == line
+    # Every cut falls between whole characters
+    assert all(chunk.encode("utf-16-le").decode("utf-16-le") == chunk for chunk in chunks)
+
+
+def test_long_line_is_not_cut_after_an_escape():
+    line = "a" * 9 + "\\_" + "b" * 9
+    chunks = split_message(line, limit=10)
+    assert chunks[0] == "a" * 9
+    assert chunks[1].startswith("\\_")
+    assert "".join(chunks) == line
+
+
+def test_render_today_escapes_user_text():
+    text = render_today([
+        {"username": "a_b", "target": "ship *it*", "completed": False},
+    ])
+    assert r"@a\_b" in text
+    assert r"ship \*it\*" in text
@@ -0,0 +1,50 @@
+import asyncio
+from types import SimpleNamespace
+
+from src.stats import StatsEngine
+from src.write_queue import WriteBehindQueue
+
+
+class RecordingCollection:
+    """Counts round trips; every write reports one upserted document."""
+
+    def __init__(self):
+        self.bulk_writes = []
+        self.update_ones = 0
+
+    async def bulk_write(self, operations, ordered=True):
+        self.bulk_writes.append(len(operations))
+        return SimpleNamespace(matched_count=0, upserted_count=len(operations))
+
+    async def update_one(self, query, update, upsert=False):
+        self.update_ones += 1
+        return SimpleNamespace(matched_count=0, upserted_id="id")
+
+
+def test_rollup_updates_go_through_write_behind():
+    async def scenario():
+        collection = RecordingCollection()
+        writes = WriteBehindQueue(collection, max_batch=100, max_delay_ms=1)
+        stats = StatsEngine(SimpleNamespace(user_stats=collection), writes=writes)
+        
+        await asyncio.gather(
+            *(stats.record_target(-100, user_id, f"user{user_id}", 20240301) for user_id in range(50)),
+            *(stats.record_completion(-100, user_id, 20240301) for user_id in range(50)),
+        )
+        assert collection.update_ones == 0
+        # Each member's completion follows their target write in a later batch
+        assert collection.bulk_writes == [50, 50]
+
+    asyncio.run(scenario())
+
+
+def test_rollup_updates_without_write_behind():
+    async def scenario():
+        collection = RecordingCollection()
+        stats = StatsEngine(SimpleNamespace(user_stats=collection))
+        await stats.record_target(-100, 1, "user1", 20240301)
+        await stats.record_completion(-100, 1, 20240301)
+        assert collection.update_ones == 2
+        assert collection.bulk_writes == []
+
+    asyncio.run(scenario())
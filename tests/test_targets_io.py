@@ -0,0 +1,123 @@
+import asyncio
+import io
+import json
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+from pymongo.errors import BulkWriteError
+
+from src.targets_io import batched, export_targets, from_record, import_targets, to_record
+
+TARGETS = [
+    {"group_id": -100, "user_id": 1, "username": "ann", "day_key": 20240301, "target": "Write, \"quote\"\nnewline",
+     "completed": True, "created_at": datetime(2024, 3, 1, 8, 0), "completed_at": datetime(2024, 3, 1, 18, 30)},
+    {"group_id": -100, "user_id": 2, "username": None, "day_key": 20240301, "target": "Ünïcödé 🎯",
+     "completed": False, "created_at": datetime(2024, 3, 1, 9, 15), "completed_at": None},
+    {"group_id": -200, "user_id": 1, "username": "ann", "day_key": 20240302, "target": "other group",
+     "completed": False, "created_at": datetime(2024, 3, 2, 7, 0), "completed_at": None},
+]
+
+
+def make_db():
+    return AsyncMongoMockClient()["test"]
+
+
+async def stored(db, query=None):
+    docs = await db.targets.find(query or {}, {"_id": 0, "date": 0}).sort(
+        [("group_id", 1), ("user_id", 1), ("day_key", 1)]
+    ).to_list(None)
+    return docs
+
+
+def test_batched():
+    assert list(batched(range(5), 2)) == [[0, 1], [2, 3], [4]]
+    assert list(batched([], 2)) == []
+
+
+def test_record_round_trip():
+    record = to_record(TARGETS[0])
+    assert record["created_at"] == "2024-03-01T08:00:00"
+    doc = from_record(record)
+    assert doc["date"] == datetime(2024, 3, 1)
+    assert {key: doc[key] for key in TARGETS[0]} == TARGETS[0]
+
+
+def test_csv_strings_are_parsed():
+    doc = from_record({
+        "group_id": "-100", "user_id": "1", "username": "", "day_key": "20240301",
+        "target": "x", "completed": "True", "created_at": "", "completed_at": "",
+    })
+    assert doc["group_id"] == -100
+    assert doc["username"] is None
+    assert doc["completed"] is True
+    assert doc["created_at"] is None
+
+
+@pytest.mark.parametrize("fmt", ["ndjson", "csv"])
+def test_export_import_round_trip(fmt):
+    async def scenario():
+        source = make_db()
+        await source.targets.insert_many([dict(target) for target in TARGETS])
+
+        output = io.StringIO(newline="")
+        assert await export_targets(source, output, fmt) == 3
+
+        target = make_db()
+        assert await import_targets(target, io.StringIO(output.getvalue(), newline=""), fmt, batch_size=2) == 3
+        assert await stored(target) == await stored(source)
+
+        # Importing again upserts in place
+        await import_targets(target, io.StringIO(output.getvalue(), newline=""), fmt)
+        assert await target.targets.count_documents({}) == 3
+
+    asyncio.run(scenario())
+
+
+def test_export_one_group_with_archive():
+    async def scenario():
+        db = make_db()
+        await db.targets.insert_many([dict(target) for target in TARGETS])
+        await db.targets_archive.insert_one({
+            "group_id": -100, "user_id": 1, "month": 202401, "username": "ann",
+            "entries": {"20240105": {"target": "archived", "completed": True}},
+        })
+
+        output = io.StringIO()
+        assert await export_targets(db, output, "ndjson", group_id=-100, include_archive=True) == 3
+
+        target = make_db()
+        await import_targets(target, io.StringIO(output.getvalue()), "ndjson")
+        assert await target.targets.count_documents({"group_id": -200}) == 0
+        archived = await target.targets.find_one({"day_key": 20240105}, {"_id": 0})
+        assert archived["target"] == "archived"
+        assert archived["username"] == "ann"
+
+    asyncio.run(scenario())
+
+
+def test_failed_batch_is_raised():
+    class FailingFirstBatch:
+        def __init__(self, collection):
+            self.collection = collection
+            self.calls = 0
+
+        async def bulk_write(self, operations, **kwargs):
+            self.calls += 1
+            if self.calls == 1:
+                raise BulkWriteError({"writeErrors": [], "nInserted": 0})
+            return await self.collection.bulk_write(operations, **kwargs)
+
+    async def scenario():
+        # One batch at a time, so the failed one finishes long before the end
+        db = make_db()
+        targets = FailingFirstBatch(db.targets)
+        lines = "".join(json.dumps(to_record({**TARGETS[0], "day_key": 20240301 + i})) + "\n" for i in range(10))
+        with pytest.raises(BulkWriteError):
+            await import_targets(SimpleNamespace(targets=targets), io.StringIO(lines), "ndjson",
+                                 batch_size=2, concurrency=1)
+        # Reading stopped at the failure
+        assert targets.calls == 1
+
+    asyncio.run(scenario())
@@ -0,0 +1,76 @@
+import asyncio
+
+from src.triggers import DEFAULT_REPLY, CompiledTriggers, TriggerEngine
+
+
+def test_keywords_match_whole_words_only():
+    compiled = CompiledTriggers([{"pattern": "target"}, {"pattern": "todo"}])
+    assert compiled.match("What's your TARGET today?") == DEFAULT_REPLY
+    assert compiled.match("todo: ship it") == DEFAULT_REPLY
+    assert compiled.match("we got targeted") is None
+    assert compiled.match("mistake") is None
+
+
+def test_rules_keep_their_own_replies():
+    compiled = CompiledTriggers([
+        {"pattern": "standup", "reply": "Post it in the thread"},
+        {"type": "regex", "pattern": r"\bday\s+\d+\b", "reply": "Keep going!"},
+    ])
+    assert compiled.match("standup time") == "Post it in the thread"
+    assert compiled.match("Day 12 done") == "Keep going!"
+    assert compiled.match("nothing here") is None
+
+
+def test_invalid_regexes_are_skipped():
+    compiled = CompiledTriggers([
+        {"pattern": "goal"},
+        {"type": "regex", "pattern": "(unclosed", "reply": "x"},
+        {"type": "regex", "pattern": "(capturing)", "reply": "x"},
+        {"type": "regex", "pattern": "(?i)flags", "reply": "x"},
+    ])
+    assert compiled.skipped == ["(unclosed", "(capturing)", "(?i)flags"]
+    assert compiled.match("my goal") == DEFAULT_REPLY
+    assert compiled.match("flags") is None
+
+
+def test_combined_pattern_falls_back_to_the_rules_that_compile(monkeypatch):
+    # Pretend a rule slipped past validation and breaks the combined pattern
+    monkeypatch.setattr(CompiledTriggers, "_valid_regex", staticmethod(lambda pattern: True))
+    compiled = CompiledTriggers([
+        {"pattern": "goal"},
+        {"type": "regex", "pattern": "(?i)flags", "reply": "x"},
+        {"type": "regex", "pattern": "ba+r", "reply": "bar"},
+    ])
+    assert compiled.skipped == ["(?i)flags"]
+    assert compiled.match("goal") == DEFAULT_REPLY
+    assert compiled.match("baaar") == "bar"
+
+
+def test_no_rules_never_match():
+    compiled = CompiledTriggers([])
+    assert compiled.pattern is None
+    assert compiled.match("target") is None
+
+
+def test_engine_caches_until_invalidated():
+    async def scenario():
+        engine = TriggerEngine(ttl=60)
+        rules = {1: [{"pattern": "alpha", "reply": "a"}]}
+        loads = []
+
+        async def load_rules(group_id):
+            loads.append(group_id)
+            return rules.get(group_id)
+
+        assert await engine.match(1, "alpha", load_rules) == "a"
+        assert await engine.match(1, "alpha", load_rules) == "a"
+        # Groups without custom rules use the defaults
+        assert await engine.match(2, "my target", load_rules) == DEFAULT_REPLY
+        assert loads == [1, 2]
+        
+        rules[1] = [{"pattern": "beta", "reply": "b"}]
+        engine.invalidate(1)
+        assert await engine.match(1, "beta", load_rules) == "b"
+        assert loads == [1, 2, 1]
+
+    asyncio.run(scenario())
@@ -0,0 +1,67 @@
+import asyncio
+
+from mongomock_motor import AsyncMongoMockClient
+
+from src.write_queue import WriteBehindQueue
+
+
+def make_queue(**kwargs):
+    collection = AsyncMongoMockClient()["test"]["targets"]
+    return collection, WriteBehindQueue(collection, **kwargs)
+
+
+def test_writes_are_batched():
+    async def scenario():
+        collection, queue = make_queue(max_batch=10, max_delay_ms=1)
+        results = await asyncio.gather(*(
+            queue.submit(key, {"key": key}, {"$set": {"value": key}}, upsert=True) for key in range(25)
+        ))
+        assert results == [True] * 25
+        assert queue.batches == 3
+        assert queue.operations == 25
+        assert await collection.count_documents({}) == 25
+
+    asyncio.run(scenario())
+
+
+def test_same_key_writes_are_split_and_ordered():
+    async def scenario():
+        collection, queue = make_queue(max_batch=10, max_delay_ms=1)
+        await asyncio.gather(
+            queue.submit("a", {"key": "a"}, {"$set": {"value": 1}}, upsert=True),
+            queue.submit("b", {"key": "b"}, {"$set": {"value": 1}}, upsert=True),
+            queue.submit("a", {"key": "a"}, {"$set": {"value": 2}}, upsert=True),
+        )
+        # The second write to "a" waits for a batch of its own
+        assert queue.batches == 2
+        doc = await collection.find_one({"key": "a"})
+        assert doc["value"] == 2
+
+    asyncio.run(scenario())
+
+
+def test_unmatched_update_reports_failure():
+    async def scenario():
+        collection, queue = make_queue(max_batch=10, max_delay_ms=1)
+        await collection.insert_one({"key": "present"})
+        results = await asyncio.gather(
+            queue.submit("present", {"key": "present"}, {"$set": {"value": 1}}),
+            queue.submit("missing", {"key": "missing"}, {"$set": {"value": 1}}),
+            queue.submit("new", {"key": "new"}, {"$set": {"value": 1}}, upsert=True),
+        )
+        assert results == [True, False, True]
+        assert await collection.count_documents({"key": "missing"}) == 0
+
+    asyncio.run(scenario())
+
+
+def test_close_flushes_pending_writes():
+    async def scenario():
+        collection, queue = make_queue(max_batch=100, max_delay_ms=10000)
+        pending = asyncio.ensure_future(queue.submit(1, {"key": 1}, {"$set": {"value": 1}}, upsert=True))
+        await asyncio.sleep(0)
+        await queue.close()
+        assert await pending is True
+        assert await collection.count_documents({}) == 1
+
+    asyncio.run(scenario())